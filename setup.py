@@ -44,6 +44,7 @@ if __name__ == '__main__':
             'cometml': ['cometml'],
             'mongo': ['pymongo'],
             'orion': ['orion.core'],
+            'fast': ['orjson', 'msgpack'],
             'all': [
                 'orion.core',
                 'pymongo',
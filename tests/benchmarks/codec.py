@@ -0,0 +1,74 @@
+"""Compare the encode and decode throughput of the json codecs on trial documents
+
+    python -m tests.benchmarks.codec --trials 100 --steps 1000
+"""
+import argparse
+import random
+import time
+
+from track.persistence.codec import get_codec, _codecs
+from track.serialization import to_json
+from track.structure import Trial, Project, TrialGroup
+
+
+def make_document(trials, steps):
+    project = Project(name='benchmark')
+    group = TrialGroup(name='group', project_id=project.uid)
+    project.groups.add(group)
+
+    for i in range(trials):
+        trial = Trial(
+            parameters={'lr': random.random(), 'batch_size': 256, 'optimizer': 'sgd', 'seed': i},
+            project_id=project.uid,
+            group_id=group.uid,
+            tags={'worker': i % 8, 'host': f'node-{i % 4}'},
+            metadata={'_update_count': steps, 'gpu': 'V100'}
+        )
+        trial.metrics['loss'] = {s: random.random() for s in range(steps)}
+        trial.metrics['accuracy'] = [random.random() for _ in range(steps)]
+
+        project.trials.add(trial)
+        group.trials.add(trial.uid)
+
+    return {'generation': 1, 'epoch': 'benchmark', 'projects': [to_json(project)]}
+
+
+def measure(fun, repeat):
+    best = float('inf')
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fun()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trials', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    document = make_document(args.trials, args.steps)
+
+    print(f'{"codec":>8} {"size (MB)":>10} {"encode (MB/s)":>14} {"decode (MB/s)":>14}')
+    for name in _codecs:
+        codec = get_codec(name)
+
+        # codec was not installed
+        if codec.name != name:
+            continue
+
+        data = codec.dumps(document)
+        size = len(data) / 1024 / 1024
+
+        encode = measure(lambda: codec.dumps(document), args.repeat)
+        decode = measure(lambda: codec.loads(data), args.repeat)
+
+        print(f'{name:>8} {size:10.2f} {size / encode:14.2f} {size / decode:14.2f}')
+
+
+if __name__ == '__main__':
+    main()
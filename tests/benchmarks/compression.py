@@ -0,0 +1,64 @@
+"""Compare the bandwidth and the cpu time of the frame compressions on the replies of `get_trial`
+
+    python -m tests.benchmarks.compression --steps 1000 10000 --bandwidth 100 1000
+
+The total time is the time to compress, send the frame at `bandwidth` Mbit/s and decompress it.
+"""
+import argparse
+import random
+
+from track.persistence.codec import get_codec
+from track.persistence.framing import Compression, decompress
+from track.serialization import to_json
+from track.structure import Trial
+from tests.benchmarks.codec import measure
+
+
+def make_reply(steps):
+    trial = Trial(
+        parameters={'lr': random.random(), 'batch_size': 256, 'optimizer': 'sgd'},
+        tags={'worker': 1, 'host': 'node-1'},
+        metadata={'_update_count': steps, 'gpu': 'V100'}
+    )
+    trial.metrics['loss'] = {s: random.random() for s in range(steps)}
+    trial.metrics['accuracy'] = {s: random.random() for s in range(steps)}
+    trial.metrics['epoch_time'] = [random.random() for _ in range(steps // 100)]
+
+    return get_codec().dumps({'status': 0, 'return': [to_json(trial)], '__id__': 1})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--steps', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--bandwidth', type=float, nargs='+', default=[100, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    compressions = [(None, None), ('zlib', 1), ('zlib', 6), ('zlib', 9), ('lzma', 0), ('lzma', 6)]
+    times = ''.join(f' {f"{bandwidth:g} Mbit/s (ms)":>18}' for bandwidth in args.bandwidth)
+
+    for steps in args.steps:
+        payload = make_reply(steps)
+        print(f'steps: {steps} reply: {len(payload) / 1024:.1f} KiB')
+        print(f'{"compression":>12} {"ratio":>6} {"compress (ms)":>14} {"decompress (ms)":>16}{times}')
+
+        for name, level in compressions:
+            compression = Compression(name, threshold=0, level=level)
+            data, flags = compression.compress(payload)
+
+            compress_time = measure(lambda: compression.compress(payload), args.repeat) * 1000
+            decompress_time = measure(lambda: decompress(flags, data), args.repeat) * 1000
+
+            totals = ''
+            for bandwidth in args.bandwidth:
+                transfer = len(data) * 8 / (bandwidth * 1e6) * 1000
+                totals += f' {compress_time + transfer + decompress_time:18.2f}'
+
+            label = f'{name}-{level}' if name else 'none'
+            print(f'{label:>12} {len(payload) / len(data):6.2f} {compress_time:14.2f} {decompress_time:16.2f}{totals}')
+
+        print()
+
+
+if __name__ == '__main__':
+    main()
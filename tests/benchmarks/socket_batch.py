@@ -0,0 +1,74 @@
+"""Compare the throughput of logging calls sent to a track server for different batch sizes
+
+    python -m tests.benchmarks.socket_batch --calls 2000 --batch 1 8 64 256
+"""
+import argparse
+import os
+import socket
+import time
+from multiprocessing import Process
+
+from track.persistence.socketed import start_track_server, SocketClient
+from track.structure import Trial, Project
+
+
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def start_server(backend):
+    port = free_port()
+    server = Process(target=start_track_server, args=(backend, 'localhost', port, None))
+    server.start()
+
+    for _ in range(100):
+        try:
+            socket.create_connection(('localhost', port)).close()
+            break
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+
+    return server, port
+
+
+def measure(port, batch, calls):
+    client = SocketClient(f'socket://localhost:{port}?batch={batch}')
+    project = client.new_project(Project(name=f'benchmark_{batch}'))
+    trial = client.new_trial(Trial(parameters={'batch': batch}, project_id=project.uid))
+
+    start = time.perf_counter()
+    for step in range(calls):
+        client.log_trial_metrics(trial, step=step, loss=1 / (step + 1))
+
+    client.flush()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 8, 64, 256])
+    parser.add_argument('--file', type=str, default='benchmark_socket.json')
+    args = parser.parse_args()
+
+    server, port = start_server(f'file://{args.file}')
+
+    try:
+        print(f'{"batch":>6} {"time (s)":>10} {"calls/s":>10}')
+        for batch in args.batch:
+            elapsed = measure(port, batch, args.calls)
+            print(f'{batch:>6} {elapsed:10.2f} {args.calls / elapsed:10.0f}')
+    finally:
+        server.terminate()
+
+        for file in (args.file, f'{args.file}.lock'):
+            if os.path.exists(file):
+                os.remove(file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Compare the size and the encode and decode time of the message formats on `log_trial_metrics` calls
+
+    python -m tests.benchmarks.wire --calls 10000
+"""
+import argparse
+import random
+import time
+
+from track.persistence.wire import make_wire, offered_formats
+
+
+def make_calls(calls):
+    return [{
+        '__rpc__': 'log_trial_metrics',
+        'trial': 'b3a0f5c1e7d24a2b9c8e1f0a6d3b7c5e_0',
+        'step': step,
+        'loss': random.random(),
+        'accuracy': random.random()
+    } for step in range(calls)]
+
+
+def measure(fun, repeat):
+    best = float('inf')
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fun()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    calls = make_calls(args.calls)
+
+    print(f'{"format":>8} {"bytes/call":>11} {"encode (us/call)":>17} {"decode (us/call)":>17}')
+    for name in offered_formats():
+        # the strings are only sent once per connection, measure the messages that follow
+        wire = make_wire(name)
+        wire.loads(wire.dumps(dict(calls[0])))
+        messages = [wire.dumps(dict(call)) for call in calls]
+        size = sum(len(message) for message in messages) / len(messages)
+
+        def encode():
+            for call in calls:
+                wire.dumps(call)
+
+        def decode():
+            for message in messages:
+                wire.loads(message)
+
+        encode_time = measure(encode, args.repeat) / args.calls * 1e6
+        decode_time = measure(decode, args.repeat) / args.calls * 1e6
+
+        print(f'{name:>8} {size:11.1f} {encode_time:17.2f} {decode_time:17.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import json
+import math
+
+from track.persistence.codec import get_codec, _codecs
+
+
+def available_codecs():
+    return [get_codec(name) for name in _codecs if get_codec(name).name == name]
+
+
+def test_codec_roundtrip():
+    document = {'generation': 2, 'metrics': {1: 0.5, 2: 0.25}, 'tags': ['a', 'é'], 'status': None}
+
+    for codec in available_codecs():
+        data = codec.dumps(document)
+        assert isinstance(data, bytes)
+
+        # output is standard json readable by the standard library, steps become strings
+        assert json.loads(data) == codec.loads(data)
+        assert codec.loads(data)['metrics'] == {'1': 0.5, '2': 0.25}
+        assert codec.loads(codec.dumps(document, pretty=True)) == codec.loads(data)
+
+
+def test_codec_reads_standard_library_files():
+    data = json.dumps({'generation': 1, 'loss': [1.0, float('nan')]}, indent=2).encode('utf8')
+
+    for codec in available_codecs():
+        loaded = codec.loads(data)
+        assert loaded['generation'] == 1
+        assert math.isnan(loaded['loss'][1])
+
+
+def test_codec_keeps_non_finite_and_large_values():
+    document = {'loss': {'1': float('nan'), '2': float('inf')}, 'min': float('-inf'), 'count': 2 ** 70, 'name': None}
+
+    for codec in available_codecs():
+        loaded = json.loads(codec.dumps(document))
+
+        assert math.isnan(loaded['loss']['1'])
+        assert loaded['loss']['2'] == float('inf')
+        assert loaded['min'] == float('-inf')
+        assert loaded['count'] == 2 ** 70
+        assert loaded['name'] is None
+
+
+if __name__ == '__main__':
+    test_codec_roundtrip()
+    test_codec_reads_standard_library_files()
+    test_codec_keeps_non_finite_and_large_values()
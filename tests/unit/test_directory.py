@@ -0,0 +1,105 @@
+import os
+import shutil
+
+from filelock import FileLock
+
+from track.persistence import get_protocol
+from track.persistence.directory import load_directory
+from track.persistence.storage import load_database
+from track.structure import Trial, TrialGroup, Project, Status
+
+
+def remove(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+    for file in (f'{path}.lock', f'{path}.json'):
+        try:
+            os.remove(file)
+        except:
+            pass
+
+
+def make_storage(uri, count=2):
+    proto = get_protocol(uri)
+
+    project = proto.new_project(Project(name='directory'))
+    group = proto.new_trial_group(TrialGroup(name='group', project_id=project.uid))
+
+    trials = []
+    for i in range(count):
+        trials.append(proto.new_trial(Trial(parameters={'a': i}, project_id=project.uid, group_id=group.uid)))
+
+    return proto, trials
+
+
+def test_directory_layout(path='test_directory'):
+    remove(path)
+    proto, (trial, other) = make_storage(f'file-dir://{path}/')
+
+    manifest = os.stat(f'{path}/manifest.json').st_mtime_ns
+    other_file = proto.storage.object_path(other.uid)
+    other_mtime = os.stat(other_file).st_mtime_ns
+
+    for i in range(5):
+        proto.log_trial_metrics(trial, step=i, loss=i)
+    proto.set_trial_status(trial, Status.Completed)
+
+    # only the file of the trial was rewritten
+    assert os.stat(f'{path}/manifest.json').st_mtime_ns == manifest
+    assert os.stat(other_file).st_mtime_ns == other_mtime
+
+    storage = load_directory(path)
+    loaded = storage.objects[trial.uid]
+    assert len(loaded.metrics['loss']) == 5
+    assert loaded.status == Status.Completed
+
+    project = storage.objects['directory']
+    assert len(project.trials) == 2
+    assert len(project.groups) == 1
+    assert len(storage.objects[trial.group_id].trials) == 2
+    remove(path)
+
+
+def test_directory_reader_sees_updates(path='test_directory'):
+    remove(path)
+    proto, (trial, _) = make_storage(f'file-dir://{path}/')
+    other = get_protocol(f'file-dir://{path}/')
+    reloaded = []
+    assert proto.watch(reloaded.append)
+
+    other.log_trial_metadata(trial, count=1)
+    assert proto.get_trial(trial)[0].metadata['count'] == 1
+    assert reloaded == [trial.uid]
+
+    proto.new_trial(Trial(parameters={'a': 10}, project_id=trial.project_id, group_id=trial.group_id))
+    assert len(other.fetch_trials({'group_id': trial.group_id})) == 3
+    remove(path)
+
+
+def test_directory_trials_do_not_contend(path='test_directory'):
+    remove(path)
+    proto, (trial, other) = make_storage(f'file-dir://{path}/')
+
+    # another process holds the directory lock and the lock of the first trial
+    with FileLock(f'{path}.lock'), FileLock(f'{proto.storage.object_path(trial.uid)}.lock'):
+        proto.log_trial_metadata(other, count=1)
+
+    assert load_directory(path).objects[other.uid].metadata['count'] == 1
+    remove(path)
+
+
+def test_directory_export(path='test_directory'):
+    remove(path)
+    proto, (trial, _) = make_storage(f'file-dir://{path}/')
+    proto.log_trial_metadata(trial, count=1)
+
+    proto.commit(file_name_override=f'{path}.json')
+    assert load_database(f'{path}.json').objects[trial.uid].metadata['count'] == 1
+    remove(path)
+
+
+if __name__ == '__main__':
+    test_directory_layout()
+    test_directory_reader_sees_updates()
+    test_directory_trials_do_not_contend()
+    test_directory_export()
@@ -0,0 +1,93 @@
+import socket
+from threading import Thread
+
+import pytest
+
+from track.persistence.framing import FrameReader, FrameError, write_frame, pack_header, FRAME_HEADER
+from track.persistence.framing import Compression, FLAG_ZLIB, FLAG_LZMA
+
+
+def test_frame_reader():
+    left, right = socket.socketpair()
+    messages = [b'small', b'x' * (1024 * 1024), b'', b'after']
+
+    # large frames do not fit in the socket buffer, write them from another thread
+    # flags are read as is, the lower bits are used by the format and the compression
+    writer = Thread(target=lambda: [write_frame(left, m, flags=i << 4) for i, m in enumerate(messages)])
+    writer.start()
+
+    reader = FrameReader(right)
+    for i, message in enumerate(messages):
+        flags, payload = reader.read()
+        assert flags == i << 4
+        assert payload == message
+
+    writer.join()
+    left.close()
+
+    with pytest.raises(ConnectionError):
+        reader.read()
+
+    right.close()
+
+
+def test_frame_limits():
+    left, right = socket.socketpair()
+
+    with pytest.raises(FrameError):
+        write_frame(left, b'x' * 32, max_size=16)
+
+    # frame from an unknown version
+    left.sendall(FRAME_HEADER.pack(0, 0, 4) + b'data')
+    with pytest.raises(FrameError):
+        FrameReader(right).read()
+
+    left.sendall(pack_header(32) + b'x' * 32)
+    with pytest.raises(FrameError):
+        FrameReader(right, max_size=16).read()
+
+    left.close()
+    right.close()
+
+
+def test_frame_compression():
+    left, right = socket.socketpair()
+    large = b'{"loss": 0.125}' * 4096
+    reader = FrameReader(right)
+
+    def send_all():
+        for name in ('zlib', 'lzma'):
+            compression = Compression(name, threshold=1024)
+            write_frame(left, b'small', compression=compression)
+            write_frame(left, large, flags=1, compression=compression)
+
+    writer = Thread(target=send_all)
+    writer.start()
+
+    for flag in (FLAG_ZLIB, FLAG_LZMA):
+        # small payloads are not compressed
+        assert reader.read() == (0, b'small')
+
+        flags, payload = reader.read()
+        assert flags == 1 | flag
+        assert payload == large
+
+    writer.join()
+
+    # the decompressed size is limited like the frame size
+    with pytest.raises(FrameError):
+        write_frame(left, large, max_size=1024, compression=Compression('zlib', threshold=16))
+
+    compressed, flags = Compression('zlib', threshold=16).compress(large)
+    left.sendall(pack_header(len(compressed), flags) + compressed)
+    with pytest.raises(FrameError):
+        FrameReader(right, max_size=1024).read()
+
+    left.close()
+    right.close()
+
+
+if __name__ == '__main__':
+    test_frame_reader()
+    test_frame_limits()
+    test_frame_compression()
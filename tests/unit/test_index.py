@@ -0,0 +1,107 @@
+import os
+
+from track.persistence import get_protocol
+from track.persistence.index import StorageIndex
+from track.persistence.local import execute_query
+from track.persistence.storage import load_database
+from track.structure import Trial, TrialGroup, Project, Status, CustomStatus
+
+
+def remove(filename):
+    for file in (filename, f'{filename}.lock', f'{filename}.journal'):
+        try:
+            os.remove(file)
+        except:
+            pass
+
+
+def make_trials():
+    statuses = [Status.CreatedGroup, Status.Running, CustomStatus('new', 0), CustomStatus('interrupted', 1)]
+
+    return [
+        Trial(
+            parameters={'a': i},
+            group_id=f'group_{i % 3}',
+            status=statuses[i % 4],
+            tags={'worker': i % 5, 'list': [i]}
+        ) for i in range(40)
+    ]
+
+
+def check_lookup(index, trials, query):
+    expected = set(t.uid for t in trials if execute_query(t, query))
+    candidates = index.lookup(query)
+
+    # the index can return more trials but never less
+    assert candidates is not None
+    assert expected.issubset(candidates)
+    return expected, candidates
+
+
+def test_index_lookup():
+    trials = make_trials()
+    index = StorageIndex(['tags.worker'])
+
+    for trial in trials:
+        index.insert(trial)
+
+    expected, candidates = check_lookup(index, trials, {'group_id': 'group_1'})
+    assert expected == candidates
+
+    check_lookup(index, trials, {'group_id': 'group_1', 'status': Status.Running})
+    check_lookup(index, trials, {'status': {'$in': ['new', 'interrupted']}})
+    check_lookup(index, trials, {'status': {'$in': [Status.CreatedGroup]}})
+    check_lookup(index, trials, {'tags.worker': {'$in': ['1', '2']}})
+    check_lookup(index, trials, [('tags.worker', 3), ('group_id', 'group_2')])
+
+    # terms that are not indexed cannot be used
+    assert index.lookup({'tags.list': [1]}) is None
+    assert index.lookup({'parameters.a': {'$gt': 1}}) is None
+
+
+def test_index_update():
+    trials = make_trials()
+    index = StorageIndex()
+
+    for trial in trials:
+        index.insert(trial)
+
+    trial = trials[0]
+    trial.status = Status.Completed
+    index.update(trial)
+
+    assert index.lookup({'status': Status.Completed}) == {trial.uid}
+    assert trial.uid not in index.lookup({'status': Status.CreatedGroup})
+
+
+def test_protocol_uses_index(file='test_index.json'):
+    remove(file)
+    proto = get_protocol(f'file://{file}?index=tags.worker')
+
+    project = proto.new_project(Project(name='index'))
+    group = proto.new_trial_group(TrialGroup(name='group', project_id=project.uid))
+
+    trials = []
+    for i in range(10):
+        trial = proto.new_trial(Trial(parameters={'a': i}, project_id=project.uid, group_id=group.uid))
+        proto.add_trial_tags(trial, worker=i % 2)
+        trials.append(trial)
+
+    proto.set_trial_status(trials[0], Status.Completed)
+    proto.new_trial(Trial(parameters={'a': 0}, project_id=project.uid, group_id=group.uid), auto_increment=True)
+
+    assert len(proto.fetch_trials({'group_id': group.uid, 'tags.worker': 1})) == 5
+    assert len(proto.fetch_trials({'status': Status.Completed})) == 1
+    assert len(proto.fetch_trials({'uid': group.uid})) == 0
+    assert len(proto.get_trial(trials[0])) == 2
+
+    # index is rebuilt when loading the file
+    storage = load_database(file, ['tags.worker'])
+    assert len(storage.index.lookup({'tags.worker': 0})) == 5
+    remove(file)
+
+
+if __name__ == '__main__':
+    test_index_lookup()
+    test_index_update()
+    test_protocol_uses_index()
@@ -0,0 +1,111 @@
+import os
+
+from track.persistence import get_protocol
+from track.persistence.storage import load_database
+from track.structure import Trial, TrialGroup, Project, Status
+
+
+def remove(filename):
+    for file in (filename, f'{filename}.lock', f'{filename}.journal'):
+        try:
+            os.remove(file)
+        except:
+            pass
+
+
+def make_journaled_storage(file='test_journal.json'):
+    remove(file)
+    proto = get_protocol(f'file://{file}?journal=true')
+
+    project = proto.new_project(Project(name='journal'))
+    group = proto.new_trial_group(TrialGroup(name='group', project_id=project.uid))
+    trial = proto.new_trial(Trial(parameters={'a': 1}, project_id=project.uid, group_id=group.uid))
+    return proto, trial
+
+
+def test_journal_appends(file='test_journal.json'):
+    proto, trial = make_journaled_storage(file)
+
+    snapshot_size = os.path.getsize(file)
+    journal_size = os.path.getsize(f'{file}.journal')
+
+    for i in range(10):
+        proto.log_trial_metrics(trial, step=i, loss=i * 2)
+
+    # the snapshot is not rewritten only the journal grows
+    assert os.path.getsize(file) == snapshot_size
+    assert os.path.getsize(f'{file}.journal') > journal_size
+    remove(file)
+
+
+def test_journal_replay(file='test_journal.json'):
+    proto, trial = make_journaled_storage(file)
+
+    proto.log_trial_metrics(trial, step=1, loss=2)
+    proto.log_trial_metrics(trial, step=2, loss=1)
+    proto.log_trial_metrics(trial, accuracy=0.5)
+    proto.log_trial_metadata(trial, worker=2)
+    proto.set_trial_status(trial, Status.Completed)
+
+    storage = load_database(file)
+    replayed = storage.objects[trial.uid]
+
+    assert replayed.metrics['loss'] == {1: 2, 2: 1}
+    assert replayed.metrics['accuracy'] == [0.5]
+    assert replayed.metadata['worker'] == 2
+    assert replayed.status == Status.Completed
+    assert replayed.metadata['_update_count'] == proto.storage.objects[trial.uid].metadata['_update_count']
+    remove(file)
+
+
+def test_journal_reader_catches_up(file='test_journal.json'):
+    writer, trial = make_journaled_storage(file)
+    reader = get_protocol(f'file://{file}?journal=true')
+
+    writer.log_trial_metadata(trial, count=1)
+    assert reader.get_trial(trial)[0].metadata['count'] == 1
+
+    writer.log_trial_metadata(trial, count=2)
+    assert reader.get_trial(trial)[0].metadata['count'] == 2
+    remove(file)
+
+
+def test_journal_compaction(file='test_journal.json'):
+    proto, trial = make_journaled_storage(file)
+    reader = get_protocol(f'file://{file}?journal=true')
+
+    for i in range(10):
+        proto.log_trial_metrics(trial, step=i, loss=i)
+
+    proto.compact()
+    assert os.path.getsize(f'{file}.journal') < 100
+
+    # reader notices the compaction and reloads the snapshot
+    assert len(reader.get_trial(trial)[0].metrics['loss']) == 10
+
+    # writing after compaction keeps working
+    proto.log_trial_metrics(trial, step=10, loss=10)
+    assert len(load_database(file).objects[trial.uid].metrics['loss']) == 11
+    remove(file)
+
+
+def test_journal_non_journaled_writer(file='test_journal.json'):
+    proto, trial = make_journaled_storage(file)
+    proto.log_trial_metadata(trial, count=1)
+
+    # a regular writer merges the journal inside the snapshot
+    regular = get_protocol(f'file://{file}')
+    regular.log_trial_metadata(trial, other=1)
+
+    trial = load_database(file).objects[trial.uid]
+    assert trial.metadata['count'] == 1
+    assert trial.metadata['other'] == 1
+    remove(file)
+
+
+if __name__ == '__main__':
+    test_journal_appends()
+    test_journal_replay()
+    test_journal_reader_catches_up()
+    test_journal_compaction()
+    test_journal_non_journaled_writer()
@@ -0,0 +1,89 @@
+import os
+
+from track.persistence import get_protocol
+from track.persistence.storage import load_database
+from track.structure import Trial, TrialGroup, Project, Status
+
+
+def remove(filename):
+    for file in (filename, f'{filename}.lock', f'{filename}.journal'):
+        try:
+            os.remove(file)
+        except:
+            pass
+
+
+def make_storage(uri, count=10):
+    proto = get_protocol(uri)
+
+    project = proto.new_project(Project(name='lazy'))
+    group = proto.new_trial_group(TrialGroup(name='group', project_id=project.uid))
+
+    trials = []
+    for i in range(count):
+        trial = proto.new_trial(Trial(parameters={'a': i}, project_id=project.uid, group_id=group.uid))
+        proto.log_trial_metrics(trial, step=1, loss=i)
+        trials.append(trial)
+
+    proto.set_trial_status(trials[0], Status.Completed)
+    return proto, trials
+
+
+def test_lazy_load(file='test_lazy.json'):
+    remove(file)
+    _, trials = make_storage(f'file://{file}')
+
+    storage = load_database(file, lazy=True)
+    assert not any(storage.objects.is_loaded(t.uid) for t in trials)
+
+    # indexes are built without building the trials
+    assert storage.index.lookup({'status': Status.Completed}) == {trials[0].uid}
+    assert not storage.objects.is_loaded(trials[0].uid)
+
+    trial = storage.objects[trials[1].uid]
+    assert isinstance(trial, Trial)
+    assert trial.parameters['a'] == 1
+    assert storage.objects.is_loaded(trials[1].uid)
+    assert not storage.objects.is_loaded(trials[2].uid)
+
+    # the project holds the trial once it is built
+    project = storage.objects['lazy']
+    assert trial in project.trials
+    assert len(project.trials) == len(trials)
+    remove(file)
+
+
+def test_lazy_protocol(file='test_lazy.json'):
+    remove(file)
+    make_storage(f'file://{file}')
+
+    proto = get_protocol(f'file://{file}?lazy=true')
+    trial = proto.fetch_trials({'status': Status.Completed})[0]
+    proto.log_trial_metadata(trial, worker=1)
+
+    # trials that were not accessed are saved as is
+    storage = load_database(file)
+    assert len(storage.trials) == 10
+    assert storage.objects[trial.uid].metadata['worker'] == 1
+    assert all(len(t.metrics['loss']) == 1 for t in storage.objects['lazy'].trials)
+    remove(file)
+
+
+def test_lazy_journal(file='test_lazy.json'):
+    remove(file)
+    proto, trials = make_storage(f'file://{file}?journal=true')
+    proto.compact()
+    proto.log_trial_metadata(trials[3], worker=3)
+
+    # only the trials referenced by the journal are built
+
+    storage = load_database(file, lazy=True)
+    assert storage.objects[trials[3].uid].metadata['worker'] == 3
+    assert not storage.objects.is_loaded(trials[4].uid)
+    remove(file)
+
+
+if __name__ == '__main__':
+    test_lazy_load()
+    test_lazy_protocol()
+    test_lazy_journal()
@@ -0,0 +1,104 @@
+import os
+
+from track.persistence import get_protocol
+from track.persistence.storage import load_database, read_generation
+from track.structure import Trial, TrialGroup, Project
+
+
+def remove(filename):
+    for file in (filename, f'{filename}.lock', f'{filename}.journal'):
+        try:
+            os.remove(file)
+        except:
+            pass
+
+
+def make_storage(uri, trials=10):
+    proto = get_protocol(uri)
+
+    project = proto.new_project(Project(name='ndjson'))
+    group = proto.new_trial_group(TrialGroup(name='group', project_id=project.uid))
+
+    for i in range(trials):
+        trial = proto.new_trial(Trial(name=f'trial_{i}', parameters={'a': i}, project_id=project.uid))
+        proto.add_group_trial(group, trial)
+        proto.log_trial_metrics(trial, step=1, loss=i)
+        proto.add_trial_tags(trial, worker=i % 2)
+
+    return proto, project, group
+
+
+def check_storage(storage, trials=10):
+    project = storage.objects[storage._project_names['ndjson']]
+    assert len(project.trials) == trials
+    assert len(project.groups) == 1
+    assert len(list(project.groups)[0].trials) == 10
+
+    trial = [t for t in project.trials if t.parameters == {'a': 3}][0]
+    assert trial.name == 'trial_3'
+    assert trial.tags['worker'] == 1
+
+
+def test_ndjson_roundtrip(file='test_ndjson.json'):
+    remove(file)
+    make_storage(f'file://{file}?format=ndjson')
+
+    with open(file, 'r') as f:
+        lines = f.readlines()
+
+    # header, project and one line per trial
+    assert len(lines) == 12
+
+    storage = load_database(file)
+    assert storage.file_format == 'ndjson'
+    check_storage(storage)
+
+    storage = load_database(file, lazy=True)
+    check_storage(storage)
+    remove(file)
+
+
+def test_ndjson_format_is_detected(file='test_ndjson_detect.json'):
+    remove(file)
+    proto, project, group = make_storage(f'file://{file}?format=ndjson')
+    generation = read_generation(file)
+
+    # a writer without the option keeps the format of the file
+    writer = get_protocol(f'file://{file}')
+    writer.new_trial(Trial(name='trial_10', parameters={'a': 10}, project_id=project.uid))
+
+    storage = load_database(file)
+    assert storage.file_format == 'ndjson'
+    assert read_generation(file) == generation + 1
+    check_storage(storage, trials=11)
+
+    # the format can be changed back
+    get_protocol(f'file://{file}?format=json').new_trial(
+        Trial(name='trial_11', parameters={'a': 11}, project_id=project.uid))
+
+    storage = load_database(file)
+    assert storage.file_format == 'json'
+    check_storage(storage, trials=12)
+    remove(file)
+
+
+def test_ndjson_journal(file='test_ndjson_journal.json'):
+    remove(file)
+    proto, _, _ = make_storage(f'file://{file}?format=ndjson&journal=true')
+
+    storage = load_database(file)
+    check_storage(storage)
+
+    proto.compact()
+    assert not os.path.exists(f'{file}.journal') or os.path.getsize(f'{file}.journal') < 1024
+
+    storage = load_database(file)
+    assert storage.file_format == 'ndjson'
+    check_storage(storage)
+    remove(file)
+
+
+if __name__ == '__main__':
+    test_ndjson_roundtrip()
+    test_ndjson_format_is_detected()
+    test_ndjson_journal()
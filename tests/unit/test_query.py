@@ -1,4 +1,5 @@
 from track.persistence.local import execute_query
+from track.persistence.query import compile_query
 from track.structure import Trial, Status, CustomStatus
 
 
@@ -71,7 +72,45 @@ def test_execute_query_custom_status():
     assert len(arr) == 40
 
 
+def test_compiled_query_operators():
+    data = [
+        Trial(name=str(i), parameters={'lr': i / 10}, tags={'worker': i % 3} if i % 2 else {}) for i in range(0, 20)
+    ]
+
+    assert len(check_query(data, {'parameters.lr': {'$gte': 1.0}})) == 10
+    assert len(check_query(data, {'parameters.lr': {'$lt': 0.5}})) == 5
+    assert len(check_query(data, {'parameters.lr': {'$gt': 0.5, '$lt': 0.9}})) == 3
+    assert len(check_query(data, {'tags.worker': {'$exists': True}})) == 10
+    assert len(check_query(data, {'name': {'$regex': '^1'}})) == 11
+    assert len(check_query(data, {'name': {'$nin': ['0', '1']}})) == 18
+    assert len(check_query(data, {'$or': [{'name': '0'}, {'name': '1'}]})) == 2
+    assert len(check_query(data, {'$and': [{'name': {'$regex': '^1'}}, {'parameters.lr': {'$lt': 1.2}}]})) == 3
+
+
+def test_compiled_query_plan():
+    data = [
+        Trial(name=str(i), group_id=i % 4) for i in range(0, 20)
+    ]
+
+    query = compile_query({'name': {'$ne': '3'}, 'group_id': 1}, limit=2)
+
+    # the equality is more selective than the inequality it is checked first
+    terms = query.explain()['terms']
+    assert [t['operator'] for t in terms] == ['$eq', '$ne']
+
+    # list queries keep the user order
+    ordered = compile_query([('name', {'$ne': '3'}), ('group_id', 1)])
+    assert [t['operator'] for t in ordered.explain()['terms']] == ['$ne', '$eq']
+
+    selected = query.filter(data)
+    assert len(selected) == 2
+    assert query.explain()['matched'] == 2
+    assert query.explain()['checked'] < len(data)
+
+
 if __name__ == '__main__':
     test_execute_query_custom_status()
+    test_compiled_query_operators()
+    test_compiled_query_plan()
 
 
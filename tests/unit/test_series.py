@@ -0,0 +1,123 @@
+import os
+import json
+import shutil
+
+import pytest
+
+from track.persistence import get_protocol
+from track.persistence.series import SidecarSeries
+from track.persistence.storage import load_database
+from track.serialization import to_json
+from track.structure import Trial, TrialGroup, Project
+
+
+def remove(filename):
+    for file in (filename, f'{filename}.lock', f'{filename}.journal'):
+        try:
+            os.remove(file)
+        except:
+            pass
+
+    shutil.rmtree(f'{filename}.series', ignore_errors=True)
+
+
+def make_storage(uri):
+    proto = get_protocol(uri)
+
+    project = proto.new_project(Project(name='series'))
+    group = proto.new_trial_group(TrialGroup(name='group', project_id=project.uid))
+    trial = proto.new_trial(Trial(parameters={'a': 1}, project_id=project.uid, group_id=group.uid))
+    return proto, trial
+
+
+def test_series_roundtrip(directory='test_series_dir'):
+    shutil.rmtree(directory, ignore_errors=True)
+
+    keyed = SidecarSeries(directory, 'trial_0', 'epoch/loss')
+    for i in range(100):
+        keyed.log(i, i * 0.5)
+
+    values = SidecarSeries(directory, 'trial_0', 'accuracy')
+    values.append(0.25)
+    values.append(0.5)
+
+    assert len(keyed) == 100
+    assert keyed.val[10] == 5.0
+    assert keyed.to_json(short=True) == {i: i * 0.5 for i in range(80, 100)}
+    assert SidecarSeries(directory, 'trial_0', 'accuracy').val == [0.25, 0.5]
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_sidecar_metrics(file='test_series.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}?series=sidecar')
+
+    for i in range(50):
+        proto.log_trial_metrics(trial, step=i, loss=i)
+
+    proto.log_trial_metrics(trial, accuracy=0.5)
+    proto.log_trial_metrics(trial, note='not a number')
+
+    # the snapshot only holds a reference
+    with open(file, 'r') as snapshot:
+        metrics = json.load(snapshot)[0]['trials'][0]['metrics']
+
+    assert metrics['loss']['dtype'] == 'series'
+    assert metrics['note'] == ['not a number']
+
+    loaded = load_database(file).objects[trial.uid]
+    assert loaded.metrics['loss'].val == {i: i for i in range(50)}
+    assert loaded.metrics['accuracy'].val == [0.5]
+
+    # series behave like inline metrics outside of the storage file
+    assert loaded.metrics['loss'][10] == 10
+    assert list(loaded.metrics['accuracy']) == [0.5]
+    assert to_json(loaded)['metrics']['loss'] == {i: i for i in range(50)}
+    remove(file)
+
+
+def test_sidecar_failed_transaction(file='test_series.json'):
+    remove(file)
+
+    # start inline so the first sidecar write moves the history inside the series
+    proto, trial = make_storage(f'file://{file}')
+    for i in range(5):
+        proto.log_trial_metrics(trial, step=i, loss=i)
+
+    proto = get_protocol(f'file://{file}?series=sidecar')
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            with proto.transaction():
+                proto.log_trial_metrics(trial, step=5, loss=5)
+                raise RuntimeError()
+
+    proto.log_trial_metrics(trial, step=5, loss=5)
+    proto.log_trial_metrics(trial, step=6, loss=6)
+
+    with pytest.raises(RuntimeError):
+        with proto.transaction():
+            proto.log_trial_metrics(trial, step=7, loss=7)
+            raise RuntimeError()
+
+    loaded = load_database(file).objects[trial.uid]
+    assert loaded.metrics['loss'].val == {i: i for i in range(7)}
+    remove(file)
+
+
+def test_sidecar_journal(file='test_series.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}?series=sidecar&journal=true')
+
+    for i in range(10):
+        proto.log_trial_metrics(trial, step=i, loss=i)
+
+    loaded = load_database(file).objects[trial.uid]
+    assert len(loaded.metrics['loss']) == 10
+    remove(file)
+
+
+if __name__ == '__main__':
+    test_series_roundtrip()
+    test_sidecar_metrics()
+    test_sidecar_failed_transaction()
+    test_sidecar_journal()
@@ -0,0 +1,321 @@
+import os
+import time
+import socket
+from concurrent.futures import Future
+from multiprocessing import Process
+from threading import Thread, Timer
+
+import pytest
+
+from track.persistence.socketed import start_track_server, SocketClient, SocketServer, RPCCallFailure
+from track.persistence.socketed import _ReplayBuffer
+from track.persistence.local import FileProtocol
+from track.persistence.wire import offered_formats
+from track.structure import Trial, Project
+
+
+def remove(filename):
+    for file in (filename, f'{filename}.lock', f'{filename}.journal'):
+        try:
+            os.remove(file)
+        except:
+            pass
+
+
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def run_server(uri):
+    SocketServer(uri).run_server()
+
+
+def make_server(file, options='', port=None):
+    if port is None:
+        remove(file)
+        port = free_port()
+
+    if options:
+        server = Process(target=run_server, args=(f'socket://localhost:{port}?backend=file://{file}{options}',))
+    else:
+        server = Process(target=start_track_server, args=(f'file://{file}', 'localhost', port, None))
+    server.start()
+
+    for _ in range(100):
+        try:
+            socket.create_connection(('localhost', port)).close()
+            break
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+
+    return server, port
+
+
+def test_pipelined_threads(file='test_socketed_threads.json'):
+    server, port = make_server(file)
+
+    try:
+        client = SocketClient(f'socket://localhost:{port}')
+        project = client.new_project(Project(name='socketed'))
+
+        def work(i):
+            trial = client.new_trial(Trial(parameters={'worker': i}, project_id=project.uid))
+
+            for step in range(20):
+                client.log_trial_metrics(trial, step=step, loss=step * i)
+
+        workers = [Thread(target=work, args=(i,)) for i in range(4)]
+        [w.start() for w in workers]
+        [w.join() for w in workers]
+
+        for i in range(4):
+            trial = client.get_trial(Trial(parameters={'worker': i}, project_id=project.uid))[0]
+            assert len(trial['metrics']['loss']) == 20
+    finally:
+        server.terminate()
+        remove(file)
+
+
+def test_fire_and_forget(file='test_socketed_async.json'):
+    server, port = make_server(file)
+
+    try:
+        client = SocketClient(f'socket://localhost:{port}?async=true')
+        project = client.new_project(Project(name='socketed'))
+        trial = client.new_trial(Trial(parameters={'a': 1}, project_id=project.uid))
+
+        for step in range(50):
+            assert client.log_trial_metrics(trial, step=step, loss=step) is None
+
+        client.flush()
+        assert len(client.get_trial(trial)[0]['metrics']['loss']) == 50
+
+        # the error of a fire-and-forget call is raised by the next call that waits for its reply
+        client.log_trial_metrics(Trial(parameters={'a': 2}, project_id=project.uid), step=0, loss=0)
+
+        with pytest.raises(RPCCallFailure):
+            client.get_trial(trial)
+
+        assert len(client.get_trial(trial)[0]['metrics']['loss']) == 50
+    finally:
+        server.terminate()
+        remove(file)
+
+
+def test_batch(file='test_socketed_batch.json'):
+    server, port = make_server(file)
+
+    try:
+        client = SocketClient(f'socket://localhost:{port}?batch=8&flush_ms=50')
+        project = client.new_project(Project(name='socketed'))
+        trial = client.new_trial(Trial(parameters={'a': 1}, project_id=project.uid))
+
+        for step in range(20):
+            assert client.log_trial_metrics(trial, step=step, loss=step) is None
+
+        # the buffered calls are sent before this one
+        assert len(client.get_trial(trial)[0]['metrics']['loss']) == 20
+
+        # a failing call does not stop the rest of the batch
+        client.log_trial_metrics(trial, step=20, loss=20)
+        client.log_trial_metrics(Trial(parameters={'a': 2}, project_id=project.uid), step=0, loss=0)
+        client.log_trial_metrics(trial, step=21, loss=21)
+
+        # the window is sent after flush_ms
+        time.sleep(0.5)
+        with pytest.raises(RPCCallFailure):
+            client.flush()
+
+        assert len(client.get_trial(trial)[0]['metrics']['loss']) == 22
+    finally:
+        server.terminate()
+        remove(file)
+
+
+def test_server_executor(file='test_socketed_executor.json'):
+    server, port = make_server(file, '&executor=process&workers=4')
+
+    try:
+        client = SocketClient(f'socket://localhost:{port}?async=true')
+        project = client.new_project(Project(name='socketed'))
+        trials = [client.new_trial(Trial(parameters={'a': i}, project_id=project.uid)) for i in range(4)]
+
+        # calls on different trials run concurrently, calls on the same trial run in order
+        for value in range(30):
+            for trial in trials:
+                client.log_trial_metrics(trial, step=value, loss=value)
+
+        client.flush()
+
+        for trial in trials:
+            assert list(client.get_trial(trial)[0]['metrics']['loss'].values()) == list(range(30))
+    finally:
+        server.terminate()
+        remove(file)
+
+
+def test_encrypted_pipelined(file='test_socketed_encrypted.json'):
+    server, port = make_server(file, '&security_layer=AES')
+
+    try:
+        client = SocketClient(f'socket://localhost:{port}?security_layer=AES&async=true')
+        project = client.new_project(Project(name='socketed'))
+        trial = client.new_trial(Trial(parameters={'a': 1}, project_id=project.uid))
+
+        # the replies of the fire-and-forget calls arrive back to back
+        for step in range(100):
+            client.log_trial_metrics(trial, step=step, loss=step)
+
+        client.flush()
+        assert len(client.get_trial(trial)[0]['metrics']['loss']) == 100
+
+        batched = SocketClient(f'socket://localhost:{port}?security_layer=AES&batch=8')
+        for step in range(100, 120):
+            batched.log_trial_metrics(trial, step=step, loss=step)
+
+        assert len(batched.get_trial(trial)[0]['metrics']['loss']) == 120
+    finally:
+        server.terminate()
+        remove(file)
+
+
+def test_negotiated_format(file='test_socketed_format.json'):
+    server, port = make_server(file)
+
+    try:
+        for name in offered_formats():
+            client = SocketClient(f'socket://localhost:{port}?format={name}')
+            assert client.wire.name == name
+
+            project = client.new_project(Project(name=f'socketed_{name}'))
+            trial = client.new_trial(Trial(parameters={'format': name}, project_id=project.uid))
+
+            batched = SocketClient(f'socket://localhost:{port}?format={name}&batch=8')
+            for step in range(20):
+                client.log_trial_metrics(trial, step=step, loss=step)
+                batched.log_trial_metrics(trial, step=step + 20, loss=step + 20)
+
+            batched.flush()
+            assert len(client.get_trial(trial)[0]['metrics']['loss']) == 40
+    finally:
+        server.terminate()
+        remove(file)
+
+
+def test_compression(file='test_socketed_compression.json'):
+    server, port = make_server(file)
+
+    try:
+        for name in ('zlib', 'lzma'):
+            client = SocketClient(f'socket://localhost:{port}?compression={name}&compress_above=1024')
+            assert client.compression.name == name
+
+            project = client.new_project(Project(name=f'socketed_{name}'))
+            trial = client.new_trial(Trial(parameters={'compression': name}, project_id=project.uid))
+
+            for step in range(200):
+                client.log_trial_metrics(trial, step=step, loss=step / 200)
+
+            # the reply is larger than the threshold
+            assert len(client.get_trial(trial)[0]['metrics']['loss']) == 200
+    finally:
+        server.terminate()
+        remove(file)
+
+
+def test_reconnect(file='test_socketed_reconnect.json'):
+    server, port = make_server(file)
+    restarted = []
+
+    try:
+        client = SocketClient(f'socket://localhost:{port}?reconnect=true&reconnect_delay=0.05&async=true')
+        project = client.new_project(Project(name='socketed'))
+        trial = client.new_trial(Trial(parameters={'a': 1}, project_id=project.uid))
+
+        for step in range(10):
+            client.log_trial_metrics(trial, step=step, loss=step)
+
+        client.flush()
+        server.terminate()
+        server.join()
+
+        # the calls made while the server is down are replayed in order once it is back
+        for step in range(10, 20):
+            client.log_trial_metrics(trial, step=step, loss=step)
+
+        restart = Timer(0.5, lambda: restarted.append(make_server(file, port=port)[0]))
+        restart.start()
+
+        assert len(client.get_trial(trial)[0]['metrics']['loss']) == 20
+        restart.join()
+    finally:
+        server.terminate()
+        [s.terminate() for s in restarted]
+        remove(file)
+
+
+def test_replay_buffer(file='test_socketed_spill.ndjson'):
+    dropped = _ReplayBuffer(size=4, policy='drop')
+    dropped.push([({'step': i}, None) for i in range(6)])
+    assert [kwargs['step'] for kwargs, _ in dropped.take(10)] == [2, 3, 4, 5]
+
+    # the oldest calls are spilled, the calls in flight when the connection was lost are replayed first
+    spilled = _ReplayBuffer(size=4, policy='spill', spill_path=file)
+    future = Future()
+    spilled.push([({'step': 0}, future)])
+    spilled.push([({'step': i}, None) for i in range(1, 10)])
+    spilled.push([({'step': -1}, None)], front=True)
+    assert len(spilled) == 11 and os.path.exists(file)
+
+    calls = spilled.take(3) + spilled.take(20)
+    assert [kwargs['step'] for kwargs, _ in calls] == list(range(-1, 10))
+    assert calls[1][1] is future
+    assert not os.path.exists(file)
+
+
+def test_object_cache(file='test_socketed_cache.json'):
+    remove(file)
+
+    try:
+        server = SocketServer(f'socket://localhost:0?backend=file://{file}&cache=2')
+        backend = server.backend
+        project = backend.new_project(Project(name='cache'))
+        trials = [backend.new_trial(Trial(parameters={'a': i}, project_id=project.uid)) for i in range(3)]
+
+        trial = server.process_args({'trial': trials[0].uid})['trial']
+        assert server.process_args({'trial': trials[0].uid})['trial'] is trial
+        assert server.object_cache.hits == 1
+
+        # least recently used objects are evicted
+        server.process_args({'trial': trials[1].uid})
+        server.process_args({'trial': trials[2].uid})
+        assert list(server.object_cache.objects) == [('trial', trials[1].uid), ('trial', trials[2].uid)]
+
+        # the file is modified by someone else, the objects are reloaded and removed from the cache
+        other = FileProtocol(f'file://{file}')
+        other.log_trial_metrics(trials[2], step=1, loss=1)
+        backend.log_trial_metrics(trials[2], step=2, loss=2)
+        assert not server.object_cache.objects
+
+        reloaded = server.process_args({'trial': trials[2].uid})['trial']
+        assert reloaded is backend.storage.objects[trials[2].uid]
+        assert len(reloaded.metrics['loss']) == 2
+    finally:
+        remove(file)
+
+
+if __name__ == '__main__':
+    test_pipelined_threads()
+    test_fire_and_forget()
+    test_batch()
+    test_server_executor()
+    test_encrypted_pipelined()
+    test_negotiated_format()
+    test_compression()
+    test_reconnect()
+    test_replay_buffer()
+    test_object_cache()
@@ -0,0 +1,83 @@
+import os
+import json
+
+from track.persistence import get_protocol
+from track.persistence.storage import load_database, read_generation
+from track.structure import Trial, TrialGroup, Project
+
+
+def remove(filename):
+    for file in (filename, f'{filename}.lock', f'{filename}.journal'):
+        try:
+            os.remove(file)
+        except:
+            pass
+
+
+def make_storage(uri):
+    proto = get_protocol(uri)
+
+    project = proto.new_project(Project(name='storage'))
+    group = proto.new_trial_group(TrialGroup(name='group', project_id=project.uid))
+    trial = proto.new_trial(Trial(parameters={'a': 1}, project_id=project.uid, group_id=group.uid))
+    return proto, trial
+
+
+def test_generation_is_saved(file='test_storage.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}?journal=true&journal_size=0')
+
+    generation = read_generation(file)
+    assert generation == proto.storage.generation
+
+    proto.log_trial_metadata(trial, a=1)
+    assert read_generation(file) == generation + 1
+    assert load_database(file).generation == generation + 1
+    remove(file)
+
+
+def test_list_layout_without_journal(file='test_storage.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}')
+
+    # files written without journal can be read by older versions
+    with open(file, 'r') as snapshot:
+        projects = json.load(snapshot)
+
+    assert isinstance(projects, list)
+    assert read_generation(file) is None
+    assert load_database(file).objects[trial.uid].parameters == {'a': 1}
+    remove(file)
+
+
+def test_skip_reload_when_unchanged(file='test_storage.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}')
+
+    storage = proto.storage
+    proto.log_trial_metadata(trial, a=1)
+    proto.get_trial(trial)
+
+    # we were the last writer, the storage was reused
+    assert proto.storage is storage
+    remove(file)
+
+
+def test_reload_when_changed(file='test_storage.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}')
+    other = get_protocol(f'file://{file}')
+
+    storage = proto.storage
+    other.log_trial_metadata(trial, a=2)
+
+    assert proto.get_trial(trial)[0].metadata['a'] == 2
+    assert proto.storage is not storage
+    remove(file)
+
+
+if __name__ == '__main__':
+    test_generation_is_saved()
+    test_list_layout_without_journal()
+    test_skip_reload_when_unchanged()
+    test_reload_when_changed()
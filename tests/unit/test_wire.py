@@ -0,0 +1,48 @@
+import math
+
+import pytest
+
+from track.persistence.framing import FLAG_MSGPACK
+from track.persistence.wire import make_wire, negotiate, decode, JsonWire
+
+pytest.importorskip('msgpack')
+
+
+def test_msgpack_roundtrip():
+    client, server = make_wire('msgpack'), make_wire('msgpack')
+
+    first = client.dumps({'__rpc__': 'log_trial_metrics', 'trial': 'abc_0', 'step': 1, 'loss': {1: 0.5}})
+    second = client.dumps({'__rpc__': 'log_trial_metrics', 'trial': 'abc_0', 'step': 2, 'loss': float('nan')})
+
+    # the keys, the procedure and the trial are only sent once
+    assert len(second) < len(first)
+    assert b'log_trial_metrics' not in second
+
+    assert decode(server, FLAG_MSGPACK, first) == {
+        '__rpc__': 'log_trial_metrics', 'trial': 'abc_0', 'step': 1, 'loss': {1: 0.5}}
+
+    message = decode(server, FLAG_MSGPACK, memoryview(second))
+    assert message['step'] == 2 and math.isnan(message['loss'])
+
+
+def test_msgpack_batch_and_fallback():
+    client, server = make_wire('msgpack'), make_wire('msgpack')
+
+    calls = [client.dumps({'__rpc__': 'add_trial_tags', 'trial': 'abc_0', 'tag': i}) for i in range(3)]
+    # integers larger than 64 bits are sent as json, the strings of the failed message are forgotten
+    calls.append(client.dumps({'__rpc__': 'add_trial_tags', 'trial': 'abc_0', 'large': 2 ** 70}))
+    calls.append(client.dumps({'__rpc__': 'add_trial_tags', 'trial': 'abc_0', 'large': 1}))
+
+    batch = server.loads(client.batch(12, calls))
+    assert batch['__rpc__'] == 'batch' and batch['__id__'] == 12
+    assert [call.get('tag') for call in batch['calls'][:3]] == [0, 1, 2]
+    assert batch['calls'][3]['large'] == 2 ** 70
+    assert batch['calls'][4] == {'__rpc__': 'add_trial_tags', 'trial': 'abc_0', 'large': 1}
+
+
+def test_negotiate():
+    assert negotiate(['msgpack', 'json']) == 'msgpack'
+    assert negotiate(['cbor']) == 'json'
+
+    with pytest.raises(Exception):
+        decode(JsonWire(), FLAG_MSGPACK, b'')
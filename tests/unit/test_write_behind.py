@@ -0,0 +1,139 @@
+import os
+import time
+from threading import Event, Thread
+
+from track.persistence import get_protocol
+from track.persistence.storage import load_database
+from track.structure import Trial, TrialGroup, Project, Status
+
+
+def remove(filename):
+    for file in (filename, f'{filename}.lock', f'{filename}.journal'):
+        try:
+            os.remove(file)
+        except:
+            pass
+
+
+def make_storage(uri):
+    proto = get_protocol(uri)
+
+    project = proto.new_project(Project(name='write_behind'))
+    group = proto.new_trial_group(TrialGroup(name='group', project_id=project.uid))
+    trial = proto.new_trial(Trial(parameters={'a': 1}, project_id=project.uid, group_id=group.uid))
+    return proto, trial
+
+
+def saved_trial(file, trial):
+    return load_database(file).objects[trial.uid]
+
+
+def test_write_behind_batch(file='test_write_behind.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}?batch=5')
+
+    for i in range(4):
+        proto.log_trial_metrics(trial, step=i, loss=i)
+
+    # nothing was written yet
+    assert 'loss' not in saved_trial(file, trial).metrics
+
+    proto.log_trial_metrics(trial, step=4, loss=4)
+    assert len(saved_trial(file, trial).metrics['loss']) == 5
+    remove(file)
+
+
+def test_write_behind_flush_on_status(file='test_write_behind.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}?batch=100')
+
+    proto.log_trial_metrics(trial, step=0, loss=0)
+    proto.log_trial_metadata(trial, worker=1)
+    proto.set_trial_status(trial, Status.Completed)
+
+    saved = saved_trial(file, trial)
+    assert saved.metrics['loss'] == {'0': 0}
+    assert saved.metadata['worker'] == 1
+    assert saved.status == Status.Completed
+    remove(file)
+
+
+def test_write_behind_flush_on_commit(file='test_write_behind.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}?batch=100')
+
+    proto.log_trial_metadata(trial, worker=1)
+    proto.commit()
+
+    assert saved_trial(file, trial).metadata['worker'] == 1
+    remove(file)
+
+
+def test_write_behind_flush_interval(file='test_write_behind.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}?flush_ms=50')
+
+    proto.log_trial_metadata(trial, worker=1)
+    assert 'worker' not in saved_trial(file, trial).metadata
+
+    time.sleep(0.5)
+    assert saved_trial(file, trial).metadata['worker'] == 1
+    remove(file)
+
+
+def test_write_behind_flusher_overlap(file='test_write_behind.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}?flush_ms=1')
+
+    # the flusher commits while the main thread logs and opens its own transactions
+    for i in range(200):
+        proto.log_trial_metrics(trial, step=i, loss=i)
+
+        if i % 10 == 0:
+            proto.add_trial_tags(trial, **{f'tag{i}': i})
+            proto.get_trial(trial)
+
+    proto.flush()
+
+    saved = saved_trial(file, trial)
+    assert len(saved.metrics['loss']) == 200
+    assert len(saved.tags) == 20
+    remove(file)
+
+
+def test_transaction_depth_per_thread(file='test_write_behind.json'):
+    remove(file)
+    proto, trial = make_storage(f'file://{file}?flush_ms=1')
+
+    entered = Event()
+    done = Event()
+
+    def hold():
+        with proto.transaction():
+            entered.set()
+            done.wait()
+
+    thread = Thread(target=hold)
+    thread.start()
+    entered.wait()
+
+    # the transaction of the other thread is not ours
+    assert proto.lock_guard_depth == 0
+
+    done.set()
+    thread.join()
+
+    with proto.transaction():
+        assert proto.lock_guard_depth == 1
+
+    assert proto.lock_guard_depth == 0
+    remove(file)
+
+
+if __name__ == '__main__':
+    test_write_behind_batch()
+    test_write_behind_flush_on_status()
+    test_write_behind_flush_on_commit()
+    test_write_behind_flush_interval()
+    test_write_behind_flusher_overlap()
+    test_transaction_depth_per_thread()
@@ -0,0 +1,37 @@
+import socket
+
+from track.utils.encrypted import wrap_socket, _make_key, _make_cipher
+
+
+def make_pair():
+    client, server = socket.socketpair()
+    client_key, client_pub = _make_key()
+    server_key, server_pub = _make_key()
+
+    client = wrap_socket(client, handshaked=True)
+    server = wrap_socket(server, handshaked=True)
+    client.cipher = _make_cipher(client_key, server_pub)
+    server.cipher = _make_cipher(server_key, client_pub)
+    return client, server
+
+
+def test_messages_back_to_back():
+    client, server = make_pair()
+
+    messages = [b'first', b'x' * 20000, b'', b'last message']
+    for message in messages:
+        client.sendall(message)
+
+    expected = b''.join(messages)
+    received = bytearray()
+    buffer = bytearray(1000)
+
+    while len(received) < len(expected):
+        size = server.recv_into(buffer)
+        received += buffer[:size]
+
+    assert received == expected
+
+
+if __name__ == '__main__':
+    test_messages_back_to_back()
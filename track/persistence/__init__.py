@@ -14,6 +14,11 @@ def make_local(uri, strict=True, eager=True):
     return FileProtocol(uri, strict, eager)
 
 
+def make_directory(uri, strict=True, eager=True):
+    from track.persistence.directory import DirectoryProtocol
+    return DirectoryProtocol(uri, strict, eager)
+
+
 def make_socket_protocol(uri):
     from track.persistence.socketed import SocketClient
     return SocketClient(uri)
@@ -51,6 +56,7 @@ def register(name, proto):
 _protocols = {
     '__default__': make_local,
     'file': make_local,
+    'file-dir': make_directory,
     'cometml': make_comet_ml,
     'socket': make_socket_protocol,
     'cockroach': make_cockroach_protocol,
@@ -71,7 +77,7 @@ def get_protocol(backend_name):
         warning(f'Logger (backend: {backend_name}) was not found!')
         log = _protocols.get('__default__')
 
-    if log is make_local:
+    if log in (make_local, make_directory):
         debug('return local protocol')
         return log(backend_name)
     else:
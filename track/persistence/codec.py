@@ -0,0 +1,178 @@
+"""Json codecs used to save the storage files and to exchange messages with the track server.
+
+    The fastest available library is used: `orjson`, then `ujson` and finally the standard library.
+    A specific codec can be selected with ``log.backend.codec`` (``auto``, ``orjson``, ``ujson`` or ``json``).
+
+    Codecs encode to bytes and do not indent their output unless asked to.
+    All of them read and write the non standard ``NaN`` and ``Infinity`` values of the standard library.
+    `orjson` writes them as ``null`` and cannot encode integers larger than 64 bits,
+    documents holding such values are encoded by the standard library instead.
+"""
+import json
+import math
+
+from track.configuration import options
+from track.utils.log import warning
+
+
+def _to_builtin(obj):
+    """Convert the values the fast codecs do not know about, numpy scalars & arrays, sets, aggregators"""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+
+    if hasattr(obj, 'to_json'):
+        return obj.to_json()
+
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _has_non_finite(obj):
+    """Returns true if a float of the document is NaN or infinite"""
+    stack = [obj]
+
+    while stack:
+        value = stack.pop()
+
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+
+        elif hasattr(value, 'tolist'):
+            stack.append(value.tolist())
+
+    return False
+
+
+def _as_bytes(data):
+    """Messages are read inside memory views which only `orjson` can decode"""
+    if isinstance(data, memoryview):
+        return data.tobytes()
+    return data
+
+
+class JsonCodec:
+    """Standard library codec"""
+    name = 'json'
+
+    def dumps(self, obj, pretty=False) -> bytes:
+        if pretty:
+            return json.dumps(obj, indent=2, default=_to_builtin).encode('utf8')
+
+        return json.dumps(obj, separators=(',', ':'), default=_to_builtin).encode('utf8')
+
+    def loads(self, data):
+        return json.loads(_as_bytes(data))
+
+
+class UJsonCodec(JsonCodec):
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def dumps(self, obj, pretty=False) -> bytes:
+        try:
+            return self.ujson.dumps(obj, indent=2 if pretty else 0, ensure_ascii=False).encode('utf8')
+        except (TypeError, OverflowError):
+            return json.dumps(obj, indent=2 if pretty else None, default=_to_builtin).encode('utf8')
+
+    def loads(self, data):
+        data = _as_bytes(data)
+
+        try:
+            return self.ujson.loads(data)
+        except ValueError:
+            return json.loads(data)
+
+
+class OrJsonCodec(JsonCodec):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+        self.options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(self, obj, pretty=False) -> bytes:
+        option = self.options
+        if pretty:
+            option |= self.orjson.OPT_INDENT_2
+
+        try:
+            data = self.orjson.dumps(obj, default=_to_builtin, option=option)
+
+        # integers larger than 64 bits
+        except TypeError:
+            return JsonCodec.dumps(self, obj, pretty)
+
+        # null is also how orjson writes NaN and infinities, only look for them when the document has nulls
+        if b'null' in data and _has_non_finite(obj):
+            return JsonCodec.dumps(self, obj, pretty)
+
+        return data
+
+    def loads(self, data):
+        try:
+            return self.orjson.loads(data)
+        except ValueError:
+            # NaN written by the standard library
+            return json.loads(_as_bytes(data))
+
+
+_codecs = {
+    'orjson': OrJsonCodec,
+    'ujson': UJsonCodec,
+    'json': JsonCodec,
+}
+
+_instances = dict()
+
+
+def get_codec(name=None) -> JsonCodec:
+    """Returns the codec `name`, if `name` is None the codec set by ``log.backend.codec`` is used"""
+    if name is None:
+        name = options('log.backend.codec', 'auto')
+
+    codec = _instances.get(name)
+    if codec is not None:
+        return codec
+
+    candidates = list(_codecs) if name == 'auto' else [name]
+
+    for candidate in candidates:
+        factory = _codecs.get(candidate)
+
+        if factory is None:
+            warning(f'(codec: {candidate}) is not supported')
+            continue
+
+        try:
+            codec = factory()
+            break
+        except ImportError:
+            if name != 'auto':
+                warning(f'(codec: {candidate}) is not installed')
+
+    if codec is None:
+        codec = JsonCodec()
+
+    _instances[name] = codec
+    return codec
+
+
+def dumps(obj, pretty=False) -> bytes:
+    return get_codec().dumps(obj, pretty)
+
+
+def loads(data):
+    return get_codec().loads(data)
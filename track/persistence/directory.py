@@ -0,0 +1,454 @@
+"""Directory layout for the file backend.
+
+    With a single json file every worker contends on the same lock even when they are updating different trials.
+    The directory layout saves each object in its own file, workers only wait on each other when they update
+    the same trial and a trial update only rewrites the file of that trial.
+
+    .. code-block:: text
+
+        {path}/manifest.json            uids of the projects, groups and trials
+        {path}/projects/{uid}.json      project attributes
+        {path}/groups/{uid}.json
+        {path}/trials/{uid}.json
+
+    The manifest, projects and groups are protected by ``{path}.lock``; each trial file is protected by its own
+    ``{path}/trials/{uid}.json.lock``. Project files do not hold their trials and groups,
+    they are linked back to their project when loaded.
+"""
+import os
+import inspect
+import tempfile
+import functools
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Set
+from urllib.parse import quote
+
+from track.utils.log import error, warning
+from track.structure import Project, Trial, TrialGroup
+from track.serialization import from_json, to_json
+from track.persistence.storage import LocalStorage, file_stamp
+from track.persistence.series import bind_series, series_directory, series_references
+from track.persistence.index import StorageIndex
+from track.persistence import codec
+from track.persistence.local import FileProtocol, make_lock, write_behind
+
+
+_kinds = ('projects', 'groups', 'trials')
+
+
+@dataclass
+class DirectoryStorage(LocalStorage):
+    # stamp of each object file when we last read or wrote it
+    stamps: Dict[str, tuple] = field(default_factory=dict)
+    # objects that need to be written on commit
+    modified: Set[str] = field(default_factory=set)
+    manifest_modified: bool = False
+    loaded: bool = False
+    # called with the uid of the objects that were replaced by a newer version, None if all of them were
+    replaced: Callable = field(default=None, repr=False, compare=False)
+
+    @property
+    def manifest_path(self):
+        return f'{self.target_file}/manifest.json'
+
+    def kind(self, uid):
+        if uid in self._trials:
+            return 'trials'
+
+        if uid in self._groups:
+            return 'groups'
+
+        return 'projects'
+
+    def object_path(self, uid, kind=None):
+        return f'{self.target_file}/{kind or self.kind(uid)}/{quote(uid, safe="")}.json'
+
+    def is_stale(self):
+        return not self.loaded or file_stamp(self.manifest_path) != self.stamp
+
+    def is_object_stale(self, uid):
+        return file_stamp(self.object_path(uid)) != self.stamps.get(uid)
+
+    def invalidate(self, uid=None):
+        """Force the next refresh to reload the object `uid` or every object if `uid` is None"""
+        if uid is None:
+            self.loaded = False
+            return
+
+        self.stamps.pop(uid, None)
+        self.modified.discard(uid)
+
+    # Read
+    def refresh(self):
+        """Reload the objects that were modified by other processes"""
+        if not self.loaded:
+            return self._load_all()
+
+        if file_stamp(self.manifest_path) != self.stamp:
+            self._load_manifest()
+
+        for uid in list(self._objects):
+            self.refresh_object(uid)
+
+    def refresh_object(self, uid, kind=None):
+        """Reload a single object if its file changed, load it if it is unknown"""
+        path = self.object_path(uid, kind)
+
+        if uid in self._objects and file_stamp(path) == self.stamps.get(uid):
+            return self._objects[uid]
+
+        self._read_object(path)
+        return self._objects.get(uid)
+
+    def _read_object(self, path):
+        try:
+            with open(path, 'rb') as file:
+                stamp = file_stamp(fd=file.fileno())
+                data = codec.loads(file.read())
+        except FileNotFoundError:
+            return None
+
+        obj = from_json(data)
+        if isinstance(obj, Trial):
+            bind_series(obj, series_directory(self.target_file))
+
+        self._replace_object(self._objects.get(obj.uid), obj)
+        self.stamps[obj.uid] = stamp
+        return obj
+
+    def _replace_object(self, old, new):
+        self._insert_object(new)
+
+        if old is not None and self.replaced is not None:
+            self.replaced(new.uid)
+
+        if isinstance(new, Trial):
+            project = self._objects.get(new.project_id)
+            if project is not None:
+                # objects compare by uid, discard the old version first or `add` keeps it
+                project.trials.discard(new)
+                project.trials.add(new)
+
+            group = self._objects.get(new.group_id)
+            if group is not None:
+                group.trials.add(new.uid)
+
+        elif isinstance(new, TrialGroup):
+            project = self._objects.get(new.project_id)
+            if project is not None:
+                project.groups.discard(new)
+                project.groups.add(new)
+
+        elif isinstance(new, Project):
+            if old is not None:
+                new.trials = old.trials
+                new.groups = old.groups
+            else:
+                for obj in self._objects.values():
+                    if isinstance(obj, Trial) and obj.project_id == new.uid:
+                        new.trials.add(obj)
+                    elif isinstance(obj, TrialGroup) and obj.project_id == new.uid:
+                        new.groups.add(obj)
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'rb') as file:
+                stamp = file_stamp(fd=file.fileno())
+                manifest = codec.loads(file.read())
+        except FileNotFoundError:
+            return
+
+        self.stamp = stamp
+        self.generation = manifest.get('generation')
+
+        # projects first so groups and trials can be linked to them
+        for kind in _kinds:
+            for uid in manifest.get(kind, []):
+                if uid not in self._objects:
+                    self.refresh_object(uid, kind)
+
+    def _load_all(self):
+        self._objects = dict()
+        self._projects = set()
+        self._groups = set()
+        self._trials = set()
+        self._project_names = dict()
+        self._group_names = dict()
+        self.index.clear()
+        self.stamps = dict()
+        self.modified = set()
+        self.manifest_modified = False
+        self.stamp = None
+
+        if self.replaced is not None:
+            self.replaced(None)
+
+        self._load_manifest()
+        self.loaded = True
+
+    # Write
+    def _write(self, path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # the temporary file needs to be on the same file system for the rename to be atomic
+        fd, file_name = tempfile.mkstemp(prefix='.track_uncommitted_', dir=directory)
+        with os.fdopen(fd, 'wb') as output:
+            output.write(codec.dumps(data))
+
+        os.rename(file_name, path)
+        return file_stamp(path)
+
+    def write_object(self, uid):
+        self.modified.discard(uid)
+
+        obj = self._objects.get(uid)
+        if obj is None:
+            return
+
+        with series_references():
+            data = to_json(obj)
+
+        if isinstance(obj, Project):
+            data['trials'] = []
+            data['groups'] = []
+
+        self.stamps[uid] = self._write(self.object_path(uid), data)
+
+    def write_manifest(self):
+        generation = (self.generation or 0) + 1
+
+        self.stamp = self._write(self.manifest_path, {
+            'generation': generation,
+            'projects': sorted(self._projects),
+            'groups': sorted(self._groups),
+            'trials': sorted(self._trials)
+        })
+        self.generation = generation
+        self.manifest_modified = False
+
+    def commit(self, file_name_override=None, **kwargs):
+        """Write the modified objects, if `file_name_override` is set export the storage as a single file"""
+        if file_name_override is not None and file_name_override != self.target_file:
+            return super(DirectoryStorage, self).commit(file_name_override, **kwargs)
+
+        if self.target_file is None:
+            return None
+
+        for uid in list(self.modified):
+            self.write_object(uid)
+
+        if self.manifest_modified:
+            self.write_manifest()
+
+    def compact(self):
+        """Nothing to merge, objects are always written in place"""
+        pass
+
+
+def load_directory(path, indexes=None):
+    storage = DirectoryStorage(target_file=path, index=StorageIndex(indexes))
+
+    if path is not None:
+        storage.refresh()
+
+    return storage
+
+
+def trial_guard(fun):
+    """Protect a function call with the lock of the trial, only the trial is reloaded and saved"""
+
+    @functools.wraps(fun)
+    def _trial_guard(self, trial, *args, **kwargs):
+        with self.trial_transaction(trial.uid):
+            return fun(self, trial, *args, **kwargs)
+
+    return _trial_guard
+
+
+def _trial_method(name, buffered=False):
+    method = trial_guard(inspect.unwrap(getattr(FileProtocol, name)))
+
+    if buffered:
+        return write_behind(method)
+
+    return method
+
+
+class DirectoryProtocol(FileProtocol):
+    """Store experiments inside a directory, each object is saved in its own file
+
+    Parameters
+    ----------
+    uri: str
+        resource to use to store the experiment `file-dir://my_directory/`
+
+    Notes
+    -----
+    Trial updates only take the lock of the trial, workers updating different trials do not wait on each other.
+    Creating objects and querying take the lock of the entire directory.
+
+    The journal mode is not supported, the sidecar series and write-behind modes are.
+    """
+
+    def __init__(self, uri, strict=True, eager=True):
+        super(DirectoryProtocol, self).__init__(uri, strict, eager)
+
+        # each trial is rewritten on its own, there is nothing to journal
+        self.journaled = False
+        self.trial_locks = dict()
+        self.trial_depth = dict()
+
+        if self.path and eager:
+            os.makedirs(f'{self.path}/trials', exist_ok=True)
+
+    @staticmethod
+    def _parse_path(uri):
+        # file-dir://path/to/dir/
+        path = (uri.get('address') or '') + (uri.get('path') or '')
+        return path.rstrip('/') or None
+
+    def _load(self):
+        storage = load_directory(self.path, self.indexes)
+        storage.replaced = self._changed
+        return storage
+
+    def is_stale(self, uid=None):
+        if not self.path or not self.eager:
+            return False
+
+        if uid is None or uid not in self.storage.objects:
+            return self.storage.is_stale()
+
+        return self.storage.is_object_stale(uid)
+
+    def _trial_lock(self, uid):
+        lock = self.trial_locks.get(uid)
+
+        if lock is None:
+            lock = make_lock(f'{self.storage.object_path(uid, "trials")}.lock', self.eager)
+            self.trial_locks[uid] = lock
+
+        return lock
+
+    def _object_lock(self, uid):
+        if uid in self.storage.trials:
+            return self._trial_lock(uid)
+
+        return self.lock
+
+    @contextmanager
+    def trial_transaction(self, uid, readonly=False):
+        """Group calls on a single trial under the lock of the trial, the trial is reloaded once
+        at the start and saved once at the end"""
+        with self.thread_lock, self._trial_lock(uid):
+            depth = self.trial_depth.get(uid, 0)
+            outermost = depth == 0 and self.path and self.eager
+            self.trial_depth[uid] = depth + 1
+
+            try:
+                if outermost:
+                    self.storage.refresh_object(uid, 'trials')
+
+                try:
+                    yield self
+
+                except Exception:
+                    self.storage.invalidate(uid)
+                    if depth == 0:
+                        self._rollback_series()
+                    raise
+
+                if depth == 0:
+                    self.series_writes = dict()
+
+                if outermost and not readonly:
+                    self.storage.write_object(uid)
+
+            finally:
+                self.trial_depth[uid] = depth
+
+    def _refresh(self):
+        self.storage.refresh()
+
+    def _record(self, op, **kwargs):
+        """Mark the objects modified by the change, they are written on commit"""
+        storage = self.storage
+
+        if op == 'insert':
+            obj = kwargs['object']
+            storage.modified.add(obj.uid)
+            storage.manifest_modified = True
+
+            # groups hold the uid of their trials
+            if isinstance(obj, Trial) and obj.group_id is not None:
+                storage.modified.add(obj.group_id)
+
+        elif op == 'project_trial':
+            storage.modified.add(kwargs['trial'])
+
+        elif op == 'group_trial':
+            storage.modified.add(kwargs['group'])
+            storage.modified.add(kwargs['trial'])
+
+        else:
+            storage.modified.add(kwargs['uid'])
+
+    def _apply_buffer(self):
+        with self.buffer_lock:
+            buffer, self.buffer = self.buffer, []
+
+        # group the calls per trial so each trial file is written once
+        calls = defaultdict(list)
+        for fun, args, kwargs in buffer:
+            trial = args[0] if args else kwargs['trial']
+            calls[trial.uid].append((fun, args, kwargs))
+
+        for uid, trial_calls in calls.items():
+            with self.trial_transaction(uid):
+                for fun, args, kwargs in trial_calls:
+                    try:
+                        fun(self, *args, **kwargs)
+                    except Exception:
+                        error(f'Buffered call (fun: {fun.__name__}) failed')
+                        error(traceback.format_exc())
+
+    def flush(self):
+        """Apply the buffered calls, only the locks of the buffered trials are taken"""
+        if not self.buffer:
+            return
+
+        with self.thread_lock:
+            self._apply_buffer()
+
+    def commit(self, file_name_override=None, **kwargs):
+        if self.buffer and self.lock_guard_depth == 0:
+            self.flush()
+
+        if not self.path:
+            warning('Path undefined!')
+            return
+
+        with self.lock.acquire():
+            if file_name_override is not None:
+                return self.storage.commit(file_name_override=file_name_override, **kwargs)
+
+            for uid in list(self.storage.modified):
+                with self._object_lock(uid):
+                    self.storage.write_object(uid)
+
+            if self.storage.manifest_modified:
+                self.storage.write_manifest()
+
+    log_trial_start = _trial_method('log_trial_start')
+    log_trial_finish = _trial_method('log_trial_finish')
+    log_trial_chrono_start = _trial_method('log_trial_chrono_start')
+    log_trial_chrono_finish = _trial_method('log_trial_chrono_finish')
+    log_trial_metadata = _trial_method('log_trial_metadata', buffered=True)
+    log_trial_metrics = _trial_method('log_trial_metrics', buffered=True)
+    add_trial_tags = _trial_method('add_trial_tags', buffered=True)
+    log_trial_arguments = _trial_method('log_trial_arguments', buffered=True)
+    set_trial_status = _trial_method('set_trial_status')
@@ -0,0 +1,213 @@
+"""Framing of the messages exchanged between the track server and its clients.
+
+    Each frame starts with an 8 bytes header followed by the payload
+
+    .. code-block:: text
+
+        | version (1) | flags (1) | reserved (2) | payload size (4) | payload (size) |
+
+    The payload size is read first, then the payload is read in a single pass.
+    Clients read it inside a reusable buffer with ``recv_into``, the server uses ``StreamReader.readexactly``.
+    Frames larger than ``log.backend.max_frame`` bytes are refused.
+
+    Flags
+        ``FLAG_MSGPACK`` the payload is encoded with msgpack (see :mod:`track.persistence.wire`)
+
+        ``FLAG_ZLIB``, ``FLAG_LZMA`` the payload is compressed, the size of the header is the compressed size.
+        Payloads are only compressed above a threshold (see :class:`Compression`),
+        frames that are not flagged are sent as is.
+"""
+import lzma
+import struct
+import zlib
+
+from track.configuration import options
+
+
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<BBxxI')
+
+FLAG_MSGPACK = 0x01
+FLAG_ZLIB = 0x02
+FLAG_LZMA = 0x04
+COMPRESSED = FLAG_ZLIB | FLAG_LZMA
+
+
+class FrameError(Exception):
+    def __init__(self, msg):
+        super(FrameError, self).__init__(msg)
+
+
+def max_frame_size(value=None):
+    if value is None:
+        value = options('log.backend.max_frame', 256 * 1024 * 1024)
+    return int(value)
+
+
+def check_size(size, max_size=None):
+    if max_size is not None and size > max_size:
+        raise FrameError(f'(frame: {size} bytes) is larger than the maximum frame size ({max_size} bytes)')
+
+
+def pack_header(size, flags=0, max_size=None):
+    check_size(size, max_size)
+    return FRAME_HEADER.pack(FRAME_VERSION, flags, size)
+
+
+def _zlib_compress(payload, level):
+    return zlib.compress(payload, -1 if level is None else level)
+
+
+def _lzma_compress(payload, level):
+    return lzma.compress(payload, preset=level)
+
+
+_compressions = {
+    'zlib': (FLAG_ZLIB, _zlib_compress),
+    'lzma': (FLAG_LZMA, _lzma_compress)
+}
+
+
+class Compression:
+    """Compress the payloads that are larger than `threshold` bytes
+
+    Parameters
+    ----------
+    name: str
+        ``zlib``, ``lzma`` or None to disable the compression
+
+    threshold: int
+        size in bytes from which payloads are compressed
+
+    level: int
+        compression level of zlib (0-9) or preset of lzma (0-9), None uses the default of the library
+    """
+
+    def __init__(self, name=None, threshold=64 * 1024, level=None):
+        if name is not None and name not in _compressions:
+            raise ValueError(f'(compression: {name}) is not supported, choose one of {list(_compressions)}')
+
+        self.name = name
+        self.threshold = int(threshold)
+        self.level = None if level is None else int(level)
+        self.flag, self._compress = _compressions[name] if name is not None else (0, None)
+
+    def compress(self, payload, flags=0):
+        """Returns the payload to send and its flags"""
+        if self._compress is None or len(payload) < self.threshold:
+            return payload, flags
+
+        compressed = self._compress(payload, self.level)
+
+        # incompressible payloads are sent as is
+        if len(compressed) >= len(payload):
+            return payload, flags
+
+        return compressed, flags | self.flag
+
+
+def decompress(flags, payload, max_size=None):
+    """Returns the payload of a frame, decompressed if it is flagged as such"""
+    if not flags & COMPRESSED:
+        return payload
+
+    try:
+        if flags & FLAG_ZLIB:
+            decompressor = zlib.decompressobj()
+            data = decompressor.decompress(payload, max_size or 0)
+            complete = decompressor.eof and not decompressor.unconsumed_tail
+        else:
+            decompressor = lzma.LZMADecompressor()
+            data = decompressor.decompress(payload, max_size or -1)
+            complete = decompressor.eof
+
+    except (zlib.error, lzma.LZMAError) as e:
+        raise FrameError(f'could not decompress the frame: {e}')
+
+    # the payload is truncated or larger than the maximum frame size
+    if not complete:
+        raise FrameError(f'could not decompress the frame, it is truncated or larger than {max_size} bytes')
+
+    return data
+
+
+def unpack_header(header, max_size=None):
+    """Returns the flags and the payload size of a frame"""
+    version, flags, size = FRAME_HEADER.unpack(header)
+
+    if version != FRAME_VERSION:
+        raise FrameError(f'(version: {version}) is not supported, expected (version: {FRAME_VERSION})')
+
+    if max_size is not None and size > max_size:
+        raise FrameError(f'(frame: {size} bytes) is larger than the maximum frame size ({max_size} bytes)')
+
+    return flags, size
+
+
+def write_frame(socket, payload, flags=0, max_size=None, compression=None):
+    """Send a frame on a blocking socket"""
+    if compression is not None:
+        # the peer checks the decompressed size
+        check_size(len(payload), max_size)
+        payload, flags = compression.compress(payload, flags)
+
+    socket.sendall(pack_header(len(payload), flags, max_size) + payload)
+
+
+class FrameReader:
+    """Read frames from a blocking socket into a reusable buffer
+
+    Parameters
+    ----------
+    socket: socket
+        socket to read from
+
+    max_size: int
+        maximum payload size in bytes
+    """
+
+    def __init__(self, socket, max_size=None):
+        self.socket = socket
+        self.max_size = max_frame_size(max_size)
+        self.header = bytearray(FRAME_HEADER.size)
+        self.buffer = bytearray(64 * 1024)
+
+    def _read_into(self, view):
+        while view:
+            read = self.socket.recv_into(view)
+
+            if not read:
+                raise ConnectionError('Connection closed by the peer')
+
+            view = view[read:]
+
+    def read(self):
+        """Returns the flags and the payload of the next frame.
+        The payload is a view of the buffer of the reader, it is only valid until the next read.
+        Compressed payloads are returned decompressed"""
+        self._read_into(memoryview(self.header))
+        flags, size = unpack_header(self.header, self.max_size)
+
+        # the buffer only grows, large messages are usually followed by other large messages
+        if size > len(self.buffer):
+            self.buffer = bytearray(size)
+
+        payload = memoryview(self.buffer)[:size]
+        self._read_into(payload)
+        return flags, decompress(flags, payload, self.max_size)
+
+
+async def read_frame(reader, max_size=None):
+    """Returns the flags and the payload of the next frame read from a `StreamReader`"""
+    header = await reader.readexactly(FRAME_HEADER.size)
+    flags, size = unpack_header(header, max_size)
+    return flags, decompress(flags, await reader.readexactly(size), max_size)
+
+
+def write_frame_async(writer, payload, flags=0, max_size=None, compression=None):
+    """Queue a frame on a `StreamWriter`, the header and the payload are not concatenated"""
+    if compression is not None:
+        check_size(len(payload), max_size)
+        payload, flags = compression.compress(payload, flags)
+
+    writer.writelines([pack_header(len(payload), flags, max_size), payload])
@@ -0,0 +1,202 @@
+"""Secondary indexes of the local storage.
+
+    Looking up the revisions of a trial or running a query used to check every object of the storage.
+    The index maps the values of a few trial attributes to the uids of the trials having them,
+    a query with an equality or ``$in`` term on one of those attributes only checks the matching trials.
+
+    ``group_id`` and ``status`` are always indexed, other attributes such as ``tags.worker`` or
+    ``parameters.lr`` can be declared with ``?index=tags.worker,parameters.lr`` or ``log.backend.indexes``.
+"""
+from collections import defaultdict
+
+from track.structure import status
+
+
+DEFAULT_INDEXES = ('group_id', 'status')
+
+# unhashable values cannot be indexed, trials holding one are returned by every lookup
+_UNHASHABLE = object()
+
+
+def _get_attribute(obj, attrs):
+    attribute = getattr(obj, attrs[0])
+
+    for key in attrs[1:]:
+        attribute = attribute.get(key)
+        if attribute is None:
+            return None
+
+    return attribute
+
+
+def _get_document_attribute(document, attrs):
+    """Read an attribute from the json document of a trial"""
+    attribute = document.get(attrs[0])
+
+    if attrs[0] == 'status' and isinstance(attribute, dict):
+        return status(name=attribute['name'], value=attribute['value'])
+
+    for key in attrs[1:]:
+        if not isinstance(attribute, dict):
+            return None
+
+        attribute = attribute.get(key)
+
+    return attribute
+
+
+def _index_key(attr, value):
+    if attr == 'status' and value is not None:
+        # Status and CustomStatus are compared by name
+        return str(value).lower()
+
+    try:
+        hash(value)
+    except TypeError:
+        return _UNHASHABLE
+
+    return value
+
+
+class StorageIndex:
+    """Keep track of the trials having a given attribute value
+
+    Parameters
+    ----------
+    attributes: List[str]
+        attributes to index on top of the default ones, nested attributes are separated by a dot
+    """
+
+    def __init__(self, attributes=None):
+        self.attributes = DEFAULT_INDEXES + tuple(a for a in attributes or () if a not in DEFAULT_INDEXES)
+        self._paths = [attr.split('.') for attr in self.attributes]
+        self.clear()
+
+    def clear(self):
+        # hash -> uid of its revisions, the dict keeps the insertion order
+        self._revisions = defaultdict(dict)
+        self._values = {attr: defaultdict(set) for attr in self.attributes}
+        # uid -> indexed keys of the trial
+        self._keys = dict()
+
+    def _trial_keys(self, trial):
+        keys = []
+
+        for attr, path in zip(self.attributes, self._paths):
+            try:
+                value = _get_attribute(trial, path)
+            except AttributeError:
+                value = None
+
+            keys.append(_index_key(attr, value))
+
+        return tuple(keys)
+
+    def insert(self, trial):
+        self._revisions[trial.hash][trial.uid] = None
+        self.update(trial)
+
+    def insert_document(self, document):
+        """Index a trial from its json document without building it"""
+        uid = document['uid']
+        self._revisions[document['hash']][uid] = None
+
+        keys = [_index_key(attr, _get_document_attribute(document, path))
+                for attr, path in zip(self.attributes, self._paths)]
+
+        self._set_keys(uid, tuple(keys))
+
+    def update(self, trial):
+        """Move the trial to the entries matching its current attributes"""
+        self._set_keys(trial.uid, self._trial_keys(trial))
+
+    def _set_keys(self, uid, keys):
+        old = self._keys.get(uid)
+
+        if old == keys:
+            return
+
+        for i, attr in enumerate(self.attributes):
+            values = self._values[attr]
+
+            if old is not None:
+                if old[i] is keys[i] or old[i] == keys[i]:
+                    continue
+
+                entry = values.get(old[i])
+                if entry is not None:
+                    entry.discard(uid)
+                    if not entry:
+                        del values[old[i]]
+
+            values[keys[i]].add(uid)
+
+        self._keys[uid] = keys
+
+    def revisions(self, trial_hash):
+        """Returns the uid of all the revisions of a trial"""
+        return list(self._revisions.get(trial_hash, ()))
+
+    def lookup(self, query):
+        """Returns the uids of the trials that can match the query, or None if no term of the query is indexed.
+        The trials still need to be checked against the query"""
+        if not query:
+            return None
+
+        items = query.items() if isinstance(query, dict) else query
+        result = None
+
+        for attr, condition in items:
+            uids = self._lookup_term(attr, condition)
+
+            if uids is None:
+                continue
+
+            result = uids if result is None else result & uids
+            if not result:
+                break
+
+        return result
+
+    def _lookup_term(self, attr, condition):
+        choices = [condition]
+        is_in = isinstance(condition, dict)
+
+        if is_in:
+            if len(condition) != 1:
+                return None
+
+            op, args = list(condition.items())[0]
+            if op != '$in' or not args:
+                return None
+
+            choices = list(args)
+
+        if attr == 'uid':
+            try:
+                return set(choices)
+            except TypeError:
+                return None
+
+        values = self._values.get(attr)
+        if values is None:
+            return None
+
+        keys = set()
+        for choice in choices:
+            key = _index_key(attr, choice)
+
+            if key is _UNHASHABLE:
+                return None
+
+            keys.add(key)
+
+        # `$in` compares the string representation of the attribute when given strings
+        if is_in and isinstance(choices[0], str) and attr != 'status':
+            keys.update(k for k in values if k is not _UNHASHABLE and str(k) in choices)
+
+        uids = set(values.get(_UNHASHABLE, ()))
+        for key in keys:
+            uids.update(values.get(key, ()))
+
+        return uids
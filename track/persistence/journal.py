@@ -0,0 +1,286 @@
+"""Append only journal for the file backend.
+
+    Instead of rewriting the whole storage file on every change, mutations are appended as
+    small json records to a log living next to the snapshot (``{snapshot}.journal``).
+    Readers load the snapshot and replay the records on top of it.
+
+    The first line of the journal is a header holding the `epoch` of the snapshot the records apply to.
+    Each time a full snapshot is written a new epoch is generated and the journal is reset,
+    a journal whose epoch does not match the snapshot was already compacted and is ignored.
+"""
+import os
+import uuid
+
+from track.structure import Project, Trial, TrialGroup, status
+from track.serialization import from_json
+from track.aggregators.aggregator import Aggregator
+from track.persistence.series import SidecarSeries, series_directory
+from track.persistence import codec
+from track.utils.log import warning
+
+
+def journal_path(path):
+    return f'{path}.journal'
+
+
+def new_epoch():
+    return uuid.uuid4().hex
+
+
+class Journal:
+    """Keep track of the position of a storage inside its journal and buffer the records that were not written yet
+
+    Parameters
+    ----------
+    path: str
+        location of the journal file
+
+    epoch: str
+        epoch of the snapshot the journal applies to
+    """
+
+    def __init__(self, path, epoch=None):
+        self.path = path
+        self.epoch = epoch
+        self.offset = 0
+        self.pending = []
+
+    @property
+    def size(self):
+        return self.offset
+
+    def record(self, op, **kwargs):
+        kwargs['op'] = op
+        self.pending.append(kwargs)
+
+    def reset(self, epoch):
+        """Start a new empty journal for the snapshot `epoch`"""
+        header = codec.dumps({'epoch': epoch}) + b'\n'
+
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'wb') as output:
+            output.write(header)
+
+        os.rename(tmp, self.path)
+        self.epoch = epoch
+        self.offset = len(header)
+        self.pending = []
+
+    def flush(self):
+        """Append the pending records at the end of the journal"""
+        if not self.pending:
+            return 0
+
+        data = b''.join(codec.dumps(r) + b'\n' for r in self.pending)
+
+        # drop partially written records left by a crashed writer
+        if os.path.getsize(self.path) != self.offset:
+            os.truncate(self.path, self.offset)
+
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+        finally:
+            os.close(fd)
+
+        self.offset += len(data)
+        self.pending = []
+        return len(data)
+
+    def _read_header(self, file):
+        line = file.readline()
+        if not line.endswith(b'\n'):
+            return None
+
+        return codec.loads(line).get('epoch')
+
+    def replay(self, storage):
+        """Apply the journal on top of a freshly loaded snapshot"""
+        self.offset = 0
+
+        if not os.path.exists(self.path):
+            return storage
+
+        with open(self.path, 'rb') as file:
+            epoch = self._read_header(file)
+
+            if epoch is None or epoch != storage.epoch:
+                # journal was already merged inside the snapshot
+                self.epoch = None
+                return storage
+
+            self.epoch = epoch
+            self.offset = file.tell()
+            self._apply(storage, file)
+
+        return storage
+
+    def catch_up(self, storage):
+        """Apply the records written by other processes since our last read.
+
+        Returns
+        -------
+        False if the journal was compacted, in that case the entire storage needs to be reloaded
+        """
+        if self.epoch is None:
+            return False
+
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return False
+
+        # nothing new was appended
+        if size == self.offset:
+            return True
+
+        with open(self.path, 'rb') as file:
+            if self._read_header(file) != self.epoch:
+                return False
+
+            file.seek(self.offset)
+            self._apply(storage, file)
+
+        return True
+
+    def _apply(self, storage, file):
+        data = file.read()
+        end = data.rfind(b'\n') + 1
+
+        for line in data[:end].splitlines():
+            apply_record(storage, codec.loads(line))
+
+        self.offset += end
+
+
+def _inc_trial(trial, record):
+    trial.metadata['_update_count'] = trial.metadata.get('_update_count', 0) + 1
+    trial.metadata['_last_change'] = record['time']
+
+
+def _insert(storage, record):
+    obj = from_json(record['object'])
+    storage._insert_object(obj)
+
+    if isinstance(obj, Project):
+        for trial in obj.trials:
+            storage._insert_object(trial)
+
+        for group in obj.groups:
+            storage._insert_object(group)
+
+    elif isinstance(obj, TrialGroup):
+        project = storage.objects.get(obj.project_id)
+        if project is not None:
+            project.groups.add(obj)
+
+    elif isinstance(obj, Trial):
+        project = storage.objects.get(obj.project_id)
+        if project is not None:
+            project.trials.add(obj)
+
+        group = storage.objects.get(obj.group_id)
+        if group is not None:
+            group.trials.add(obj.uid)
+
+
+def _log_metrics(storage, trial, record):
+    step = record['step']
+
+    # values were already appended to the sidecar by the writer
+    for k in record.get('series', ()):
+        if not isinstance(trial.metrics.get(k), SidecarSeries):
+            trial.metrics[k] = SidecarSeries(series_directory(storage.target_file), trial.uid, k)
+
+    for k, v in record['values'].items():
+        container = trial.metrics.get(k)
+
+        if container is None:
+            container = dict() if step is not None else list()
+            trial.metrics[k] = container
+
+        if isinstance(container, dict):
+            container[step] = v
+        elif isinstance(container, Aggregator):
+            container.append(v)
+        elif step:
+            container.append([step, v])
+        else:
+            container.append(v)
+
+
+def _set_status(storage, trial, record):
+    trial.status = status(**record['status'])
+
+    if record.get('error') is not None:
+        trial.errors.append(record['error'])
+
+
+def _add_project_trial(storage, record):
+    project = storage.objects.get(record['project'])
+    trial = storage.objects.get(record['trial'])
+
+    if project is not None and trial is not None:
+        trial.project_id = project.uid
+        project.trials.add(trial)
+
+
+def _add_group_trial(storage, record):
+    group = storage.objects.get(record['group'])
+    trial = storage.objects.get(record['trial'])
+
+    if group is not None and trial is not None:
+        trial.group_id = group.uid
+        group.trials.add(trial.uid)
+        storage.index.update(trial)
+
+
+def _set_group_metadata(storage, record):
+    group = storage.objects.get(record['uid'])
+
+    if group is not None:
+        group.metadata.update(record['values'])
+
+
+_trial_ops = {
+    'metrics': _log_metrics,
+    'metadata': lambda storage, trial, record: trial.metadata.update(record['values']),
+    'tags': lambda storage, trial, record: trial.tags.update(record['values']),
+    'parameters': lambda storage, trial, record: trial.parameters.update(record['values']),
+    'chrono': lambda storage, trial, record: trial.chronos.__setitem__(record['name'], from_json(record['value'])),
+    'status': _set_status,
+}
+
+_storage_ops = {
+    'insert': _insert,
+    'project_trial': _add_project_trial,
+    'group_trial': _add_group_trial,
+    'group_metadata': _set_group_metadata
+}
+
+
+def apply_record(storage, record):
+    """Replay a single journal record on a `LocalStorage`"""
+    op = record['op']
+
+    fun = _trial_ops.get(op)
+    if fun is not None:
+        trial = storage.objects.get(record['uid'])
+
+        if trial is None:
+            warning(f'Journal references an unknown (trial: {record["uid"]})')
+            return
+
+        fun(storage, trial, record)
+        _inc_trial(trial, record)
+        storage.index.update(trial)
+        return
+
+    fun = _storage_ops.get(op)
+    if fun is None:
+        raise RuntimeError(f'(op: {op}) is not understood')
+
+    fun(storage, record)
@@ -0,0 +1,91 @@
+"""Lazy loading of the trials of a storage file.
+
+    Building a :class:`~track.structure.Trial` is expensive, its chronos allocate shared values.
+    In lazy mode the trials are kept as their json document until they are accessed,
+    opening a large file to read a few trials only builds those trials.
+"""
+from track.serialization import from_json, to_json
+from track.persistence.series import bind_series
+
+
+class LazyObjects(dict):
+    """Objects of a storage, trials are kept as their json document and built on first access
+
+    Parameters
+    ----------
+    series: str
+        series directory of the storage, used to bind the sidecar series of the trials
+    """
+
+    def __init__(self, series=None):
+        super(LazyObjects, self).__init__()
+        self.series = series
+
+    def __getitem__(self, uid):
+        obj = super(LazyObjects, self).__getitem__(uid)
+
+        if isinstance(obj, dict):
+            obj = self._materialize(uid, obj)
+
+        return obj
+
+    def get(self, uid, default=None):
+        try:
+            return self[uid]
+        except KeyError:
+            return default
+
+    def values(self):
+        return [self[uid] for uid in self]
+
+    def items(self):
+        return [(uid, self[uid]) for uid in self]
+
+    def raw(self, uid):
+        """Returns the json document of the object if it was not built yet, the object otherwise"""
+        return super(LazyObjects, self).get(uid)
+
+    def is_loaded(self, uid):
+        return not isinstance(self.raw(uid), dict)
+
+    def _materialize(self, uid, document):
+        trial = bind_series(from_json(document), self.series)
+        self[uid] = trial
+
+        # replace the placeholder of the project by the trial
+        project = self.raw(trial.project_id)
+        if project is not None and not isinstance(project, dict):
+            project.trials.discard(trial)
+            project.trials.add(trial)
+
+        return trial
+
+
+class LazyTrial:
+    """Placeholder for a trial that was not built yet, it behaves like the trial once accessed"""
+    __slots__ = ('uid', 'objects')
+
+    def __init__(self, uid, objects: LazyObjects):
+        self.uid = uid
+        self.objects = objects
+
+    def __hash__(self):
+        return hash(self.uid)
+
+    def __eq__(self, other):
+        return hash(other) == hash(self.uid)
+
+    def __getattr__(self, name):
+        return getattr(self.objects[self.uid], name)
+
+    def to_json(self, short=False):
+        document = self.objects.raw(self.uid)
+
+        # save the trial without building it
+        if isinstance(document, dict) and not short:
+            return document
+
+        return to_json(self.objects[self.uid], short)
+
+    def __repr__(self):
+        return f'LazyTrial<{self.uid}>'
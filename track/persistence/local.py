@@ -1,8 +1,12 @@
 import time
 import logging
+import functools
+import traceback
+from contextlib import contextmanager
 from filelock import FileLock, logger as file_lock_logger
 from typing import Callable
-from threading import RLock
+from threading import RLock, Lock, Thread, Event, local
+from multiprocessing.util import Finalize
 
 from track.configuration import options
 from track.utils import ItemNotFound
@@ -10,8 +14,13 @@ from track.utils.signal import SignalHandler
 from track.utils.log import error, warning, debug
 
 from track.structure import Project, Trial, TrialGroup
+from track.serialization import to_json
 from track.persistence.protocol import Protocol
 from track.persistence.storage import load_database, LocalStorage
+from track.persistence.series import SidecarSeries, series_directory, is_series_compatible, series_references
+from track.persistence.query import compile_query
+# execute_query used to be defined here
+from track.persistence.query import execute_query  # noqa: F401
 from track.persistence.utils import parse_uri
 from track.containers.types import float32
 from track.aggregators.aggregator import Aggregator
@@ -61,9 +70,10 @@ class MultiLock:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.obj.thread_lock.release()
-        self.obj.lock.release()
+        # the depth is only valid while the lock is held
         self.obj.lock_guard_depth -= 1
+        self.obj.lock.release()
+        self.obj.thread_lock.release()
 
 
 def make_lock(name, eager):
@@ -82,20 +92,11 @@ def lock_guard(readonly, atomic=False):
     """Protect a function call with a lock. reload the database before the action and save it afterwards"""
 
     def lock_guard_decorator(fun):
+        @functools.wraps(fun)
         def _lock_guard(self, *args, **kwargs):
-            with MultiLock(self):
-                # only reload database if path is not none and the lock is not already owned
-                if self.path and self.eager and self.lock_guard_depth == 1:
-                    # debug(f'Reload database for `{fun.__name__}`')
-                    self.storage = load_database(self.path)
+            with self.transaction(readonly):
+                return fun(self, *args, **kwargs)
 
-                val = fun(self, *args, **kwargs)
-
-                if self.eager and not readonly:
-                    # debug(f'Save database for `{fun.__name__}`')
-                    self.commit()
-
-            return val
         return _lock_guard
     return lock_guard_decorator
 
@@ -105,13 +106,66 @@ lock_atomic_write = lock_guard(readonly=False, atomic=True)
 lock_read = lock_guard(readonly=True)
 
 
+def write_behind(fun):
+    """Buffer the call when write-behind is enabled, buffered calls are applied together on the next flush"""
+
+    @functools.wraps(fun)
+    def _write_behind(self, *args, **kwargs):
+        if not self.write_behind or self.lock_guard_depth > 0:
+            return fun(self, *args, **kwargs)
+
+        with self.buffer_lock:
+            if not self.buffer:
+                self.buffer_time = time.time()
+
+            self.buffer.append((fun, args, kwargs))
+            size = len(self.buffer)
+            age = time.time() - self.buffer_time
+
+        if size >= self.batch_size or (self.flush_interval and age >= self.flush_interval):
+            self.flush()
+        else:
+            self._start_flusher()
+
+    return _write_behind
+
+
+class _Flusher(Thread):
+    """Flush the buffered calls of a protocol at regular interval to bound the flush latency"""
+
+    def __init__(self, protocol, flush=None):
+        super(_Flusher, self).__init__(daemon=True)
+        self.protocol = protocol
+        self.flush = flush if flush is not None else protocol.flush
+        self.stopped = Event()
+
+    def run(self):
+        interval = self.protocol.flush_interval
+
+        while not self.stopped.wait(interval):
+            try:
+                if self.protocol.buffer and time.time() - self.protocol.buffer_time >= interval:
+                    self.flush()
+            except Exception:
+                error(traceback.format_exc())
+
+
 class LockFileRemover(SignalHandler):
-    def __init__(self, filename):
+    def __init__(self, filename, protocol=None):
         super(LockFileRemover, self).__init__()
         self.file_name = filename
+        self.protocol = protocol
 
     def remove(self):
         import os
+
+        # write the buffered calls before exiting
+        if self.protocol is not None:
+            try:
+                self.protocol.flush()
+            except Exception:
+                error(traceback.format_exc())
+
         if os.path.exists(self.file_name):
             os.remove(self.file_name)
 
@@ -141,11 +195,86 @@ class FileProtocol(Protocol):
     eager: bool
         eagerly update the underlying files. This is necessary if multiple processes are reading from the file
 
+    Notes
+    -----
+    Adding ``?journal=true`` to the uri (or setting ``log.backend.journal``) enables the journaled mode.
+    Instead of rewriting the entire file after each change, changes are appended to ``{file}.journal``.
+    The journal is merged back inside the main file when it grows larger than ``log.backend.journal_size`` bytes
+    or when :meth:`compact` is called.
+
+    Adding ``?series=sidecar`` (or setting ``log.backend.series``) saves numeric metrics inside binary files
+    next to the main file (see :mod:`track.persistence.series`), the main file only references them.
+
+    Adding ``?batch=100&flush_ms=500`` (or setting ``log.backend.batch_size`` and ``log.backend.flush_interval``)
+    enables the write-behind mode. Metrics, metadata, tags and arguments are buffered in memory and applied
+    to the file in a single lock acquisition every `batch` calls or every `flush_ms` milliseconds,
+    whichever comes first. Any other call, :meth:`commit` and exiting the process flush the buffer.
+
+    Trials are indexed by `group_id` and `status`, queries with an equality or `$in` term on an indexed attribute
+    only check the matching trials. More attributes can be indexed with ``?index=tags.worker,parameters.lr``
+    (or ``log.backend.indexes``), see :mod:`track.persistence.index`.
+
+    Adding ``?lazy=true`` (or setting ``log.backend.lazy``) keeps the trials as json documents when the file is loaded,
+    a trial is only built when it is accessed (see :mod:`track.persistence.lazy`).
+
+    Adding ``?format=ndjson`` (or setting ``log.backend.format``) saves one object per line instead of
+    a single json document. The file is then parsed one line at a time, which bounds the memory used to load it.
+    The format of an existing file is detected when it is loaded.
     """
 
     def __init__(self, uri, strict=True, eager=True):
         uri = parse_uri(uri)
+        query = uri.get('query', dict())
+        path = self._parse_path(uri)
 
+        # callbacks of `watch`
+        self.watchers = []
+        self.path = path
+        self.indexes = _as_list(query.get('index', options('log.backend.indexes', [])))
+        self.lazy = _as_bool(query.get('lazy', options('log.backend.lazy', False)))
+        self.format = query.get('format', options('log.backend.format', None))
+        self.storage: LocalStorage = self._load()
+        self.chronos = {}
+        self.strict = strict
+        self.eager = eager
+        self.signal_handler = LockFileRemover(f'{path}.lock', self)
+        self.lock = make_lock(f'{path}.lock', eager)
+        self.thread_state = local()
+        self.thread_lock = RLock()
+        self.dirty = False
+        self.journaled = _as_bool(query.get('journal', options('log.backend.journal', False)))
+        self.journal_size = int(query.get('journal_size', options('log.backend.journal_size', 16 * 1024 * 1024)))
+        self.sidecar = path is not None and query.get('series', options('log.backend.series', 'inline')) == 'sidecar'
+        # path -> (series, size of the file before the transaction)
+        self.series_writes = dict()
+
+        # Write-behind
+        self.batch_size = int(query.get('batch', options('log.backend.batch_size', 1)))
+        self.flush_interval = float(query.get('flush_ms', options('log.backend.flush_interval', 0))) / 1000
+        self.write_behind = bool(path) and eager and (self.batch_size > 1 or self.flush_interval > 0)
+        if self.write_behind and self.batch_size <= 1:
+            self.batch_size = float('inf')
+
+        self.buffer = []
+        self.buffer_time = 0
+        self.buffer_lock = Lock()
+        self.flusher = None
+
+        if self.write_behind:
+            # multiprocessing workers exit without running atexit
+            Finalize(None, self.flush, exitpriority=10)
+
+    @property
+    def lock_guard_depth(self):
+        """Number of nested transactions opened by the calling thread"""
+        return getattr(self.thread_state, 'depth', 0)
+
+    @lock_guard_depth.setter
+    def lock_guard_depth(self, depth):
+        self.thread_state.depth = depth
+
+    @staticmethod
+    def _parse_path(uri):
         # file:test.json
         path = uri.get('path')
 
@@ -153,15 +282,122 @@ class FileProtocol(Protocol):
             # file://test.json
             path = uri.get('address')
 
-        self.path = path
-        self.storage: LocalStorage = load_database(path)
-        self.chronos = {}
-        self.strict = strict
-        self.eager = eager
-        self.signal_handler = LockFileRemover(f'{path}.lock')
-        self.lock = make_lock(f'{path}.lock', eager)
-        self.lock_guard_depth = 0
-        self.thread_lock = RLock()
+        return path
+
+    def _load(self):
+        return load_database(self.path, self.indexes, self.lazy, self.format)
+
+    def watch(self, callback):
+        self.watchers.append(callback)
+        return True
+
+    def is_stale(self, uid=None):
+        if not self.path or not self.eager:
+            return False
+
+        return self.storage.is_stale()
+
+    def _changed(self, uid=None):
+        """Report the objects that were reloaded to the watchers"""
+        for callback in self.watchers:
+            callback(uid)
+
+    @contextmanager
+    def transaction(self, readonly=False):
+        """Group calls under a single lock acquisition, the database is reloaded once
+        at the start and saved once at the end"""
+        with MultiLock(self):
+            outermost = self.lock_guard_depth == 1
+
+            # only reload database if path is not none and the lock is not already owned
+            if self.path and self.eager and outermost:
+                self._refresh()
+
+            try:
+                if outermost and self.buffer:
+                    self._apply_buffer()
+
+                yield self
+
+            except Exception:
+                # the in-memory storage might be half modified, reload it next time
+                self.storage.invalidate()
+                if outermost:
+                    self.dirty = False
+                    self._rollback_series()
+                raise
+
+            if outermost:
+                self.series_writes = dict()
+
+            if not readonly:
+                self.dirty = True
+
+            if self.eager and outermost and self.dirty:
+                self.dirty = False
+                self.commit()
+
+    def _rollback_series(self):
+        """Remove the records appended to the sidecar series by a failed transaction"""
+        for series, size in self.series_writes.values():
+            series.truncate(size)
+
+        self.series_writes = dict()
+
+    def _apply_buffer(self):
+        with self.buffer_lock:
+            buffer, self.buffer = self.buffer, []
+
+        for fun, args, kwargs in buffer:
+            try:
+                fun(self, *args, **kwargs)
+            except Exception:
+                error(f'Buffered call (fun: {fun.__name__}) failed')
+                error(traceback.format_exc())
+
+        self.dirty = self.dirty or len(buffer) > 0
+
+    def flush(self):
+        """Apply the buffered calls"""
+        if not self.buffer:
+            return
+
+        with self.transaction():
+            self._apply_buffer()
+
+    def _start_flusher(self):
+        if self.flusher is None and self.flush_interval > 0:
+            self.flusher = _Flusher(self)
+            self.flusher.start()
+
+    def _refresh(self):
+        """Bring the in-memory storage up to date with the file.
+        The storage is only reloaded if the file was modified by someone else
+        """
+        storage = self.storage
+
+        if not storage.is_stale():
+            journal = storage.journal
+
+            # no journal to replay, we are up to date
+            if journal is None or journal.epoch is None:
+                return
+
+            if journal.catch_up(storage):
+                return
+
+        self.storage = self._load()
+        self._changed()
+
+    def _record(self, op, **kwargs):
+        """Save a change to the journal, the change is written to disk on commit"""
+        if not self.journaled or self.storage.journal is None:
+            return
+
+        kwargs['time'] = time.time()
+
+        with series_references():
+            self.storage.journal.record(op, **to_json(kwargs))
 
     def _inc_trial(self, trial):
         trial.metadata['_update_count'] = trial.metadata.get('_update_count', 0) + 1
@@ -177,6 +413,7 @@ class FileProtocol(Protocol):
 
         ntrial.chronos['runtime'] = acc
         self._inc_trial(ntrial)
+        self._record('chrono', uid=trial.uid, name='runtime', value=acc)
         return trial
 
     @lock_write
@@ -189,13 +426,17 @@ class FileProtocol(Protocol):
 
         ntrial.chronos['runtime'] = acc
         self._inc_trial(ntrial)
+        self._record('chrono', uid=trial.uid, name='runtime', value=acc)
 
+    @write_behind
     @lock_write
     def log_trial_metadata(self, trial: Trial, aggregator: Callable[[], Aggregator] = value_aggregator, **kwargs):
         trial = self.storage.objects.get(trial.uid)
 
         trial.metadata.update(kwargs)
         self._inc_trial(trial)
+        self.storage.index.update(trial)
+        self._record('metadata', uid=trial.uid, values=kwargs)
 
     @lock_write
     def log_trial_chrono_start(self, trial, name: str, aggregator: Callable[[], Aggregator] = StatAggregator.lazy(1),
@@ -211,6 +452,7 @@ class FileProtocol(Protocol):
         self.chronos[name] = time.time()
         ntrial.chronos[name] = agg
         self._inc_trial(ntrial)
+        self._record('chrono', uid=trial.uid, name=name, value=agg)
 
     @lock_write
     def log_trial_chrono_finish(self, trial, name, exc_type, exc_val, exc_tb):
@@ -222,10 +464,17 @@ class FileProtocol(Protocol):
 
         ntrial.chronos[name] = acc
         self._inc_trial(ntrial)
+        self._record('chrono', uid=trial.uid, name=name, value=acc)
 
+    @write_behind
     @lock_write
     def log_trial_metrics(self, trial: Trial, step: any = None, aggregator: Callable[[], Aggregator] = None, **kwargs):
         ntrial = self.storage.objects.get(trial.uid)
+
+        series = []
+        if self.sidecar:
+            series, kwargs = self._log_series(trial, ntrial, step, kwargs)
+
         for k, v in kwargs.items():
             container = trial.metrics.get(k)
 
@@ -242,18 +491,65 @@ class FileProtocol(Protocol):
 
         ntrial.metrics.update(trial.metrics)
         self._inc_trial(ntrial)
+        self._record('metrics', uid=trial.uid, step=step, values=kwargs, series=series)
+
+    def _log_series(self, trial, ntrial, step, values):
+        """Append the metrics to their sidecar series.
+
+        Returns
+        -------
+        the name of the metrics saved in a series and the metrics that need to be stored inline
+        """
+        saved = []
+        inline = dict()
 
+        for k, v in values.items():
+            series = ntrial.metrics.get(k)
+
+            if not isinstance(series, SidecarSeries):
+                if not is_series_compatible(step, v) or not _is_series_container(series):
+                    inline[k] = v
+                    continue
+
+                previous = series
+                series = SidecarSeries(series_directory(self.path), ntrial.uid, k)
+                self._track_series(series)
+
+                # the inline container holds the history, a file left by a failed transaction is outdated
+                series.remove()
+                if previous is not None:
+                    series.extend_container(previous)
+
+            self._track_series(series)
+            series.log(step, v)
+            ntrial.metrics[k] = series
+            trial.metrics[k] = series
+            saved.append(k)
+
+        return saved, inline
+
+    def _track_series(self, series):
+        """Remember the size of the series before its first write of the transaction"""
+        if series.path not in self.series_writes:
+            self.series_writes[series.path] = (series, series.size())
+
+    @write_behind
     @lock_write
     def add_trial_tags(self, trial, **kwargs):
         trial = self.storage.objects.get(trial.uid)
         trial.tags.update(kwargs)
         self._inc_trial(trial)
+        self.storage.index.update(trial)
+        self._record('tags', uid=trial.uid, values=kwargs)
 
+    @write_behind
     @lock_write
     def log_trial_arguments(self, trial, **kwargs):
         trial = self.storage.objects.get(trial.uid)
         trial.parameters.update(kwargs)
         self._inc_trial(trial)
+        self.storage.index.update(trial)
+        self._record('parameters', uid=trial.uid, values=kwargs)
 
     # Object Creation
     @lock_read
@@ -272,6 +568,7 @@ class FileProtocol(Protocol):
         self.storage.objects[project.uid] = project
         self.storage.project_names[project.name] = project.uid
         self.storage.projects.add(project.uid)
+        self._record('insert', object=project)
 
         return project
 
@@ -295,6 +592,7 @@ class FileProtocol(Protocol):
         self.storage.objects[group.uid] = group
         self.storage.groups.add(group.uid)
         self.storage.group_names[group.name] = group.uid
+        self._record('insert', object=group)
         return group
 
     @lock_read
@@ -302,11 +600,8 @@ class FileProtocol(Protocol):
         trials = []
 
         if trial.uid in self.storage.objects:
-            trial_hash = trial.hash
-
-            for k, obj in self.storage.objects.items():
-                if k.startswith(trial_hash):
-                    trials.append(obj)
+            for uid in self.storage.index.revisions(trial.hash):
+                trials.append(self.storage.objects[uid])
 
             return trials
         return None
@@ -330,8 +625,7 @@ class FileProtocol(Protocol):
             trial.revision = max_rev + 1
             trial._hash = None
 
-        self.storage.objects[trial.uid] = trial
-        self.storage.trials.add(trial.uid)
+        self.storage._insert_object(trial)
 
         if trial.project_id is not None:
             project = self.storage.objects.get(trial.project_id)
@@ -347,6 +641,7 @@ class FileProtocol(Protocol):
                 group.trials.add(trial.uid)
 
         trial.metadata['_update_count'] = 0
+        self._record('insert', object=trial)
         return trial
 
     @lock_write
@@ -355,6 +650,7 @@ class FileProtocol(Protocol):
 
         trial.project_id = project.uid
         project.trials.add(trial)
+        self._record('project_trial', project=project.uid, trial=trial.uid)
 
     @lock_write
     def add_group_trial(self, group, trial):
@@ -363,18 +659,60 @@ class FileProtocol(Protocol):
 
         trial.group_id = group.uid
         group.trials.add(trial.uid)
+        self.storage.index.update(trial)
+        self._record('group_trial', group=group.uid, trial=trial.uid)
 
     def commit(self, file_name_override=None, **kwargs):
+        if self.buffer and self.lock_guard_depth == 0:
+            # flushing commits the changes
+            self.flush()
+
+            if file_name_override is None:
+                return
+
         if self.path:
             with self.lock.acquire():
-                self.storage.commit(file_name_override=file_name_override, **kwargs)
+                if self.journaled and file_name_override is None:
+                    self._commit_journal()
+                else:
+                    self.storage.commit(file_name_override=file_name_override, **kwargs)
         else:
             warning('Path undefined!')
 
+    def _commit_journal(self):
+        journal = self.storage.journal
+
+        # the journal does not match the snapshot, write a fresh snapshot
+        if journal.epoch is None or journal.epoch != self.storage.epoch:
+            return self.storage.compact()
+
+        journal.flush()
+
+        if journal.size > self.journal_size:
+            debug(f'compacting journal ({journal.size} bytes)')
+            self.storage.compact()
+
+    def compact(self):
+        """Merge the journal back inside the main file"""
+        if self.path:
+            with self.transaction(readonly=True):
+                self.storage.compact()
+
     @lock_read
-    def _fetch_objects(self, objects, query, strict=False):
-        matching_objects = []
+    def _fetch_objects(self, objects, query, strict=False, index=None, limit=None):
+        query = compile_query(query, limit)
+
+        # only check the objects selected by the indexed terms of the query
+        candidates = index.lookup(query.query) if index is not None else None
+        query.index = None
+
+        if candidates is not None:
+            objects = [uid for uid in candidates if uid in objects]
+            query.index = {'candidates': len(objects)}
 
+        return query.filter(self._resolve_objects(objects, strict))
+
+    def _resolve_objects(self, objects, strict):
         for obj_id in objects:
             obj = self.storage.objects.get(obj_id)
 
@@ -386,16 +724,11 @@ class FileProtocol(Protocol):
                     warning(err)
                 continue
 
-            is_selected = execute_query(obj, query)
-
-            if is_selected:
-                matching_objects.append(obj)
-
-        return matching_objects
+            yield obj
 
     @lock_write
     def fetch_and_update_trial(self, query, attr, *args, **kwargs):
-        trials = self.fetch_trials(query)
+        trials = self.fetch_trials(query, limit=1)
 
         if len(trials) <= 0:
             raise ItemNotFound(f'Expected one or more trial got {len(trials)} trials with query `{query}`')
@@ -418,14 +751,17 @@ class FileProtocol(Protocol):
             trial.errors.append(str(error))
 
         self._inc_trial(trial)
+        self.storage.index.update(trial)
+        self._record('status', uid=trial.uid, status=status, error=str(error) if error is not None else None)
 
     @lock_write
     def set_group_metadata(self, group, *args, **kwargs):
         group.metadata.update(kwargs)
+        self._record('group_metadata', uid=group.uid, values=kwargs)
 
     @lock_write
     def fetch_and_update_group(self, query, attr, *args, **kwargs):
-        groups = self.fetch_groups(query)
+        groups = self.fetch_groups(query, limit=1)
 
         if len(groups) <= 0:
             raise ItemNotFound(f'Expected one or more group got {len(groups)} groups with query `{query}`')
@@ -439,102 +775,49 @@ class FileProtocol(Protocol):
         return groups[0]
 
     @lock_read
-    def fetch_trials(self, query=None):
-        return self._fetch_objects(self.storage.trials, query)
+    def fetch_trials(self, query=None, limit=None):
+        return self._fetch_objects(self.storage.trials, query, index=self.storage.index, limit=limit)
 
     @lock_read
-    def fetch_groups(self, query=None):
-        return self._fetch_objects(self.storage.groups, query)
+    def fetch_groups(self, query=None, limit=None):
+        return self._fetch_objects(self.storage.groups, query, limit=limit)
 
     @lock_read
-    def fetch_projects(self, query=None):
-        return self._fetch_objects(self.storage.projects, query)
-
-
-def _get_attribute(obj, attrs):
-    attribute = getattr(obj, attrs[0])
-
-    for key in attrs[1:]:
-        attribute = attribute.get(key)
-        if attribute is None:
-            return None
-
-    return attribute
+    def fetch_projects(self, query=None, limit=None):
+        return self._fetch_objects(self.storage.projects, query, limit=limit)
 
+    @lock_read
+    def explain(self, query, limit=None):
+        """Run a trial query and describe how it was evaluated, see :meth:`CompiledQuery.explain`"""
+        query = compile_query(query, limit)
+        self._fetch_objects(self.storage.trials, query, index=self.storage.index)
+        return query.explain()
 
-def execute_query(obj, query):
-    """Check if the object `obj` matches the query.
 
-    The query is a dictionary specifying constraint on each of the object attributes
-    """
-    if query is None:
+def _is_series_container(container):
+    """Check if an inline metric container can be moved inside a series"""
+    if container is None:
         return True
 
-    is_selected = True
-    # a query can be a dict of a list of conditions
-    # allowing a list enable users to make sure the conditions are executed in a specific order
-    # this can be used to speed up query. You can put the most strict condition first to reduce the number of checks
-    # we have to do to select a query
-    items = None
-    if isinstance(query, dict):
-        items = query.items()
-    else:
-        items = list(query)
-
-    for attrs, condition in items:
-        attrs = attrs.split('.')
-
-        if not hasattr(obj, attrs[0]):
-            raise RuntimeError(f'(obj: {type(obj)}) has no (attribute: {attrs[0]})')
-
-        # This is a complex query that needs to be further processed
-        if isinstance(condition, dict):
-            if len(condition) == 1:
-                fun_name, args = list(condition.items())[0]
-
-                fun = _query_fun.get(fun_name)
-                if fun is None:
-                    raise RuntimeError(f'(function: {fun_name}) is not understood')
-
-                is_selected &= fun(obj, attrs, args)
-
-            else:
-                raise RuntimeError(f'(query:  {query}) was not understood')
-
-        # this is a simple value
-        else:
-            is_selected &= _get_attribute(obj, attrs) == condition
-
-        # shortcut
-        if not is_selected:
-            return False
-
-    return is_selected
-
-
-def query_in(obj, attrs, choices):
-    cnv = lambda x: x
-    if isinstance(choices[0], str):
-        cnv = str
-    return cnv(_get_attribute(obj, attrs)) in choices
-
+    if isinstance(container, TimeSeriesAggregator):
+        container = container.val
 
-def query_ne(obj, attrs, val):
-    v = _get_attribute(obj, attrs)
-    return v != val
+    if isinstance(container, dict):
+        return all(is_series_compatible(float(k) if isinstance(k, str) else k, v) for k, v in container.items())
 
+    if isinstance(container, list):
+        return all(is_series_compatible(None, v) for v in container)
 
-def query_lte(obj, attrs, val):
-    return _get_attribute(obj, attrs) <= val
+    return False
 
 
-def query_gt(obj, attrs, val):
-    return _get_attribute(obj, attrs) > val
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
 
 
-_query_fun = {
-    '$in': query_in,
-    '$ne': query_ne,
-    '$lte': query_lte,
-    '$gt': query_gt
-}
+def _as_list(value):
+    if isinstance(value, str):
+        return [v for v in value.split(',') if v]
+    return list(value)
@@ -288,3 +288,18 @@ class Protocol:
     def fetch_projects(self, query):
         """Fetch projects according to a given query"""
         raise NotImplementedError()
+
+    def watch(self, callback) -> bool:
+        """Call `callback(uid)` when an object is reloaded because someone else modified it,
+        `uid` is None when every object was reloaded
+
+        Returns
+        -------
+        False if the protocol does not report the changes, the objects it returns should not be kept around
+        """
+        return False
+
+    def is_stale(self, uid=None) -> bool:
+        """Returns true if the object `uid` might have been modified by someone else since it was loaded,
+        the next call reloads it"""
+        return True
@@ -0,0 +1,296 @@
+"""Query engine of the local backends.
+
+    A query is a dictionary (or a list of pairs) of constraints on the attributes of the objects.
+    It is compiled once into a predicate which is then called on each object.
+
+    .. code-block:: python
+
+        query = compile_query({
+            'group_id': group.uid,
+            'status': {'$in': ['new', 'interrupted']},
+            '$or': [{'parameters.lr': {'$lt': 0.1}}, {'tags.worker': {'$exists': False}}]
+        })
+
+        trials = query.filter(objects, limit=10)
+        print(query.explain())
+
+    Supported operators are ``$in``, ``$nin``, ``$ne``, ``$lt``, ``$lte``, ``$gt``, ``$gte``, ``$exists``, ``$regex``
+    and ``$and``, ``$or`` to combine sub queries.
+    The terms of a dictionary are reordered so the most selective ones are checked first,
+    the terms of a list are checked in the given order.
+"""
+import re
+
+
+def _accessor(path):
+    """Compile a dotted attribute path into a getter"""
+    attrs = path.split('.')
+    name, keys = attrs[0], attrs[1:]
+
+    def get(obj):
+        try:
+            attribute = getattr(obj, name)
+        except AttributeError:
+            raise RuntimeError(f'(obj: {type(obj)}) has no (attribute: {name})')
+
+        for key in keys:
+            attribute = attribute.get(key)
+            if attribute is None:
+                return None
+
+        return attribute
+
+    return get
+
+
+def _exists_accessor(get):
+    def exists(obj):
+        try:
+            return get(obj) is not None
+        except RuntimeError:
+            return False
+
+    return exists
+
+
+def _membership(choices):
+    """Returns a converter and a container for `$in` and `$nin`, strings compare the string representation"""
+    choices = list(choices)
+
+    if choices and isinstance(choices[0], str):
+        try:
+            return str, frozenset(choices)
+        except TypeError:
+            return str, choices
+
+    return None, choices
+
+
+def _make_in(get, choices, negate=False):
+    cnv, choices = _membership(choices)
+
+    if cnv is None:
+        if negate:
+            return lambda obj: get(obj) not in choices
+        return lambda obj: get(obj) in choices
+
+    if negate:
+        return lambda obj: cnv(get(obj)) not in choices
+    return lambda obj: cnv(get(obj)) in choices
+
+
+def _make_regex(get, pattern):
+    pattern = re.compile(pattern)
+
+    def regex(obj):
+        value = get(obj)
+        return isinstance(value, str) and pattern.search(value) is not None
+
+    return regex
+
+
+def _make_exists(get, expected):
+    exists = _exists_accessor(get)
+    expected = bool(expected)
+    return lambda obj: exists(obj) is expected
+
+
+# operator: (estimated cost, predicate factory)
+# the cost is a rough estimate of how many objects pass the term, terms with a low cost are checked first
+_operators = {
+    '$eq': (0, lambda get, v: lambda obj: get(obj) == v),
+    '$in': (1, lambda get, v: _make_in(get, v)),
+    '$lt': (2, lambda get, v: lambda obj: get(obj) < v),
+    '$lte': (2, lambda get, v: lambda obj: get(obj) <= v),
+    '$gt': (2, lambda get, v: lambda obj: get(obj) > v),
+    '$gte': (2, lambda get, v: lambda obj: get(obj) >= v),
+    '$regex': (3, _make_regex),
+    '$exists': (4, _make_exists),
+    '$nin': (5, lambda get, v: _make_in(get, v, negate=True)),
+    '$ne': (5, lambda get, v: lambda obj: get(obj) != v),
+}
+
+
+class _Term:
+    """A single compiled constraint"""
+
+    def __init__(self, attribute, operator, value, cost, predicate, children=None):
+        self.attribute = attribute
+        self.operator = operator
+        self.value = value
+        self.cost = cost
+        self.predicate = predicate
+        self.children = children
+
+    def explain(self):
+        if self.children is not None:
+            return {
+                'operator': self.operator,
+                'cost': self.cost,
+                'terms': [[t.explain() for t in terms] for terms in self.children]
+            }
+
+        return {
+            'attribute': self.attribute,
+            'operator': self.operator,
+            'value': self.value,
+            'cost': self.cost
+        }
+
+
+def _all(predicates):
+    if len(predicates) == 1:
+        return predicates[0]
+
+    def conjunction(obj):
+        for predicate in predicates:
+            if not predicate(obj):
+                return False
+        return True
+
+    return conjunction
+
+
+def _any(predicates):
+    def disjunction(obj):
+        for predicate in predicates:
+            if predicate(obj):
+                return True
+        return False
+
+    return disjunction
+
+
+def _compile_terms(query):
+    if query is None:
+        return []
+
+    ordered = not isinstance(query, dict)
+    items = query.items() if not ordered else list(query)
+
+    terms = []
+    for attribute, condition in items:
+        terms.extend(_compile_term(attribute, condition))
+
+    # list queries let users decide the order of the checks
+    if not ordered:
+        terms.sort(key=lambda t: t.cost)
+
+    return terms
+
+
+def _compile_boolean(operator, queries):
+    if not isinstance(queries, (list, tuple)) or not queries:
+        raise RuntimeError(f'(operator: {operator}) expects a non empty list of queries')
+
+    children = [_compile_terms(q) for q in queries]
+    predicates = [_all([t.predicate for t in terms]) if terms else (lambda obj: True) for terms in children]
+
+    if operator == '$and':
+        costs = [min((t.cost for t in terms), default=5) for terms in children]
+        return _Term(None, operator, None, min(costs), _all(predicates), children)
+
+    costs = [max((t.cost for t in terms), default=5) for terms in children]
+    return _Term(None, operator, None, max(costs) + 1, _any(predicates), children)
+
+
+def _compile_term(attribute, condition):
+    if attribute in ('$and', '$or'):
+        return [_compile_boolean(attribute, condition)]
+
+    get = _accessor(attribute)
+
+    # this is a simple value
+    if not isinstance(condition, dict):
+        cost, factory = _operators['$eq']
+        return [_Term(attribute, '$eq', condition, cost, factory(get, condition))]
+
+    if not condition:
+        raise RuntimeError(f'(query: {attribute}: {condition}) was not understood')
+
+    terms = []
+    for operator, value in condition.items():
+        op = _operators.get(operator)
+
+        if op is None:
+            raise RuntimeError(f'(function: {operator}) is not understood')
+
+        cost, factory = op
+        terms.append(_Term(attribute, operator, value, cost, factory(get, value)))
+
+    return terms
+
+
+class CompiledQuery:
+    """Query compiled into a predicate
+
+    Parameters
+    ----------
+    query: Union[Dict, List[Tuple[str, any]]]
+        constraints on the attributes of the objects
+
+    limit: int
+        maximum number of objects returned by :meth:`filter`
+    """
+
+    def __init__(self, query, limit=None):
+        self.query = query
+        self.limit = limit
+        self.terms = _compile_terms(query)
+        self.predicate = _all([t.predicate for t in self.terms]) if self.terms else (lambda obj: True)
+        self.checked = 0
+        self.matched = 0
+        self.index = None
+
+    def __call__(self, obj):
+        return self.predicate(obj)
+
+    def filter(self, objects, limit=None):
+        """Returns the objects matching the query, stops after `limit` matches"""
+        limit = limit if limit is not None else self.limit
+        predicate = self.predicate
+        selected = []
+        checked = 0
+
+        if limit is None or limit > 0:
+            for obj in objects:
+                checked += 1
+
+                if predicate(obj):
+                    selected.append(obj)
+
+                    if limit is not None and len(selected) >= limit:
+                        break
+
+        self.checked = checked
+        self.matched = len(selected)
+        return selected
+
+    def explain(self):
+        """Describe how the query was evaluated, the terms are listed in the order they are checked"""
+        return {
+            'terms': [t.explain() for t in self.terms],
+            'limit': self.limit,
+            'index': self.index,
+            'checked': self.checked,
+            'matched': self.matched
+        }
+
+
+def compile_query(query, limit=None) -> CompiledQuery:
+    """Compile a query into a reusable predicate"""
+    if isinstance(query, CompiledQuery):
+        return query
+
+    return CompiledQuery(query, limit)
+
+
+def execute_query(obj, query):
+    """Check if the object `obj` matches the query.
+
+    The query is a dictionary specifying constraint on each of the object attributes
+    """
+    if query is None:
+        return True
+
+    return compile_query(query)(obj)
@@ -0,0 +1,279 @@
+"""Binary sidecar storage for the metric time series of the file backend.
+
+    Each metric of a trial is saved in its own file ``{snapshot}.series/{trial_uid}/{metric}.bin``.
+    The file starts with a small header followed by fixed width (step, value) records.
+
+    .. code-block:: text
+
+        header: magic (4s) | version (B) | flags (B) | name length (H) | name
+        record: step (d) | value (d)
+
+    The name is padded with zeros so the size of the header is a multiple of 16 bytes.
+    Records are only appended so writing a new value does not depend on the size of the history.
+    Readers map the file in memory and read the records in place.
+
+    Storage files only hold a reference to the series, ``{"dtype": "series", ...}``.
+    References are only written while the storage is saved (see :func:`series_references`),
+    everywhere else a series is converted to its values like an inline metric.
+"""
+import os
+import mmap
+import math
+import struct
+import threading
+from contextlib import contextmanager
+from numbers import Real
+from urllib.parse import quote
+
+from track.aggregators.aggregator import Aggregator
+
+
+MAGIC = b'TRKS'
+VERSION = 1
+KEYED = 0x01
+
+_header = struct.Struct('<4sBBH')
+_record = struct.Struct('<dd')
+
+
+_state = threading.local()
+
+
+@contextmanager
+def series_references():
+    """Convert the series to references to their file instead of their values, used to save the storage"""
+    previous = getattr(_state, 'references', False)
+    _state.references = True
+
+    try:
+        yield
+    finally:
+        _state.references = previous
+
+
+def series_directory(path):
+    return f'{path}.series'
+
+
+def is_series_compatible(step, value):
+    """Only real numbers can be saved inside a series"""
+    return isinstance(value, Real) and (step is None or isinstance(step, Real))
+
+
+def _header_size(name):
+    size = _header.size + len(name)
+    return size + (-size) % _record.size
+
+
+def _to_step(step):
+    if step.is_integer():
+        return int(step)
+    return step
+
+
+class SidecarSeries(Aggregator):
+    """Metric history saved inside a binary file
+
+    Parameters
+    ----------
+    directory: str
+        series directory of the storage
+
+    trial_uid: str
+        uid of the trial owning the metric
+
+    key: str
+        name of the metric
+
+    keyed: bool
+        true if the values are indexed by step
+    """
+
+    def __init__(self, directory, trial_uid, key, keyed=None):
+        self.directory = directory
+        self.trial_uid = trial_uid
+        self.key = key
+        self.path = f'{directory}/{trial_uid}/{quote(key, safe="")}.bin'
+        self._keyed = keyed
+        self._offset = None
+
+    def _create(self, keyed):
+        name = self.key.encode('utf8')
+        header = _header.pack(MAGIC, VERSION, KEYED if keyed else 0, len(name)) + name
+        header += b'\0' * (_header_size(name) - len(header))
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'wb') as file:
+            file.write(header)
+
+        os.rename(tmp, self.path)
+        self._keyed = keyed
+        self._offset = len(header)
+
+    def _read_header(self):
+        with open(self.path, 'rb') as file:
+            magic, version, flags, size = _header.unpack(file.read(_header.size))
+
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError(f'{self.path} is not a valid series file')
+
+        self._keyed = bool(flags & KEYED)
+        self._offset = _header_size(b'\0' * size)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def size(self):
+        """Returns the size of the file in bytes, None if it does not exist"""
+        if not self.exists():
+            return None
+        return os.path.getsize(self.path)
+
+    def truncate(self, size):
+        """Remove the records appended after the file had `size` bytes"""
+        if size is None:
+            self.remove()
+        elif self.exists():
+            os.truncate(self.path, size)
+
+    def remove(self):
+        if self.exists():
+            os.remove(self.path)
+
+        self._keyed = None
+        self._offset = None
+
+    @property
+    def keyed(self):
+        if self._keyed is None and self.exists():
+            self._read_header()
+        return self._keyed
+
+    def log(self, step, value):
+        """Append a single (step, value) record"""
+        self.extend([(step, value)])
+
+    def append(self, other):
+        self.log(None, other)
+
+    def extend(self, points):
+        """Append a list of (step, value) records in a single write"""
+        points = list(points)
+        if not points:
+            return
+
+        if not self.exists():
+            self._create(keyed=points[0][0] is not None)
+
+        data = b''.join(_record.pack(math.nan if s is None else s, v) for s, v in points)
+
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+
+    def extend_container(self, container):
+        """Move the values of an inline metric container (list or step dict) inside the series"""
+        if isinstance(container, dict):
+            self.extend((float(step), value) for step, value in container.items())
+
+        elif isinstance(container, Aggregator):
+            self.extend((None, value) for value in container.val)
+
+        else:
+            self.extend((None, value) for value in container)
+
+    def __len__(self):
+        if not self.exists():
+            return 0
+
+        if self._offset is None:
+            self._read_header()
+
+        return (os.path.getsize(self.path) - self._offset) // _record.size
+
+    def read(self, last=None):
+        """Read the records of the series
+
+        Parameters
+        ----------
+        last: int
+            only read the `last` records
+
+        Returns
+        -------
+        a list of steps and a list of values
+        """
+        count = len(self)
+        if count == 0:
+            return [], []
+
+        start = 0
+        if last is not None:
+            start = max(count - last, 0)
+
+        with open(self.path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                view = memoryview(buffer)[self._offset + start * _record.size: self._offset + count * _record.size]
+                doubles = view.cast('d')
+
+                try:
+                    steps = doubles[0::2].tolist()
+                    values = doubles[1::2].tolist()
+                finally:
+                    doubles.release()
+                    view.release()
+
+        return steps, values
+
+    def _format(self, steps, values):
+        if self.keyed:
+            return {_to_step(s): v for s, v in zip(steps, values)}
+        return values
+
+    @property
+    def val(self):
+        return self._format(*self.read())
+
+    def __getitem__(self, item):
+        return self.val[item]
+
+    def __iter__(self):
+        return iter(self.val)
+
+    def to_json(self, short=False):
+        if short:
+            return self._format(*self.read(last=20))
+
+        if getattr(_state, 'references', False):
+            return {
+                'dtype': 'series',
+                'key': self.key,
+                'keyed': self.keyed
+            }
+
+        return self.val
+
+    def __repr__(self):
+        return f'series<{self.path}, {len(self)}>'
+
+    def __str__(self):
+        return self.__repr__()
+
+
+def is_series_reference(value):
+    return isinstance(value, dict) and value.get('dtype') == 'series'
+
+
+def bind_series(trial, directory):
+    """Replace the series references found in the trial metrics by their sidecar"""
+    for key, value in trial.metrics.items():
+        if is_series_reference(value):
+            trial.metrics[key] = SidecarSeries(directory, trial.uid, key, value.get('keyed'))
+
+    return trial
@@ -3,7 +3,12 @@
     Implement a Remote Logger.
         Client forwards all the user's request down to the server that executes them one by one.
 
+    Each request carries an id (``__id__``) that the server sends back with its reply.
+    The client can have many requests in flight on the same connection, a reader thread receives the replies
+    and resolves the future of the matching request.
 
+    Messages are sent inside frames (see :mod:`track.persistence.framing`),
+    their format is negotiated during the authentication (see :mod:`track.persistence.wire`).
 """
 from track.utils.signal import SignalHandler
 from track.persistence.protocol import Protocol
@@ -12,48 +17,51 @@ from track.utils import open_socket, listen_socket
 from track.aggregators.aggregator import Aggregator, StatAggregator
 from track.structure import Trial, TrialGroup, Project
 from track.serialization import to_json, from_json
+from track.persistence import codec
+from track.persistence.framing import FrameReader, FrameError, max_frame_size, read_frame, write_frame
+from track.persistence.framing import write_frame_async, Compression
+from track.persistence.wire import JsonWire, make_wire, negotiate, offered_formats, decode
 from track.utils.log import error, warning, info
 from track.utils.throttle import throttle_repeated
 
+from track.persistence.local import _as_bool, _Flusher
+from track.configuration import options
+
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import count
+from multiprocessing.util import Finalize
+from threading import Thread, Lock, Condition
 from typing import Callable
 
+import functools
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
 import traceback
 import time
 import asyncio
-import json
-import struct
 
 
 def to_bytes(message) -> bytes:
-    return json.dumps(message).encode('utf8')
+    return codec.dumps(message)
 
 
 def to_obj(message: bytes) -> any:
-    return from_json(json.loads(message))
-
-
-def send(socket, msg):
-    bytes = to_bytes(msg)
-    size = bytearray(struct.pack('I', len(bytes) + 4))
-    socket.sendall(size + bytes)
-
+    return from_json(codec.loads(message))
 
-def recv(socket, timeout=None):
-    data = socket.recv(4096)
-    size = struct.unpack('I', data[0:4])[0]
 
-    elapsed = 0
-    while len(data) < size:
-        data += socket.recv(size)
+def send(socket, msg, max_size=None):
+    write_frame(socket, to_bytes(msg), max_size=max_size)
 
-        if len(data) == 0:
-            time.sleep(0.01)
-            elapsed += 0.01
 
-        if timeout and elapsed > timeout:
-            raise TimeoutError('Was not able to receive the entire message in time')
-
-    return to_obj(data[4:size])
+def recv(frames: FrameReader, wire=None):
+    flags, payload = frames.read()
+    return from_json(decode(wire, flags, payload))
 
 
 class RPCCallFailure(Exception):
@@ -69,22 +77,639 @@ def _check(result):
     return from_json(result['return'])
 
 
+class _ReplyReader(Thread):
+    """Receive the replies of the server on a connection and resolve the pending calls of the client"""
+
+    def __init__(self, client, frames):
+        super(_ReplyReader, self).__init__(daemon=True)
+        self.client = client
+        self.frames = frames
+
+    def run(self):
+        while True:
+            try:
+                # the format can change after the authentication
+                flags, payload = self.frames.read()
+                reply = from_json(decode(self.client.reply_wire, flags, payload))
+            except Exception as e:
+                self.client._connection_lost(e, self.frames.socket)
+                return
+
+            self.client._resolve(reply)
+
+
+class _ReplayBuffer:
+    """Calls made while the client is disconnected, they are replayed in order once it reconnects
+
+    Parameters
+    ----------
+    size: int
+        number of calls kept in memory
+
+    policy: str
+        what happens once `size` calls are waiting,
+        ``block`` the next calls wait for the client to reconnect,
+        ``drop`` the oldest calls are dropped and ``spill`` the oldest calls are written to `spill_path`
+
+    spill_path: str
+        file holding the spilled calls, a temporary file by default
+    """
+
+    def __init__(self, size=10000, policy='block', spill_path=None):
+        if policy not in ('block', 'drop', 'spill'):
+            raise ValueError(f'(policy: {policy}) is not supported, choose one of block, drop or spill')
+
+        self.size = size
+        self.policy = policy
+        self.lock = Lock()
+        self.room = Condition(self.lock)
+        self.dropped = 0
+        self.warn_dropped = throttle_repeated(warning, every=100)
+
+        # calls that were in flight when the connection was lost, they are older than the others
+        self.front = deque()
+        self.calls = deque()
+
+        # spilled calls are older than the calls in memory, their futures cannot be written
+        self.spill_path = spill_path
+        self.spill_file = None
+        self.spill_offset = 0
+        self.spilled = 0
+        self.spill_ids = count()
+        self.spill_futures = dict()
+
+    def __len__(self):
+        return len(self.front) + self.spilled + len(self.calls)
+
+    def push(self, calls, front=False):
+        """Queue a list of (kwargs, future), calls in `front` are replayed first"""
+        with self.lock:
+            if front:
+                self.front.extendleft(reversed(calls))
+                return
+
+            self.calls.extend(calls)
+            overflow = len(self.calls) - self.size
+
+            # blocking is done by `wait_for_room` before the calls are made
+            if overflow <= 0 or self.policy == 'block':
+                return
+
+            oldest = [self.calls.popleft() for _ in range(overflow)]
+
+            if self.policy == 'spill':
+                self._spill(oldest)
+            else:
+                self._drop(oldest)
+
+    def _drop(self, calls):
+        self.dropped += len(calls)
+        self.warn_dropped(f'Replay buffer is full, {self.dropped} calls were dropped')
+
+        for _, future in calls:
+            if future is not None:
+                future.set_exception(ConnectionError('The call was dropped from the replay buffer'))
+
+    def _spill(self, calls):
+        if self.spill_file is None:
+            if self.spill_path is None:
+                fd, self.spill_path = tempfile.mkstemp(prefix='track_replay_', suffix='.ndjson')
+                os.close(fd)
+
+            self.spill_file = open(self.spill_path, 'w+b')
+            self.spill_offset = 0
+
+        self.spill_file.seek(0, os.SEEK_END)
+
+        for kwargs, future in calls:
+            spill_id = next(self.spill_ids)
+
+            if future is not None:
+                self.spill_futures[spill_id] = future
+
+            self.spill_file.write(codec.dumps([spill_id, kwargs]) + b'\n')
+
+        self.spilled += len(calls)
+
+    def _unspill(self, calls, n):
+        self.spill_file.seek(self.spill_offset)
+
+        while self.spilled and len(calls) < n:
+            spill_id, kwargs = codec.loads(self.spill_file.readline())
+            calls.append((kwargs, self.spill_futures.pop(spill_id, None)))
+            self.spilled -= 1
+
+        self.spill_offset = self.spill_file.tell()
+
+        if not self.spilled:
+            self.close()
+
+    def take(self, n):
+        """Returns the next `n` calls to replay"""
+        with self.lock:
+            calls = []
+
+            while self.front and len(calls) < n:
+                calls.append(self.front.popleft())
+
+            if self.spilled and len(calls) < n:
+                self._unspill(calls, n)
+
+            while self.calls and len(calls) < n:
+                calls.append(self.calls.popleft())
+
+            self.room.notify_all()
+            return calls
+
+    def wait_for_room(self, connected):
+        """Block the caller while the buffer is full, if the policy is ``block``"""
+        if self.policy != 'block':
+            return
+
+        with self.room:
+            self.room.wait_for(lambda: connected() or len(self.calls) < self.size)
+
+    def notify(self):
+        with self.room:
+            self.room.notify_all()
+
+    def fail(self, exception):
+        """Drop every call, the calls waiting for their reply raise `exception`"""
+        while True:
+            calls = self.take(1024)
+
+            if not calls:
+                return
+
+            for _, future in calls:
+                if future is not None:
+                    future.set_exception(exception)
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+            os.remove(self.spill_path)
+
+
 class SocketClient(Protocol):
     """Forwards all the local track requests to the track server that execute the requests and send back the results
 
     Clients can provide a username and password for authentication
+
+    The client can be shared between threads, calls are sent as soon as they are made
+    and each call waits for its own reply.
+
+    Adding ``?async=true`` to the uri (or setting ``log.backend.async``) makes logging calls
+    (metrics, metadata, arguments and tags) fire-and-forget, they return without waiting for the server.
+    Their errors are raised by the next call that waits for a reply or by :meth:`flush`.
+
+    Adding ``?batch=64&batch_bytes=65536&flush_ms=5`` (or setting ``log.backend.batch_size``,
+    ``log.backend.batch_bytes`` and ``log.backend.flush_interval``) coalesces the logging calls.
+    They are buffered like fire-and-forget calls and sent together inside a single ``batch`` request
+    once the window holds `batch` calls, `batch_bytes` bytes or is `flush_ms` milliseconds old.
+    Any other call closes the window and is sent with it.
+
+    Adding ``?format=msgpack`` (or setting ``log.backend.format``) sends the messages as msgpack
+    if the server supports it, by default (``auto``) msgpack is used when it is installed.
+
+    Adding ``?compression=zlib&compress_above=65536`` (or setting ``log.backend.compression``
+    and ``log.backend.compress_above``) compresses the messages larger than `compress_above` bytes,
+    in both directions. ``lzma`` is slower but compresses more, ``compression_level`` sets the level.
+
+    Adding ``?reconnect=true`` (or setting ``log.backend.reconnect``) reconnects the client when the connection
+    is lost, waiting ``reconnect_delay`` seconds then twice as long after each failure, up to ``reconnect_max_delay``.
+    The client gives up after ``reconnect_timeout`` seconds, it never gives up by default.
+    The calls made while disconnected and the calls that did not get their reply are replayed in order,
+    a call executed by the server whose reply was lost is executed twice.
+    Up to ``replay_size`` calls are kept in memory, ``replay_policy`` chooses what happens to the next calls
+    (``block``, ``drop`` the oldest calls or ``spill`` them to ``spill_path``), see :class:`_ReplayBuffer`.
     """
 
     # socket://[username:password@]host1[:port1][,...hostN[:portN]]][/[database][?options]]
     def __init__(self, uri):
         uri = parse_uri(uri)
+        query = uri['query']
         self.username = uri.get('username')
         self.password = uri.get('password')
-        self.security_layer = uri['query'].get('security_layer')
-        self.socket = open_socket(uri.get('address'), int(uri.get('port')), backend=self.security_layer)
-
-        self.token = self._authenticate(uri)
+        self.security_layer = query.get('security_layer')
+        self.fire_and_forget = _as_bool(query.get('async', options('log.backend.async', False)))
+        self.uri = uri
+        self.address, self.port = uri.get('address'), int(uri.get('port'))
+        self.socket = None
+        self.frames = None
+        self.max_frame = max_frame_size(query.get('max_frame'))
+        self.formats = offered_formats(query.get('format', options('log.backend.format', 'auto')))
+        # messages are encoded with `wire` and the replies decoded with `reply_wire`
+        self.wire = JsonWire()
+        self.reply_wire = self.wire
+        self.compression = None
+        self.compression_name = query.get('compression', options('log.backend.compression', None))
+        self.compress_above = int(query.get('compress_above', options('log.backend.compress_above', 64 * 1024)))
+        self.compression_level = query.get('compression_level', options('log.backend.compression_level', None))
+
+        # request id -> future of the call, or the list of futures of a batch
+        # calls that do not wait for their reply have no future
+        self.request_ids = count()
+        self.pending = dict()
+        self.pending_lock = Lock()
+        self.idle = Condition(self.pending_lock)
+        self.send_lock = Lock()
+        self.async_errors = []
+        self.closed = None
+        self.reader = None
+
+        # Coalescing window
+        self.batch_size = int(query.get('batch', options('log.backend.batch_size', 1)))
+        self.batch_bytes = int(query.get('batch_bytes', options('log.backend.batch_bytes', 64 * 1024)))
+        self.flush_interval = float(query.get('flush_ms', options('log.backend.flush_interval', 0))) / 1000
+        self.coalesce = self.batch_size > 1 or self.flush_interval > 0
+        if self.coalesce and self.batch_size <= 1:
+            self.batch_size = float('inf')
+
+        self.buffer = []
+        self.buffer_size = 0
+        self.buffer_time = 0
+        self.buffer_lock = Lock()
+        self.flusher = None
+
+        if self.coalesce:
+            Finalize(None, self.flush, exitpriority=10)
+
+        # Reconnection
+        # request id -> calls that did not get their reply, they are replayed if the connection is lost
+        self.unacked = dict()
+        self.connected = False
+        self.generation = 0
+        self.reconnector = None
+        self.replay = None
+        self.reconnect_delay = float(query.get('reconnect_delay', options('log.backend.reconnect_delay', 0.1)))
+        self.reconnect_max_delay = float(
+            query.get('reconnect_max_delay', options('log.backend.reconnect_max_delay', 30)))
+        self.reconnect_timeout = query.get('reconnect_timeout', options('log.backend.reconnect_timeout', None))
+        if self.reconnect_timeout is not None:
+            self.reconnect_timeout = float(self.reconnect_timeout)
+
+        self.token = self._connect()
         info(f'token: {self.token}')
+        self._use_wire(self.reply_wire)
+        self.connected = True
+
+        if _as_bool(query.get('reconnect', options('log.backend.reconnect', False))):
+            self.replay = _ReplayBuffer(
+                int(query.get('replay_size', options('log.backend.replay_size', 10000))),
+                query.get('replay_policy', options('log.backend.replay_policy', 'block')),
+                query.get('spill_path', options('log.backend.spill_path', None)))
+
+    def _connect(self):
+        """Open a connection to the server and authenticate, returns the token of the server"""
+        previous = self.socket
+        self.socket = open_socket(self.address, self.port, backend=self.security_layer)
+        self.frames = FrameReader(self.socket, self.max_frame)
+        self.compression = None
+        self.reader = _ReplyReader(self, self.frames)
+        self.reader.start()
+
+        if previous is not None:
+            previous.close()
+
+        return self._authenticate(self.uri)
+
+    def _use_wire(self, wire):
+        """Encode the messages with `wire`, the buffered calls are encoded again"""
+        with self.buffer_lock:
+            self.wire = wire
+            self.buffer = [(wire.dumps(kwargs), future, kwargs) for _, future, kwargs in self.buffer]
+            self.buffer_size = sum(len(data) for data, _, _ in self.buffer)
+
+    def _call(self, kwargs, wait=True, raw=False, direct=False):
+        """Send a request, wait for its reply if `wait` is true.
+        The buffered calls are sent first, in the same batch.
+        `direct` calls are sent alone, even if the client is reconnecting, and are never replayed"""
+        if self.closed is not None:
+            raise self.closed
+
+        if not direct:
+            self._wait_for_replay()
+
+        future = Future() if wait else None
+
+        with self.send_lock:
+            # messages must be encoded in the order they are sent, see `MsgPackWire`
+            with self.buffer_lock:
+                calls = self._take_buffer() if not direct else []
+
+                if not calls:
+                    request_id = next(self.request_ids)
+                    kwargs['__id__'] = request_id
+
+                data = self.wire.dumps(kwargs)
+
+            if calls:
+                calls.append((data, future, kwargs))
+                self._send_batch(calls)
+            elif direct:
+                self._send_frame(request_id, data, future)
+            else:
+                self._send_frame(request_id, data, future, [kwargs])
+
+        if not wait:
+            return None
+
+        reply = future.result()
+
+        # the server executes the requests in order, fire-and-forget calls made before this one are done
+        self._raise_async_errors()
+
+        if raw:
+            return reply
+
+        return _check(reply)
+
+    def _log(self, kwargs):
+        """Send a logging call, logging calls are coalesced or fire-and-forget if enabled"""
+        if not self.coalesce:
+            return self._call(kwargs, wait=not self.fire_and_forget)
+
+        if self.closed is not None:
+            raise self.closed
+
+        self._wait_for_replay()
+
+        with self.buffer_lock:
+            data = self.wire.dumps(kwargs)
+
+            if not self.buffer:
+                self.buffer_time = time.time()
+
+            self.buffer.append((data, None, kwargs))
+            self.buffer_size += len(data)
+
+            full = len(self.buffer) >= self.batch_size or self.buffer_size >= self.batch_bytes
+            age = time.time() - self.buffer_time
+
+        if full or (self.flush_interval and age >= self.flush_interval):
+            self._send_buffer()
+        else:
+            self._start_flusher()
+
+        return None
+
+    def _take_buffer(self):
+        """Returns the buffered calls, must be called with the buffer lock"""
+        calls, self.buffer = self.buffer, []
+        self.buffer_size = 0
+        return calls
+
+    def _send_buffer(self):
+        with self.send_lock:
+            with self.buffer_lock:
+                calls = self._take_buffer()
+
+            if calls:
+                self._send_batch(calls)
+
+    def _send_batch(self, calls, replaying=False):
+        """Send encoded calls inside a single batch request, must be called with the send lock"""
+        request_id = next(self.request_ids)
+        message = self.wire.batch(request_id, [data for data, _, _ in calls])
+        self._send_frame(
+            request_id, message, [future for _, future, _ in calls], [kwargs for _, _, kwargs in calls], replaying)
+
+    def _send_frame(self, request_id, data, futures, calls=None, replaying=False):
+        """Register the pending call and send its frame, must be called with the send lock.
+        The `calls` of the frame are replayed if the connection is lost, while the client reconnects
+        they are queued instead of being sent"""
+        if self.replay is not None and calls is not None and not self.connected and not replaying:
+            if not isinstance(futures, list):
+                futures = [futures]
+
+            self.replay.push(list(zip(calls, futures)))
+            return
+
+        with self.pending_lock:
+            self.pending[request_id] = futures
+
+            if self.replay is not None and calls is not None:
+                self.unacked[request_id] = calls
+
+        try:
+            write_frame(self.socket, data, self.wire.flags, max_size=self.max_frame, compression=self.compression)
+
+        except Exception as e:
+            if self.replay is not None and calls is not None and isinstance(e, OSError):
+                # the reader sees the connection is closed and queues the calls to be replayed
+                self._shutdown(self.socket)
+                return
+
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+                self.unacked.pop(request_id, None)
+            raise
+
+    def _start_flusher(self):
+        if self.flusher is None and self.flush_interval > 0:
+            self.flusher = _Flusher(self, self._send_buffer)
+            self.flusher.start()
+
+    def _resolve(self, reply):
+        request_id = reply.pop('__id__', None)
+
+        with self.pending_lock:
+            if request_id is None:
+                # message that could not be read by the server, it replies in order
+                request_id = next(iter(self.pending), None)
+
+            futures = self.pending.pop(request_id, None)
+            self.unacked.pop(request_id, None)
+
+            if isinstance(futures, list):
+                # the batch itself failed, every call gets the error
+                replies = reply['return'] if reply.get('status') == 0 else [reply] * len(futures)
+            else:
+                futures, replies = [futures], [reply]
+
+            for future, call_reply in zip(futures, replies):
+                if future is None and call_reply.get('status', 0) != 0:
+                    error(f'RPC failed with error {call_reply.get("error")}')
+                    self.async_errors.append(call_reply)
+
+            if not self.pending:
+                self.idle.notify_all()
+
+        for future, call_reply in zip(futures, replies):
+            if future is not None:
+                future.set_result(call_reply)
+
+    def _fail_pending(self, exception):
+        with self.pending_lock:
+            self.closed = exception
+            pending, self.pending = self.pending, dict()
+            self.unacked = dict()
+            self.idle.notify_all()
+
+        for futures in pending.values():
+            if not isinstance(futures, list):
+                futures = [futures]
+
+            for future in futures:
+                if future is not None:
+                    future.set_exception(exception)
+
+        if self.replay is not None:
+            self.replay.notify()
+
+    @staticmethod
+    def _shutdown(sckt):
+        """Stop the transfers of a socket, the threads using it get an error"""
+        try:
+            sckt.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _connection_lost(self, exception, sckt):
+        """Called by the reader of a connection when it stops, the calls without reply are queued to be replayed"""
+        if self.replay is None or not isinstance(exception, OSError) or self.closed is not None:
+            return self._fail_pending(exception)
+
+        # wake up the threads that are sending on this connection
+        self._shutdown(sckt)
+        failed = []
+
+        with self.send_lock:
+            with self.pending_lock:
+                pending, self.pending = self.pending, dict()
+                unacked, self.unacked = self.unacked, dict()
+                self.connected = False
+                self.generation += 1
+
+            # the messages of the next connection are encoded once it is ready, see `_replay`
+            with self.buffer_lock:
+                self.wire = JsonWire()
+
+            calls = []
+            for request_id in sorted(pending):
+                futures = pending[request_id]
+
+                if not isinstance(futures, list):
+                    futures = [futures]
+
+                if request_id in unacked:
+                    calls.extend(zip(unacked[request_id], futures))
+                else:
+                    # authentication of a new connection
+                    failed.extend(futures)
+
+            self.replay.push(calls, front=True)
+
+            if self.reconnector is None:
+                warning(f'Lost the connection to the server ({exception}), reconnecting')
+                self.reconnector = Thread(target=self._reconnect, daemon=True)
+                self.reconnector.start()
+
+        for future in failed:
+            if future is not None:
+                future.set_exception(exception)
+
+    def _reconnect(self):
+        """Reconnect to the server with an exponential backoff then replay the calls"""
+        delay = self.reconnect_delay
+        start = time.time()
+
+        while True:
+            generation = self.generation
+
+            try:
+                self._connect()
+
+                if self._replay(generation):
+                    return
+
+                exception = ConnectionError('Connection lost while replaying the calls')
+
+            except OSError as e:
+                exception = e
+
+            except RPCCallFailure as e:
+                return self._give_up(e)
+
+            if self.reconnect_timeout is not None and time.time() - start > self.reconnect_timeout:
+                return self._give_up(exception)
+
+            info(f'Could not reconnect to the server ({exception}), retrying in {delay:.2f} s')
+            time.sleep(delay * random.uniform(0.5, 1))
+            delay = min(delay * 2, self.reconnect_max_delay)
+
+    def _replay(self, generation, batch=64):
+        """Send the queued calls in order, returns false if the connection was lost in the meantime"""
+        while True:
+            with self.send_lock:
+                if self.generation != generation:
+                    return False
+
+                calls = self.replay.take(batch)
+
+                if not calls:
+                    self._use_wire(self.reply_wire)
+                    self.connected = True
+                    self.reconnector = None
+                    break
+
+                with self.buffer_lock:
+                    for kwargs, _ in calls:
+                        # calls sent alone had the id of their request
+                        kwargs.pop('__id__', None)
+
+                    calls = [(self.wire.dumps(kwargs), future, kwargs) for kwargs, future in calls]
+
+                self._send_batch(calls, replaying=True)
+
+        info('Reconnected to the server')
+        self.replay.notify()
+
+        with self.idle:
+            self.idle.notify_all()
+
+        return True
+
+    def _give_up(self, exception):
+        warning(f'Could not reconnect to the server: {exception}')
+
+        with self.send_lock:
+            with self.pending_lock:
+                self.closed = ConnectionError(f'Could not reconnect to the server: {exception}')
+                self.reconnector = None
+                self.idle.notify_all()
+
+        self.replay.fail(self.closed)
+        self.replay.notify()
+
+    def _wait_for_replay(self):
+        if self.replay is not None and not self.connected:
+            self.replay.wait_for_room(lambda: self.connected or self.closed is not None)
+
+    def _is_idle(self):
+        return not self.pending and (self.replay is None or not len(self.replay) or self.closed is not None)
+
+    def _raise_async_errors(self):
+        if not self.async_errors:
+            return
+
+        with self.pending_lock:
+            errors, self.async_errors = self.async_errors, []
+
+        if errors:
+            raise RPCCallFailure(errors[0]['error'], errors[0].get('trace'))
+
+    def flush(self, timeout=None):
+        """Send the buffered calls, wait for the replies of the calls in flight
+        and raise the errors of the fire-and-forget calls"""
+        self._send_buffer()
+
+        with self.idle:
+            self.idle.wait_for(self._is_idle, timeout)
+
+        self._raise_async_errors()
 
     def authenticate(self, uri):
         """returns the username and password used for authentication purposes
@@ -100,9 +725,25 @@ class SocketClient(Protocol):
         kwargs['__rpc__'] = 'authenticate'
         kwargs['username'] = username
         kwargs['password'] = password
+        kwargs['formats'] = self.formats
+
+        if self.compression_name not in (None, 'none'):
+            # fail before connecting if the compression does not exist
+            Compression(self.compression_name)
+            kwargs['compression'] = self.compression_name
+            kwargs['compress_above'] = self.compress_above
+
+        reply = self._call(kwargs, raw=True, direct=True)
+        token = _check(reply)
+
+        # the server replies with the format of the following messages
+        # the client uses it once the calls made before are sent
+        self.reply_wire = make_wire(reply['format']) if reply.get('format') is not None else JsonWire()
 
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        if reply.get('compression') is not None:
+            self.compression = Compression(reply['compression'], self.compress_above, self.compression_level)
+
+        return token
 
     def log_trial_chrono_start(self, trial, name: str, aggregator: Callable[[], Aggregator] = StatAggregator.lazy(1),
                                start_callback=None,
@@ -111,8 +752,7 @@ class SocketClient(Protocol):
         kwargs['__rpc__'] = 'log_trial_chrono_start'
         kwargs['trial'] = trial.uid
         kwargs['name'] = name
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
     def log_trial_chrono_finish(self, trial, name, exc_type, exc_val, exc_tb):
         kwargs = dict()
@@ -122,15 +762,13 @@ class SocketClient(Protocol):
         kwargs['exc_type'] = None
         kwargs['exc_val'] = None
         kwargs['exc_tb'] = None
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
     def log_trial_start(self, trial):
         kwargs = dict()
         kwargs['__rpc__'] = 'log_trial_start'
         kwargs['trial'] = trial.uid
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
     def log_trial_finish(self, trial, exc_type, exc_val, exc_tb):
         kwargs = dict()
@@ -139,27 +777,23 @@ class SocketClient(Protocol):
         kwargs['exc_type'] = None
         kwargs['exc_val'] = None
         kwargs['exc_tb'] = None
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
     def log_trial_arguments(self, trial: Trial, **kwargs):
         kwargs['__rpc__'] = 'log_trial_arguments'
         kwargs['trial'] = trial.uid
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._log(kwargs)
 
     def log_trial_metadata(self, trial: Trial, aggregator: Callable[[], Aggregator] = None, **kwargs):
         kwargs['__rpc__'] = 'log_trial_metadata'
         kwargs['trial'] = trial.uid
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._log(kwargs)
 
     def log_trial_metrics(self, trial: Trial, step: any = None, aggregator: Callable[[], Aggregator] = None, **kwargs):
         kwargs['__rpc__'] = 'log_trial_metrics'
         kwargs['trial'] = trial.uid
         kwargs['step'] = step
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._log(kwargs)
 
     def set_trial_status(self, trial: Trial, status, error=None):
         kwargs = dict()
@@ -167,14 +801,12 @@ class SocketClient(Protocol):
         kwargs['trial'] = trial.uid
         kwargs['status'] = to_json(status)
 
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
     def add_trial_tags(self, trial, **kwargs):
         kwargs['__rpc__'] = 'add_trial_tags'
         kwargs['trial'] = trial.uid
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._log(kwargs)
 
     # Object Creation
     def get_project(self, project: Project):
@@ -183,8 +815,7 @@ class SocketClient(Protocol):
         kwargs['project'] = to_json(project)
 
         info(kwargs)
-        send(self.socket, kwargs)
-        p = _check(recv(self.socket))
+        p = self._call(kwargs)
 
         info(f'got reply {p}')
         return p
@@ -193,86 +824,197 @@ class SocketClient(Protocol):
         kwargs = dict()
         kwargs['__rpc__'] = 'new_project'
         kwargs['project'] = to_json(project)
-        send(self.socket, kwargs)
-        p = _check(recv(self.socket))
+        p = self._call(kwargs)
         return p
 
     def get_trial_group(self, group: TrialGroup):
         kwargs = dict()
         kwargs['__rpc__'] = 'get_trial_group'
         kwargs['group'] = to_json(group)
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
     def new_trial_group(self, group: TrialGroup):
         kwargs = dict()
         kwargs['__rpc__'] = 'new_trial_group'
         kwargs['group'] = to_json(group)
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
     def add_project_trial(self, project: Project, trial: Trial):
         kwargs = dict()
         kwargs['__rpc__'] = 'add_project_trial'
         kwargs['project'] = to_json(project)
         kwargs['trial'] = to_json(trial)
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
     def add_group_trial(self, group: TrialGroup, trial: Trial):
         kwargs = dict()
         kwargs['__rpc__'] = 'add_group_trial'
         kwargs['group'] = to_json(group)
         kwargs['trial'] = to_json(trial)
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
     def commit(self, **kwargs):
         kwargs['__rpc__'] = 'commit'
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
     def get_trial(self, trial: Trial):
         kwargs = dict()
-        kwargs['__rpc__'] = 'get_trail'
+        kwargs['__rpc__'] = 'get_trial'
         kwargs['trial'] = to_json(trial)
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
     def new_trial(self, trial: Trial):
         kwargs = dict()
         kwargs['__rpc__'] = 'new_trial'
         kwargs['trial'] = to_json(trial)
-        send(self.socket, kwargs)
-        return _check(recv(self.socket))
+        return self._call(kwargs)
 
 
-async def read(reader, timeout=None):
-    data = await (reader.read(4096))
+async def read(reader, timeout=None, max_size=None, wire=None):
+    try:
+        flags, data = await asyncio.wait_for(read_frame(reader, max_size), timeout)
 
-    if not data:
+    except asyncio.IncompleteReadError:
         return None
 
-    size = struct.unpack('I', data[0:4])[0]
+    except asyncio.TimeoutError:
+        raise TimeoutError('Was not able to receive the entire message in time')
+
+    return from_json(decode(wire, flags, data))
+
+
+def write(writer, msg, request_id=None, max_size=None, wire=None, compression=None):
+    if request_id is not None:
+        msg['__id__'] = request_id
+
+    if wire is None:
+        write_frame_async(writer, to_bytes(msg), max_size=max_size, compression=compression)
+    else:
+        write_frame_async(writer, wire.dumps(msg), wire.flags, max_size=max_size, compression=compression)
+
+
+class _KeyedLocks:
+    """FIFO locks created on demand for each key and dropped once nobody uses them"""
+
+    def __init__(self):
+        self.locks = dict()
+        self.users = dict()
+
+    async def acquire(self, key):
+        lock = self.locks.get(key)
+
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+            self.users[key] = 0
+
+        self.users[key] += 1
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._drop(key)
+            raise
+
+    def release(self, key):
+        self.locks[key].release()
+        self._drop(key)
+
+    def _drop(self, key):
+        self.users[key] -= 1
+
+        if not self.users[key]:
+            self.locks.pop(key)
+            self.users.pop(key)
+
+
+_worker_server = None
+
+
+def _worker_execute(cls, uri, proc_name, args):
+    """Execute a request inside a worker process, each worker opens its own backend"""
+    global _worker_server
 
-    elapsed = 0
-    while len(data) < size:
-        data += await reader.read(4096)
+    if _worker_server is None:
+        _worker_server = cls(uri)
 
-        if len(data) == 0:
-            time.sleep(0.01)
-            elapsed += 0.01
+    return _worker_server.execute(None, proc_name, args)
+
+
+def shutdown_executor(executor):
+    """Stop an executor without waiting for the calls in flight"""
+    # the pool forgets its processes on shutdown
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+
+    # cancel_futures is python 3.9+
+    if sys.version_info >= (3, 9):
+        executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        executor.shutdown(wait=False)
+
+    # worker processes would keep the server alive
+    for process in processes:
+        process.terminate()
+
+
+class _ObjectCache:
+    """Least recently used objects resolved by the server, keyed by (kind, id)
+
+    The backend reports the objects it reloads (see :meth:`Protocol.watch`), they are removed from the cache.
+    Objects fetched while the cache was invalidated are not added, they could be from before the reload.
+    Objects modified by someone else are fetched again (see :meth:`Protocol.is_stale`), fetching them reloads them.
+    """
 
-        if timeout and elapsed > timeout:
-            raise TimeoutError('Was not able to receive the entire message in time')
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.objects = OrderedDict()
+        self.lock = Lock()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
 
-    return to_obj(data[4:])
+    def get(self, key):
+        with self.lock:
+            obj = self.objects.get(key)
 
+            if obj is None:
+                self.misses += 1
+                return None
 
-def write(writer, msg):
-    bytes = to_bytes(msg)
-    size = bytearray(struct.pack('I', len(bytes) + 4))
-    writer.write(size + bytes)
+            self.hits += 1
+            self.objects.move_to_end(key)
+            return obj
+
+    def put(self, key, obj, version):
+        with self.lock:
+            if getattr(obj, 'uid', None) is None or version != self.version or self.capacity <= 0:
+                return
+
+            self.objects[key] = obj
+            self.objects.move_to_end(key)
+
+            while len(self.objects) > self.capacity:
+                self.objects.popitem(last=False)
+
+    def invalidate(self, uid=None):
+        """Remove the object `uid` or every object if `uid` is None"""
+        with self.lock:
+            self.version += 1
+
+            if uid is None:
+                self.objects.clear()
+                return
+
+            for key in [key for key, obj in self.objects.items() if obj.uid == uid]:
+                del self.objects[key]
+
+
+def _request_key(args):
+    """Returns the uid of the trial targeted by a request"""
+    trial = args.get('trial')
+
+    if isinstance(trial, dict):
+        return trial.get('uid')
+
+    return trial
 
 
 class SocketServer(Protocol):
@@ -284,21 +1026,53 @@ class SocketServer(Protocol):
            socket://{hostname}:{port}?security_layer={}&backend={protocol} with
 
        Users inherit this class to implement their own custom authentication
+
+       Notes
+       -----
+       The backend calls are executed by a pool of threads so a slow call does not stop the event loop.
+       ``?workers=8`` (or ``log.backend.server_workers``) sets the size of the pool and ``?executor=process``
+       (or ``log.backend.server_executor``) uses processes instead, each process opens its own backend.
+
+       Calls on the same trial are executed in the order they were received.
+       Calls that do not target a trial wait for the calls in flight of their client and are executed alone.
+
+       Clients that do not send anything for ``?timeout=600`` seconds (or ``log.backend.idle_timeout``)
+       are disconnected.
+
+       The trials, groups and projects targeted by the calls are kept in a cache of ``?cache=1024`` objects
+       (or ``log.backend.server_cache``) so they are not fetched from the backend on each call.
+       The cache is only used with backends that report the objects they reload, see :meth:`Protocol.watch`.
     """
 
     def __init__(self, uri):
         from track.persistence import get_protocol
 
+        self.uri = uri
         uri = parse_uri(uri)
+        query = uri['query']
         self.address, self.port = uri.get('address'), int(uri.get('port'))
-        self.security_layer = uri['query'].get('security_layer')
+        self.security_layer = query.get('security_layer')
+        self.max_frame = max_frame_size(query.get('max_frame'))
+        self.workers = int(query.get('workers', options('log.backend.server_workers', 8)))
+        self.executor_type = query.get('executor', options('log.backend.server_executor', 'thread'))
+
+        self.backend = get_protocol(query.get('backend'))
+        self.object_cache = _ObjectCache(int(query.get('cache', options('log.backend.server_cache', 1024))))
+
+        if not self.backend.watch(self.object_cache.invalidate):
+            self.object_cache.capacity = 0
 
-        self.backend = get_protocol(uri['query'].get('backend'))
         self.authentication = {}
-        self.timeout = 10
+        self.timeout = float(query.get('timeout', options('log.backend.idle_timeout', 600)))
         self.client_cache = {}
         self.sckt = None
         self.loop = None
+        self.executor = None
+        self.trial_locks = _KeyedLocks()
+        # writer -> negotiated format and compression of the client
+        self.wires = {}
+        self.compressions = {}
+        self.compression_level = query.get('compression_level', options('log.backend.compression_level', None))
 
     def authenticate(self, reader, username, password):
         """User defined authentication function
@@ -323,14 +1097,60 @@ class SocketServer(Protocol):
     # https://stackoverflow.com/questions/48506460/python-simple-socket-client-server-using-asyncio
     def run_server(self):
         info(f'Server listening to {self.address}:{self.port}')
-        self.sckt = listen_socket(self.address, self.port, backend=self.security_layer)
+        # the AES layer is applied on the streams of each client, see `accept_client`
+        backend = self.security_layer if self.security_layer != 'AES' else None
+        self.sckt = listen_socket(self.address, self.port, backend=backend)
+
+        self.executor = self.make_executor()
 
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
+        self.loop = loop
+
         loop.create_task(asyncio.start_server(self.handle_client, sock=self.sckt))
-        loop.run_forever()
+        try:
+            loop.run_forever()
+        finally:
+            shutdown_executor(self.executor)
 
-        self.loop = loop
+    def make_executor(self):
+        if self.executor_type == 'process':
+            kwargs = dict()
+
+            # the server has threads running, forking it could copy a held lock
+            if sys.version_info >= (3, 7):
+                kwargs['mp_context'] = multiprocessing.get_context('spawn')
+
+            return ProcessPoolExecutor(self.workers, **kwargs)
+
+        return ThreadPoolExecutor(self.workers, thread_name_prefix='track_server')
+
+    def resolve(self, kind, key, fetch):
+        """Returns the object `key` from the cache, fetch it from the backend if it is not there"""
+        obj = self.object_cache.get((kind, key))
+
+        # the backend reloads the object on the next call, the cached object would be outdated
+        if obj is not None and self.backend.is_stale(obj.uid):
+            obj = None
+
+        if obj is None:
+            version = self.object_cache.version
+            obj = fetch(key)
+            self.object_cache.put((kind, key), obj, version)
+
+        return obj
+
+    def fetch_trial(self, uid):
+        hashid, rev = uid.split('_')
+        rev = int(rev)
+
+        v = self.backend.get_trial(Trial(_hash=hashid, revision=rev))
+        for i in v:
+            if i.revision == rev:
+                return i
+
+        warning('Was not able to find the correct trial revision')
+        return v
 
     def process_args(self, args, cache=None):
         """ replace ids by their object reference so the backend modifies the objects and not a copy"""
@@ -340,28 +1160,19 @@ class SocketServer(Protocol):
         for k, v in args.items():
             if k == 'trial':
                 if isinstance(v, str):
-                    hashid, rev = v.split('_')
-                    rev = int(rev)
-
-                    v = self.backend.get_trial(Trial(_hash=hashid, revision=rev))
-                    for i in v:
-                        if i.revision == rev:
-                            v = i
-                            break
-                    else:
-                        warning('Was not able to find the correct trial revision')
+                    v = self.resolve('trial', v, self.fetch_trial)
 
                 v = from_json(v)
 
             elif k == 'project':
                 if isinstance(v, str):
-                    v = self.backend.get_project(Project(name=v))
+                    v = self.resolve('project', v, lambda name: self.backend.get_project(Project(name=name)))
 
                 v = from_json(v)
 
             elif k == 'group':
                 if isinstance(v, str):
-                    v = self.backend.get_trial_group(TrialGroup(_uid=v))
+                    v = self.resolve('group', v, lambda uid: self.backend.get_trial_group(TrialGroup(_uid=uid)))
 
                 v = from_json(v)
 
@@ -369,26 +1180,107 @@ class SocketServer(Protocol):
 
         return new_args
 
-    def exec(self, reader, writer, proc_name, proc, args, cache=None):
+    def exec(self, reader, writer, proc_name, proc, args, cache=None, request_id=None):
+        self.reply(writer, proc_name, self.apply(reader, proc_name, proc, args), request_id)
+
+    def reply(self, writer, proc_name, reply, request_id=None):
+        wire = self.wires.get(writer)
+
+        try:
+            write(writer, reply, request_id, self.max_frame, wire, self.compressions.get(writer))
+
+        # the reply is too large or cannot be encoded
+        except (FrameError, TypeError, ValueError, OverflowError) as e:
+            error(f'Could not send the reply of (rpc: {proc_name}): {e}')
+            write(writer, {
+                'status': 1,
+                'error': str(e)
+            }, request_id, wire=wire)
+
+    def apply(self, reader, proc_name, proc, args):
+        """Execute a procedure and returns its reply"""
         try:
             new_args = self.process_args(args)
             answer = proc(**new_args)
 
-            write(writer, {
+            return {
                 'status': 0,
                 'return': to_json(answer)
-            })
+            }
             # info(f'returned: {answer}')
 
         except Exception as e:
             error(f'An exception occurred while processing (rpc: {proc_name}) '
-                  f'for user {self.get_username(reader)[0]}')
+                  f'for (user: {self.get_username(reader)})')
 
             error(traceback.format_exc())
-            write(writer, {
+            return {
                 'status': 1,
                 'error': str(e)
-            })
+            }
+
+    def batch(self, reader, calls):
+        """Execute a list of calls in order and returns the reply of each call.
+        The calls are executed inside a single transaction of the backend if it supports it
+        so a file backend is locked and saved once for the entire batch"""
+        transaction = getattr(self.backend, 'transaction', None)
+
+        with transaction() if transaction is not None else nullcontext():
+            return [self.apply_call(reader, call) for call in calls]
+
+    def execute(self, reader, proc_name, args):
+        """Execute a request and returns its reply, this is called by the executor"""
+        if proc_name == 'batch':
+            return self.apply(reader, proc_name, functools.partial(self.batch, reader), args)
+
+        return self.apply_call(reader, dict(args, __rpc__=proc_name))
+
+    async def dispatch(self, reader, writer, proc_name, args, request_id=None):
+        """Execute a request inside the executor and send its reply"""
+        if self.executor_type == 'process':
+            call = functools.partial(_worker_execute, type(self), self.uri, proc_name, args)
+        else:
+            call = functools.partial(self.execute, reader, proc_name, args)
+
+        key = _request_key(args)
+
+        if key is not None:
+            await self.trial_locks.acquire(key)
+
+        try:
+            reply = await self.loop.run_in_executor(self.executor, call)
+
+        except Exception as e:
+            # the executor itself failed, e.g. a worker process died
+            error(f'Could not execute (rpc: {proc_name}) for (user: {self.get_username(reader)})')
+            error(traceback.format_exc())
+            reply = {
+                'status': 1,
+                'error': str(e)
+            }
+
+        finally:
+            if key is not None:
+                self.trial_locks.release(key)
+
+        self.reply(writer, proc_name, reply, request_id)
+        await writer.drain()
+
+    def apply_call(self, reader, call):
+        proc_name = call.pop('__rpc__', None)
+        attr = None
+
+        if proc_name not in (None, 'batch', 'authenticate'):
+            attr = getattr(self.backend, proc_name, None)
+
+        if attr is None:
+            error(f'{type(self.backend).__name__} does not implement (rpc: {proc_name})')
+            return {
+                'status': 1,
+                'error': f'{type(self.backend).__name__} does not implement (rpc: {proc_name})'
+            }
+
+        return self.apply(reader, proc_name, attr, call)
 
     @staticmethod
     async def wait_closed(writer):
@@ -404,31 +1296,59 @@ class SocketServer(Protocol):
         writer.close()
         await SocketServer.wait_closed(writer)
 
+    async def accept_client(self, reader, writer):
+        """Initialize the security layer of a client, returns its reader and writer"""
+        if self.security_layer != 'AES':
+            return reader, writer
+
+        from track.utils.encrypted import accept_stream
+
+        stream = await asyncio.wait_for(accept_stream(reader, writer), self.timeout)
+        return stream, stream
+
     async def handle_client(self, reader, writer):
         info('Client Connected')
 
+        try:
+            reader, writer = await self.accept_client(reader, writer)
+
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+            warning(f'Could not initialize the security layer of the client: {e}')
+            writer.close()
+            return
+
         running = True
         count = 0
-        sleep_time = 0
-        cache = {}
+        wire = self.wires[writer] = JsonWire()
         info_proc = throttle_repeated(info, every=10)
 
+        # calls on trials are executed concurrently, ordered by trial
+        in_flight = set()
+
         while running:
-            request = await read(reader)
+            try:
+                request = await read(reader, timeout=self.timeout, max_size=self.max_frame, wire=wire)
+
+            except TimeoutError:
+                info(f'Client (user: {self.get_username(reader)}) is timing out')
+                request = None
+
+            except FrameError as e:
+                # the rest of the stream cannot be trusted
+                error(f'Could not read the message of (user: {self.get_username(reader)}): {e}')
+                write(writer, {
+                    'status': 1,
+                    'error': str(e)
+                }, wire=wire)
+                request = None
+
             count += 1
 
             if request is None:
-                time.sleep(0.01)
-                sleep_time += 0.01
-
-                if sleep_time > self.timeout:
-                    info(f'Client (user: {self.get_username(reader)}) is timing out')
-                    await self.close_connection(writer)
-                    self.authentication.pop(reader, None)
-                    return None
-                continue
+                break
 
             proc_name = request.pop('__rpc__', None)
+            request_id = request.pop('__id__', None)
             info_proc(f'Processing Request: {proc_name} for (user: {self.get_username(reader)})')
 
             if proc_name is None:
@@ -436,38 +1356,73 @@ class SocketServer(Protocol):
                 write(writer, {
                     'status': 1,
                     'error': f'Could not process message (rpc: {request})'
-                })
-                continue
+                }, request_id, wire=wire)
 
             elif proc_name == 'authenticate':
+                formats = request.pop('formats', None)
+                compression = self.negotiate_compression(request.pop('compression', None), request)
                 request['reader'] = reader
-                self.exec(reader, writer, proc_name, self.authenticate, request, cache=cache)
-                continue
+                reply = self.apply(reader, proc_name, self.authenticate, request)
+
+                if formats is not None and reply['status'] == 0:
+                    reply['format'] = negotiate(formats)
+
+                if compression is not None and reply['status'] == 0:
+                    reply['compression'] = compression.name
+
+                self.reply(writer, proc_name, reply, request_id)
+
+                # the following messages use the negotiated format
+                if reply.get('format') is not None:
+                    wire = self.wires[writer] = make_wire(reply['format'])
+
+                if reply.get('compression') is not None:
+                    self.compressions[writer] = compression
 
             elif not self.is_authenticated(reader):
                 error(f'Client is not authenticated cannot execute (proc: {proc_name})')
                 write(writer, {
                     'status': 1,
                     'error': f'Client is not authenticated cannot execute (proc: {proc_name})'
-                })
-                continue
+                }, request_id, wire=wire)
 
-            # Forward request to backend
-            attr = getattr(self.backend, proc_name)
+            elif proc_name != 'batch' and _request_key(request) is not None:
+                task = self.loop.create_task(self.dispatch(reader, writer, proc_name, request, request_id))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
 
-            if attr is None:
-                error(f'{self.backend.__name__} does not implement (rpc: {proc_name})')
-                write(writer, {
-                    'status': 1,
-                    'error': f'{self.backend.__name__} does not implement (rpc: {proc_name})'
-                })
-                continue
+            else:
+                # the call can depend on any previous call
+                if in_flight:
+                    await asyncio.wait(set(in_flight))
 
-            self.exec(reader, writer, proc_name, attr, request, cache=cache)
+                await self.dispatch(reader, writer, proc_name, request, request_id)
 
-            sleep_time = 0
+            # pipelined clients can send requests faster than we reply
+            await writer.drain()
 
+        if in_flight:
+            await asyncio.wait(set(in_flight))
+
+        info(f'Client (user: {self.get_username(reader)}) disconnected')
+        await self.close_connection(writer)
         self.authentication.pop(reader, None)
+        self.wires.pop(writer, None)
+        self.compressions.pop(writer, None)
+
+    def negotiate_compression(self, name, request):
+        """Returns the compression of the replies asked by the client, None if it is not supported"""
+        threshold = request.pop('compress_above', None)
+
+        if name is None:
+            return None
+
+        try:
+            return Compression(name, threshold or 64 * 1024, self.compression_level)
+
+        except (ValueError, TypeError) as e:
+            warning(f'Replies are not compressed: {e}')
+            return None
 
     def get_username(self, reader):
         usr_pwd = self.authentication.get(reader)
@@ -483,7 +1438,11 @@ class SocketServer(Protocol):
         self.backend.commit(**kwargs)
 
     def close(self):
-        if self.loop is not None:
+        if self.executor is not None:
+            shutdown_executor(self.executor)
+
+        # the loop is stopped by exiting the process
+        if self.loop is not None and not self.loop.is_running():
             self.loop.close()
 
         if self.sckt is not None:
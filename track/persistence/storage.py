@@ -1,6 +1,6 @@
 import os
-import json
-from dataclasses import dataclass, field
+import re
+from dataclasses import dataclass, field, replace
 from typing import Dict, Set
 import tempfile
 from uuid import UUID
@@ -9,9 +9,42 @@ from track.utils.log import error, warning, debug
 from track.structure import Project, Trial, TrialGroup
 from track.serialization import from_json, to_json
 from track.aggregators.aggregator import StatAggregator
+from track.persistence.journal import Journal, journal_path, new_epoch
+from track.persistence.series import bind_series, series_directory, series_references
+from track.persistence.index import StorageIndex
+from track.persistence.lazy import LazyObjects, LazyTrial
+from track.persistence import codec
 
 
 _print_warning_once = set()
+_generation_header = re.compile(rb'^\{\s*"generation":\s*(\d+)')
+
+
+def file_stamp(file_name=None, fd=None):
+    """Cheap fingerprint of a file used to detect if it was modified by another process"""
+    try:
+        if fd is not None:
+            stat = os.fstat(fd)
+        else:
+            stat = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def read_generation(file_name):
+    """Read the generation counter from the header of a storage file without parsing the entire file"""
+    try:
+        with open(file_name, 'rb') as file:
+            match = _generation_header.match(file.read(64))
+    except FileNotFoundError:
+        return None
+
+    if match is None:
+        return None
+
+    return int(match.group(1))
 
 
 @dataclass
@@ -29,6 +62,23 @@ class LocalStorage:
 
     _old_rev_tags: Dict[str, int] = field(default_factory=dict)
 
+    # Journal
+    epoch: str = None
+    journal: Journal = None
+
+    # Change detection
+    generation: int = None
+    stamp: tuple = None
+
+    # Secondary indexes on trials
+    index: StorageIndex = field(default_factory=StorageIndex)
+
+    # Trials are built on first access
+    lazy: bool = False
+
+    # `json` or `ndjson`
+    file_format: str = 'json'
+
     def get_previous_version_tag(self, obj):
         return self._old_rev_tags.get(obj.uid, 0)
 
@@ -39,6 +89,21 @@ class LocalStorage:
             print(obj)
         return None
 
+    def is_stale(self):
+        """Returns true if the storage file was modified since we last read or wrote it"""
+        if self.stamp is None or self.target_file is None:
+            return True
+
+        if file_stamp(self.target_file) != self.stamp:
+            return True
+
+        # files without header have no generation, each commit renames a new file so the stamp is enough
+        return read_generation(self.target_file) != self.generation
+
+    def invalidate(self):
+        """Force the next refresh to reload the storage from the file"""
+        self.stamp = None
+
     @property
     def objects(self) -> Dict[UUID, any]:
         return self._objects
@@ -64,7 +129,15 @@ class LocalStorage:
     def group_names(self) -> Dict[str, UUID]:
         return self._group_names
 
-    def commit(self, file_name_override=None, **kwargs):
+    def commit(self, file_name_override=None, journaled=False, **kwargs):
+        """Save the storage to its file
+
+        Parameters
+        ----------
+        journaled: bool
+            save the snapshot with the header the journal needs, ``{"generation", "epoch", "projects"}``.
+            Other json snapshots keep the list of projects layout that older versions can read.
+        """
         if file_name_override is None:
             file_name_override = self.target_file
 
@@ -72,16 +145,24 @@ class LocalStorage:
             debug('No output file target')
             return None
 
-        # only save top level projects
-        objects = []
-        for uid in self._projects:
-            objects.append(to_json(self._objects[uid]))
-            # print(json.dumps(objects[-1], indent=2))
-
+        header = journaled or self.file_format == 'ndjson'
+        epoch = new_epoch() if header else None
+        generation = (self.generation or 0) + 1 if header else None
         fd, file_name = tempfile.mkstemp(prefix='track_uncommitted_', dir=os.getcwd())
 
-        with os.fdopen(fd, 'w') as output:
-            json.dump(objects, output, indent=2)
+        with os.fdopen(fd, 'wb') as output, series_references():
+            if self.file_format == 'ndjson':
+                self._write_ndjson(output, generation, epoch)
+            else:
+                # only save top level projects
+                objects = []
+                for uid in self._projects:
+                    objects.append(to_json(self._objects[uid]))
+
+                if header:
+                    objects = {'generation': generation, 'epoch': epoch, 'projects': objects}
+
+                output.write(codec.dumps(objects))
 
         output.close()
 
@@ -89,17 +170,55 @@ class LocalStorage:
         os.rename(file_name, file_name_override)
         # shutil.move(file_name, file_name_override)
 
+        # the snapshot now holds every change, start a new journal
+        if file_name_override == self.target_file:
+            self.epoch = epoch
+            self.generation = generation
+            self.stamp = file_stamp(file_name_override)
+
+            if self.journal is not None and (self.journal.epoch is not None or os.path.exists(self.journal.path)):
+                self.journal.reset(epoch)
+
+    def _write_ndjson(self, output, generation, epoch):
+        """Write one object per line so the file can be loaded one object at a time"""
+        output.write(codec.dumps({'generation': generation, 'epoch': epoch, 'format': 'ndjson'}) + b'\n')
+
+        for uid in self._projects:
+            project = self._objects[uid]
+
+            # trials follow their project on their own line
+            output.write(codec.dumps(to_json(replace(project, trials=set()))) + b'\n')
+
+            for trial in project.trials:
+                output.write(codec.dumps(to_json(trial)) + b'\n')
+
+    def compact(self):
+        """Merge the journal inside the snapshot"""
+        if self.journal is None:
+            self.journal = Journal(journal_path(self.target_file))
+
+        self.journal.pending = []
+        self.commit(journaled=True)
+
+        if self.journal.epoch != self.epoch:
+            self.journal.reset(self.epoch)
+
     def _insert_object(self, obj):
         self._objects[obj.uid] = obj
 
         if isinstance(obj, Trial):
             self._trials.add(obj.uid)
+            self.index.insert(obj)
 
         elif isinstance(obj, TrialGroup):
             self._groups.add(obj.uid)
+            if obj.name is not None:
+                self._group_names[obj.name] = obj.uid
 
         elif isinstance(obj, Project):
             self._projects.add(obj.uid)
+            if obj.name is not None:
+                self._project_names[obj.name] = obj.uid
 
     def _update_object(self, obj, new):
         if isinstance(obj, Trial):
@@ -130,6 +249,8 @@ class LocalStorage:
                 else:
                     chrono.update(val)
 
+            self.index.update(obj)
+
         elif isinstance(obj, Project):
             obj.trials.update(set(new.trials))
 
@@ -146,7 +267,7 @@ class LocalStorage:
         if filename is None:
             filename = self.target_file
 
-        new_storage = load_database(filename)
+        new_storage = load_database(filename, self.index.attributes, self.lazy)
 
         self._objects = new_storage._objects
         self._projects = new_storage._projects
@@ -155,6 +276,12 @@ class LocalStorage:
         self._project_names = new_storage._project_names
         self._group_names = new_storage._group_names
         self._trial_names = new_storage._trial_names
+        self.epoch = new_storage.epoch
+        self.journal = new_storage.journal
+        self.generation = new_storage.generation
+        self.stamp = new_storage.stamp
+        self.index = new_storage.index
+        self.file_format = new_storage.file_format
 
     def smart_reload(self, filename=None):
         """Updates current objects with new data"""
@@ -162,7 +289,7 @@ class LocalStorage:
         if filename is None:
             filename = self.target_file
 
-        new_storage = load_database(filename)
+        new_storage = load_database(filename, self.index.attributes, self.lazy)
         for uid, obj in new_storage.objects.items():
             old_obj = self.objects.get(uid)
 
@@ -171,63 +298,130 @@ class LocalStorage:
             else:
                 self._insert_object(obj)
 
+    def _load_document(self, item):
+        """Insert an object read from the storage file"""
+        documents = ()
 
-def load_database(json_name):
-    global _print_warning_once
-
-    if json_name is None:
-        return LocalStorage()
-
-    if not os.path.exists(json_name):
-        if json_name not in _print_warning_once:
-            warning(f'Local Storage was not found at {json_name}')
-            _print_warning_once.add(json_name)
+        if self.lazy:
+            if item.get('dtype') == 'trial':
+                self._insert_document(item, self._objects.get(item.get('project_id')))
 
-        return LocalStorage(target_file=json_name)
-
-    with open(json_name, 'r') as file:
-        objects = json.load(file)
+                if item.get('name') is not None:
+                    self._trial_names[item['name']] = item['uid']
+                return
 
-    db = dict()
-    projects = set()
-    project_names = dict()
-    groups = set()
-    group_names = dict()
-    trials = set()
-    trial_names = dict()
+            # keep the trials of the project as documents
+            if item.get('dtype') == 'project':
+                documents = item.get('trials', ())
+                item = dict(item, trials=[])
 
-    for item in objects:
         obj = from_json(item)
 
-        if obj.uid in db:
+        if obj.uid in self._objects:
             raise RuntimeError('Should be unreachable!')
 
-        db[obj.uid] = obj
-
         if isinstance(obj, Project):
-            projects.add(obj.uid)
-            if obj.name in project_names:
+            if obj.name in self._project_names:
                 error('Non unique project names are not supported')
 
-            if obj.name is not None:
-                project_names[obj.name] = obj.uid
+            self._insert_object(obj)
+            series = series_directory(self.target_file)
 
             for trial in obj.trials:
-                db[trial.uid] = trial
-                trials.add(trial.uid)
+                self._insert_object(bind_series(trial, series))
 
             for group in obj.groups:
-                db[group.uid] = group
-                groups.add(group.uid)
+                self._insert_object(group)
+
+            for document in documents:
+                self._insert_document(document, obj)
 
         elif isinstance(obj, Trial):
-            trials.add(obj.uid)
+            self._insert_object(bind_series(obj, series_directory(self.target_file)))
             if obj.name is not None:
-                trial_names[obj.name] = obj.uid
+                self._trial_names[obj.name] = obj.uid
 
-        elif isinstance(obj, TrialGroup):
-            groups.add(obj.uid)
-            if obj.name is not None:
-                group_names[obj.name] = obj.uid
+            project = self._objects.get(obj.project_id)
+            if project is not None:
+                project.trials.add(obj)
+
+        else:
+            self._insert_object(obj)
+
+    def _insert_document(self, document, project=None):
+        """Insert a trial without building it"""
+        uid = document['uid']
+
+        self._objects[uid] = document
+        self._trials.add(uid)
+        self.index.insert_document(document)
+
+        if project is not None:
+            project.trials.add(LazyTrial(uid, self._objects))
+
+
+def load_database(json_name, indexes=None, lazy=False, file_format=None):
+    """Load a storage file, the format of the file (``json`` or ``ndjson``) is detected from its first line.
+
+    `file_format` is the format used by the storage when it is committed, defaults to the format of the file
+    """
+    global _print_warning_once
+
+    if json_name is None:
+        return LocalStorage(index=StorageIndex(indexes), lazy=lazy, file_format=file_format or 'json')
+
+    if not os.path.exists(json_name):
+        if json_name not in _print_warning_once:
+            warning(f'Local Storage was not found at {json_name}')
+            _print_warning_once.add(json_name)
+
+        return LocalStorage(
+            target_file=json_name, journal=Journal(journal_path(json_name)), index=StorageIndex(indexes), lazy=lazy,
+            file_format=file_format or 'json')
+
+    def make_storage(epoch, generation, stamp, detected):
+        return LocalStorage(
+            target_file=json_name,
+            _objects=LazyObjects(series_directory(json_name)) if lazy else dict(),
+            epoch=epoch,
+            generation=generation,
+            stamp=stamp,
+            index=StorageIndex(indexes),
+            lazy=lazy,
+            file_format=file_format or detected)
+
+    with open(json_name, 'rb') as file:
+        stamp = file_stamp(fd=file.fileno())
+        first = file.readline()
+
+        try:
+            header = codec.loads(first)
+        except ValueError:
+            header = None
+
+        if isinstance(header, dict) and header.get('format') == 'ndjson':
+            # one document per line, only one document is decoded at a time
+            storage = make_storage(header.get('epoch'), header.get('generation'), stamp, 'ndjson')
+
+            for line in file:
+                if line.strip():
+                    storage._load_document(codec.loads(line))
+
+            objects = []
+        else:
+            objects = header if header is not None else codec.loads(first + file.read())
+
+            epoch = None
+            generation = None
+            if isinstance(objects, dict):
+                epoch = objects.get('epoch')
+                generation = objects.get('generation')
+                objects = objects['projects']
+
+            storage = make_storage(epoch, generation, stamp, 'json')
+
+    for item in objects:
+        storage._load_document(item)
 
-    return LocalStorage(json_name, db, projects, groups, trials, project_names, group_names, trial_names)
+    storage.journal = Journal(journal_path(json_name))
+    return storage.journal.replay(storage)
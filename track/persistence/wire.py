@@ -0,0 +1,241 @@
+"""Formats of the messages exchanged between the track server and its clients.
+
+    The format is negotiated when the client authenticates.
+    The client sends the formats it supports (``formats``), the server picks the first one it supports
+    and returns it in the ``format`` field of its reply. The authentication itself is always sent as json.
+    The format of a message is flagged in the header of its frame (see :mod:`track.persistence.framing`).
+
+    ``json``
+        default format, see :mod:`track.persistence.codec`
+
+    ``msgpack``
+        binary format, requires `msgpack`.
+        Each direction of a connection keeps a dictionary of the strings it has already sent:
+        the keys of a message, the procedure and the trial are sent once then replaced by their index.
+        Steps used as dictionary keys keep their type when json would turn them into strings.
+
+    The client selects its format with ``?format=msgpack`` (or ``log.backend.format``),
+    ``auto`` offers every format that is installed.
+"""
+import dataclasses
+import datetime
+import enum
+from uuid import UUID
+
+from track.persistence import codec
+from track.persistence.framing import FLAG_MSGPACK, FrameError
+
+
+class JsonWire:
+    """Messages encoded with the json codec"""
+    name = 'json'
+    flags = 0
+
+    def dumps(self, message) -> bytes:
+        return codec.dumps(message)
+
+    def loads(self, data):
+        return codec.loads(data)
+
+    def batch(self, request_id, calls) -> bytes:
+        # the calls are already encoded, splice them in the batch instead of encoding them again
+        return b''.join([
+            b'{"__rpc__":"batch","__id__":', str(request_id).encode('utf8'), b',"calls":[',
+            b','.join(calls),
+            b']}'
+        ])
+
+
+# values of these keys are replaced by an index like the keys themselves
+SYMBOL_VALUES = frozenset(('__rpc__', 'trial'))
+
+# msgpack extension holding a message that only json can encode
+JSON_MESSAGE = 1
+
+
+def _to_msgpack(obj):
+    """Convert the values msgpack does not know about, like orjson does"""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {field.name: getattr(obj, field.name) for field in dataclasses.fields(obj)}
+
+    if isinstance(obj, enum.Enum):
+        return obj.value
+
+    if isinstance(obj, UUID):
+        return str(obj)
+
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+
+    return codec._to_builtin(obj)
+
+
+def _from_ext(code, data):
+    if code == JSON_MESSAGE:
+        return codec.loads(data)
+
+    raise ValueError(f'(extension: {code}) is not supported')
+
+
+class MsgPackWire:
+    """Messages encoded with msgpack, a message is sent as ``[new strings, [key, value, ...]]``
+
+    The strings of a direction are numbered in the order they are sent,
+    messages must be decoded in the order they were encoded.
+
+    Parameters
+    ----------
+    max_symbols: int
+        number of strings remembered by each direction, the others are sent as is
+    """
+    name = 'msgpack'
+    flags = FLAG_MSGPACK
+
+    def __init__(self, max_symbols=4096):
+        import msgpack
+
+        self.msgpack = msgpack
+        self.max_symbols = max_symbols
+        self.packer = msgpack.Packer(default=_to_msgpack, use_bin_type=True)
+
+        # string -> index of the messages we send
+        self.symbols = dict()
+        # index -> string of the messages we receive
+        self.names = []
+
+    def _compact(self, message):
+        """Returns the strings that are new to the peer and the key value pairs of the message"""
+        symbols = self.symbols
+        new = []
+        pairs = []
+
+        def symbol(name):
+            index = symbols.get(name)
+
+            if index is None:
+                if len(symbols) >= self.max_symbols:
+                    return name
+
+                index = symbols[name] = len(symbols)
+                new.append(name)
+
+            return index
+
+        for key, value in message.items():
+            if key in SYMBOL_VALUES and isinstance(value, str):
+                value = symbol(value)
+
+            pairs.append(symbol(key))
+            pairs.append(value)
+
+        return new, pairs
+
+    def dumps(self, message) -> bytes:
+        if isinstance(message, dict) and all(isinstance(key, str) for key in message):
+            new, pairs = self._compact(message)
+
+            try:
+                return self.packer.pack([new, pairs])
+
+            except (TypeError, ValueError, OverflowError):
+                # the peer will never see those strings
+                for name in new:
+                    self.symbols.pop(name)
+
+        try:
+            return self.packer.pack(message)
+
+        # e.g. integers larger than 64 bits
+        except (TypeError, ValueError, OverflowError):
+            return self.packer.pack(self.msgpack.ExtType(JSON_MESSAGE, codec.dumps(message)))
+
+    def loads(self, data):
+        message = self.msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=_from_ext)
+        return self._expand(message)
+
+    def _expand(self, message):
+        if isinstance(message, list):
+            new, pairs = message
+            names = self.names
+            names.extend(new)
+
+            message = dict()
+            for i in range(0, len(pairs), 2):
+                key, value = pairs[i], pairs[i + 1]
+
+                if isinstance(key, int):
+                    key = names[key]
+
+                if key in SYMBOL_VALUES and isinstance(value, int):
+                    value = names[value]
+
+                message[key] = value
+
+        if isinstance(message, dict) and message.get('__rpc__') == 'batch':
+            message['calls'] = [self._expand(call) for call in message['calls']]
+
+        return message
+
+    def batch(self, request_id, calls) -> bytes:
+        # the calls are already encoded, they are appended to the array that holds them
+        packer = self.packer
+        return b''.join([
+            packer.pack_map_header(3),
+            packer.pack('__rpc__'), packer.pack('batch'),
+            packer.pack('__id__'), packer.pack(request_id),
+            packer.pack('calls'), packer.pack_array_header(len(calls)),
+            *calls
+        ])
+
+
+_wires = {
+    'msgpack': MsgPackWire,
+    'json': JsonWire
+}
+
+
+def is_available(name) -> bool:
+    if name == 'msgpack':
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    return name in _wires
+
+
+def offered_formats(name='auto'):
+    """Returns the formats a client offers to the server, by order of preference"""
+    if name == 'auto':
+        return [name for name in _wires if is_available(name)]
+
+    if name not in _wires:
+        raise ValueError(f'(format: {name}) is not supported, choose one of {list(_wires)}')
+
+    return [name, 'json'] if name != 'json' else ['json']
+
+
+def negotiate(formats):
+    """Returns the first of the formats offered by a client that the server supports"""
+    for name in formats:
+        if is_available(name):
+            return name
+
+    return 'json'
+
+
+def decode(wire, flags, data):
+    """Decode a frame with the wire of the connection, frames that are not flagged are json"""
+    if not flags & FLAG_MSGPACK:
+        return codec.loads(data)
+
+    if wire is None or not wire.flags & FLAG_MSGPACK:
+        raise FrameError('msgpack message received before it was negotiated')
+
+    return wire.loads(data)
+
+
+def make_wire(name='json'):
+    """Returns a new wire, msgpack wires hold the state of a single connection"""
+    return _wires[name]()
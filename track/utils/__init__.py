@@ -1,3 +1,4 @@
+import os
 import socket
 
 
@@ -25,6 +26,11 @@ def open_socket(add, port, backend=None):
 
 def listen_socket(add, port, backend=None):
     sckt = socket.socket(socket.AF_INET, socket.SOCK_STREAM, 0)
+
+    # a restarted server can listen while the connections of the previous one are closing
+    if os.name == 'posix':
+        sckt.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
     sckt.bind((add, port))
     sckt.listen()
 
@@ -1,4 +1,5 @@
 import socket
+import struct
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
@@ -11,8 +12,69 @@ from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
 
 
+# Each message is sent as a record prefixed by the size of its ciphertext
+# so messages that arrive back to back can be split before they are decrypted
+RECORD_HEADER = struct.Struct('>I')
+
+
+def _make_key():
+    """Returns a private key and the raw public key to send to the peer"""
+    private_key = X25519PrivateKey.generate()
+    pubkey = private_key.public_key().public_bytes(
+        encoding=Encoding.Raw,
+        format=PublicFormat.Raw
+    )
+    return private_key, pubkey
+
+
+def _make_cipher(private_key, peer_key):
+    """Derive the AES key from the public key of the peer"""
+    shared_key = private_key.exchange(X25519PublicKey.from_public_bytes(peer_key))
+
+    key = HKDF(
+        algorithm=hashes.SHA256(),
+        length=48,
+        salt=None,
+        info=b'handshake data',
+        backend=default_backend()
+    ).derive(shared_key)
+
+    return Cipher(
+        algorithms.AES(key[0:32]),
+        modes.CBC(key[32:]),
+        backend=default_backend()
+    )
+
+
+def encrypt_record(cipher, data) -> bytes:
+    """Encrypt `data` and prefix it with the size of the ciphertext"""
+    encrypt = cipher.encryptor()
+    padder = padding.PKCS7(128).padder()
+
+    padded_bytes = padder.update(data)
+    padded_bytes += padder.finalize()
+
+    encrypted = encrypt.update(padded_bytes)
+    encrypted += encrypt.finalize()
+
+    return RECORD_HEADER.pack(len(encrypted)) + encrypted
+
+
+def decrypt_record(cipher, encrypted) -> bytes:
+    """Decrypt the ciphertext of a record"""
+    decrypt = cipher.decryptor()
+    unpadder = padding.PKCS7(128).unpadder()
+
+    decrypted = decrypt.update(encrypted)
+    decrypted += decrypt.finalize()
+
+    unpadded = unpadder.update(decrypted)
+    unpadded += unpadder.finalize()
+    return unpadded
+
+
 class EncryptedSocket(socket.socket):
-    """Socket with an encrypted layer"""
+    """Blocking socket with an encrypted layer"""
 
     def __init__(self, *args, **kwargs):
         raise TypeError(f"{self.__class__.__name__} does not have a public constructor.")
@@ -29,8 +91,8 @@ class EncryptedSocket(socket.socket):
         sock.detach()
 
         self.cipher = None
-        self.message_size = None
-        self.message_received = None
+        self.received = bytearray()
+        self.decrypted = memoryview(b'')
         self.server_side = server_side
 
         # do the handshake if client
@@ -39,6 +101,19 @@ class EncryptedSocket(socket.socket):
 
         return self
 
+    def _recv_exactly(self, size):
+        data = bytearray()
+
+        while len(data) < size:
+            chunk = super().recv(size - len(data))
+
+            if not chunk:
+                raise ConnectionError('Connection closed by the peer')
+
+            data += chunk
+
+        return bytes(data)
+
     def _handshake(self):
         """Open a socket to address, port and initialize the encryption layer by exchanging a key using X25519.
         The key is used as an AES key throughout the communication.
@@ -47,36 +122,13 @@ class EncryptedSocket(socket.socket):
         -------
         return itself
         """
-        private_key = X25519PrivateKey.generate()
-        pubkey = private_key.public_key().public_bytes(
-            encoding=Encoding.Raw,
-            format=PublicFormat.Raw
-        )
+        private_key, pubkey = _make_key()
 
         # send client public key
-        super().send(pubkey)
+        super().sendall(pubkey)
 
         # receive server public Key
-        data = super().recv(32)
-
-        # from public key get shared_key
-        server_key = X25519PublicKey.from_public_bytes(data)
-        shared_key = private_key.exchange(server_key)
-
-        key = HKDF(
-            algorithm=hashes.SHA256(),
-            length=48,
-            salt=None,
-            info=b'handshake data',
-            backend=default_backend()
-        ).derive(shared_key)
-
-        self.cipher = Cipher(
-            algorithms.AES(key[0:32]),
-            modes.CBC(key[32:]),
-            backend=default_backend()
-        )
-
+        self.cipher = _make_cipher(private_key, self._recv_exactly(32))
         return self
 
     def accept(self):
@@ -90,35 +142,13 @@ class EncryptedSocket(socket.socket):
         clt, addr = super().accept()
 
         # Generate a private key
-        server_key = X25519PrivateKey.generate()
-
-        pubkey = server_key.public_key().public_bytes(
-            encoding=Encoding.Raw,
-            format=PublicFormat.Raw
-        )
-
-        data = clt.recv(32)   # Receive client public Key
-        clt.sendall(pubkey)    # send public key to client
-
-        public_key = X25519PublicKey.from_public_bytes(data)
-
-        # get Shared key
-        shared_key = server_key.exchange(public_key)
-        shared_key = HKDF(
-            algorithm=hashes.SHA256(),
-            length=48,
-            salt=None,
-            info=b'handshake data',
-            backend=default_backend()
-        ).derive(shared_key)
+        server_key, pubkey = _make_key()
 
         encrypted_socket = wrap_socket(clt, False, handshaked=True)
-        encrypted_socket.cipher = Cipher(
-            algorithms.AES(shared_key[0:32]),
-            modes.CBC(shared_key[32:]),
-            backend=default_backend()
-        )
+        data = encrypted_socket._recv_exactly(32)       # Receive client public Key
+        socket.socket.sendall(encrypted_socket, pubkey)  # send public key to client
 
+        encrypted_socket.cipher = _make_cipher(server_key, data)
         return encrypted_socket, addr
 
     def send(self, data: bytes, flags: int = 0) -> int:
@@ -126,58 +156,53 @@ class EncryptedSocket(socket.socket):
         return len(data)
 
     def sendall(self, data, flags: int = 0):
-        if isinstance(data, bytearray):
+        if isinstance(data, (bytearray, memoryview)):
             data = bytes(data)
 
-        encrypt = self.cipher.encryptor()
-        padder = padding.PKCS7(128).padder()
-
-        padded_bytes = padder.update(data)
-        padded_bytes += padder.finalize()
-
-        encrypted = encrypt.update(padded_bytes)
-        encrypted += encrypt.finalize()
-
-        super().sendall(encrypted, flags)
+        super().sendall(encrypt_record(self.cipher, data), flags)
         return len(data)
 
-    def readsize(self):
-        decrypt = self.cipher.decryptor()
-        unpadder = padding.PKCS7(128).unpadder()
+    def _next_record(self):
+        """Returns the ciphertext of the next record if it was entirely received"""
+        if len(self.received) < RECORD_HEADER.size:
+            return None
 
-        size = super().recv(4)
-        return size, (decrypt, unpadder)
+        size, = RECORD_HEADER.unpack_from(self.received)
+        end = RECORD_HEADER.size + size
 
-    def recv(self, buffersize, flags: int = 0, context=None):
-        data = super().recv(buffersize, flags)
+        if len(self.received) < end:
+            return None
 
-        # no data nothing to decrypt
-        if not data:
-            return data
+        record = bytes(self.received[RECORD_HEADER.size:end])
+        del self.received[:end]
+        return record
 
-        # ----
-        if context is None:
-            decrypt = self.cipher.decryptor()
-            unpadder = padding.PKCS7(128).unpadder()
-        else:
-            decrypt, unpadder = context
-        # ----
+    def recv(self, buffersize, flags: int = 0):
+        """Returns at most `buffersize` bytes of the decrypted messages"""
+        while not self.decrypted:
+            record = self._next_record()
 
-        decrypted = decrypt.update(data)
+            if record is not None:
+                self.decrypted = memoryview(decrypt_record(self.cipher, record))
+                continue
 
-        while True:
-            try:
-                decrypted += decrypt.finalize()
-                break
+            data = super().recv(max(buffersize, 64 * 1024), flags)
 
-            except ValueError:
-                data = super().recv(buffersize, flags)
-                decrypted += decrypt.update(data)
+            # no data nothing to decrypt
+            if not data:
+                return data
 
-        unpadded = unpadder.update(decrypted)
-        unpadded += unpadder.finalize()
+            self.received += data
 
-        return unpadded
+        data = bytes(self.decrypted[:buffersize])
+        self.decrypted = self.decrypted[len(data):]
+        return data
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        """Decrypt the next message into `buffer`, the bytes that do not fit are returned by the next calls"""
+        data = self.recv(nbytes or len(buffer), flags)
+        buffer[:len(data)] = data
+        return len(data)
 
 
 def wrap_socket(sock, server_side=False, handshaked=False):
@@ -186,3 +211,58 @@ def wrap_socket(sock, server_side=False, handshaked=False):
         server_side=server_side,
         handshaked=handshaked
     )
+
+
+class EncryptedStream:
+    """Encrypted layer on top of the `StreamReader` and `StreamWriter` of an asyncio server.
+    It is used as both the reader and the writer of the connection"""
+
+    def __init__(self, reader, writer, cipher):
+        self.reader = reader
+        self.writer = writer
+        self.cipher = cipher
+        self.decrypted = bytearray()
+
+    async def readexactly(self, n):
+        while len(self.decrypted) < n:
+            header = await self.reader.readexactly(RECORD_HEADER.size)
+            size, = RECORD_HEADER.unpack(header)
+            self.decrypted += decrypt_record(self.cipher, await self.reader.readexactly(size))
+
+        data = bytes(self.decrypted[:n])
+        del self.decrypted[:n]
+        return data
+
+    def write(self, data):
+        self.writer.write(encrypt_record(self.cipher, bytes(data)))
+
+    def writelines(self, data):
+        self.write(b''.join(data))
+
+    async def drain(self):
+        await self.writer.drain()
+
+    def close(self):
+        self.writer.close()
+
+    async def wait_closed(self):
+        await self.writer.wait_closed()
+
+    def get_extra_info(self, name, default=None):
+        return self.writer.get_extra_info(name, default)
+
+
+async def accept_stream(reader, writer):
+    """Initialize the encryption layer of a client connected to an asyncio server
+
+    Returns
+    -------
+    returns the `EncryptedStream` of the client
+    """
+    server_key, pubkey = _make_key()
+
+    data = await reader.readexactly(32)     # Receive client public Key
+    writer.write(pubkey)                    # send public key to client
+    await writer.drain()
+
+    return EncryptedStream(reader, writer, _make_cipher(server_key, data))